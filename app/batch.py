@@ -0,0 +1,294 @@
+"""
+Procesamiento por lotes: `POST /batch/normalize` y `POST /batch/geocode`.
+
+Un lote selecciona direcciones por lista de IDs o por filtros y las recorre
+por bloques de BATCH_CHUNK_SIZE en orden de ID. Cada bloque es una etapa
+vectorizada: una lectura, parseo por lotes (reglas + IA por lotes) o
+geocodificación concurrente bajo el límite de tasa, y una única escritura
+masiva (UPDATE ... FROM VALUES) junto con el progreso del lote.
+
+Los lotes `reprocess` (`python -m app.reprocess`) solo seleccionan filas
+producidas por versiones anteriores del parser o del geocodificador, y no
+vuelven a geocodificar las que conservan la misma dirección normalizada.
+
+Los lotes se ejecutan en los workers (tarea `run_batch`). El último ID
+procesado se guarda como punto de control: si el worker muere, la tarea
+vuelve a la cola y el lote se reanuda donde quedó.
+"""
+import os
+import time
+import uuid
+from datetime import datetime, timezone
+
+from sqlalchemy import func, or_, select
+from sqlalchemy.orm import Session
+
+from . import crud, dedup, events, jobs, metrics, models, processing, schemas
+
+BATCH_CHUNK_SIZE = int(os.getenv("BATCH_CHUNK_SIZE", "1000"))
+
+# Campos que se borran cuando cambia la dirección normalizada y hay que volver a
+# geocodificar (sin `geocoder_version`, la fila vuelve a quedar pendiente de geocodificar)
+GEOCODE_FIELDS = ("latitude", "longitude", "geohash", "suggested_address", "postal_code", "geocoder_version")
+GEOCODE_RESET = {**{field: None for field in GEOCODE_FIELDS}, "geocode_failed": False}
+
+
+def selection_from_request(request: schemas.BatchRequest) -> dict:
+    """Selección serializable (JSONB) a partir de la petición."""
+    return request.model_dump(mode="json", exclude_none=True)
+
+
+def build_selection_filters(kind: models.BatchKind, selection: dict) -> list:
+    """Condiciones SQL de la selección de un lote."""
+    filters = crud.build_address_filters(
+        status=models.AddressStatus(selection["status"]) if "status" in selection else None,
+        neighborhood=selection.get("neighborhood"),
+        postal_code=selection.get("postal_code"),
+        created_from=datetime.fromisoformat(selection["created_from"]) if "created_from" in selection else None,
+        created_to=datetime.fromisoformat(selection["created_to"]) if "created_to" in selection else None,
+    )
+    if "address_ids" in selection:
+        filters.append(models.Address.id.in_([uuid.UUID(value) for value in selection["address_ids"]]))
+    # Las variantes reciben el resultado de su canónica
+    filters.append(models.Address.canonical_id.is_(None))
+    if kind == models.BatchKind.GEOCODE:
+        filters.append(models.Address.normalized_address.is_not(None))
+    if kind == models.BatchKind.REPROCESS:
+        filters.append(models.Address.status != models.AddressStatus.PENDING)
+        filters.append(or_(parser_is_stale(), geocoder_is_stale()))
+    return filters
+
+
+def parser_is_stale():
+    return models.Address.parser_version.is_distinct_from(processing.PARSER_VERSION)
+
+
+def geocoder_is_stale():
+    return models.Address.normalized_address.is_not(None) & models.Address.geocoder_version.is_distinct_from(
+        processing.GEOCODER_VERSION
+    )
+
+
+def create_batch(
+    db: Session, kind: models.BatchKind, request: schemas.BatchRequest, enqueue: bool = True
+) -> models.Batch:
+    """Registra el lote con el total de direcciones seleccionadas y, por defecto, lo encola."""
+    selection = selection_from_request(request)
+    total = db.execute(
+        select(func.count()).select_from(models.Address).where(*build_selection_filters(kind, selection))
+    ).scalar_one()
+    db_batch = crud.create_batch(db, kind=kind, selection=selection, total=total)
+    if enqueue:
+        jobs.enqueue_batch(db, db_batch.id)
+    print(f"[BATCH] Lote {db_batch.id} ({kind.value}) creado con {total} direcciones.")
+    return db_batch
+
+
+def describe_batch(db_batch: models.Batch) -> schemas.Batch:
+    """Datos del lote con su rendimiento en filas por segundo."""
+    result = schemas.Batch.model_validate(db_batch)
+    if db_batch.started_at is not None:
+        end = db_batch.finished_at or datetime.now(timezone.utc)
+        elapsed = (end - db_batch.started_at).total_seconds()
+        if elapsed > 0:
+            result.rows_per_second = round(db_batch.processed / elapsed, 2)
+    return result
+
+
+def batch_progress(db: Session, batch_id: uuid.UUID) -> dict | None:
+    """Progreso del lote para los eventos SSE; `finished` cuando terminó o falló."""
+    db_batch = db.get(models.Batch, batch_id, populate_existing=True)
+    if db_batch is None:
+        return None
+    progress = describe_batch(db_batch).model_dump(mode="json")
+    progress["finished"] = db_batch.status in (models.BatchStatus.COMPLETED, models.BatchStatus.FAILED)
+    return progress
+
+
+def _normalize_rows(rows) -> tuple[list[dict], list[uuid.UUID]]:
+    """Parsea un bloque. Devuelve las filas a escribir y los IDs fallidos."""
+    parsed = processing.parse_addresses([row.original_address for row in rows])
+    updates, failed = [], []
+    for row, parsed_data in zip(rows, parsed):
+        if not parsed_data:
+            failed.append(row.id)
+            continue
+        values = processing.parsed_values(parsed_data)
+        # Si la dirección normalizada no cambia, la geocodificación sigue siendo válida
+        if values["normalized_address"] == row.normalized_address:
+            values["status"] = row.status
+        else:
+            values.update(GEOCODE_RESET)
+        updates.append({"id": row.id, **values})
+    return updates, failed
+
+
+def _geocode(normalized: dict) -> tuple[dict, list[uuid.UUID]]:
+    """
+    Geocodifica {id: dirección normalizada}, cada dirección distinta una sola
+    vez. Devuelve {id: campos a escribir} y los IDs fallidos.
+    """
+    unique = list(dict.fromkeys(normalized.values()))
+    results = dict(zip(unique, processing.geocode_addresses(unique)))
+    values, failed = {}, []
+    for address_id, address in normalized.items():
+        geocoded = results[address]
+        if geocoded is processing.GEOCODE_UNAVAILABLE:
+            # Error transitorio: sin `geocoder_version`, un reproceso lo vuelve a intentar
+            failed.append(address_id)
+        elif geocoded:
+            values[address_id] = processing.geocoded_values(geocoded)
+        else:
+            # Sin resultados: se registra el intento con esta versión del geocodificador
+            values[address_id] = {"geocoder_version": processing.GEOCODER_VERSION, "geocode_failed": True}
+            failed.append(address_id)
+    return values, failed
+
+
+def _geocode_rows(rows) -> tuple[list[dict], list[uuid.UUID]]:
+    """Geocodifica un bloque."""
+    values, failed = _geocode({row.id: row.normalized_address for row in rows})
+    return [{"id": address_id, **fields} for address_id, fields in values.items()], failed
+
+
+def _reprocess_rows(rows) -> tuple[list[dict], list[uuid.UUID]]:
+    """
+    Reprocesa un bloque de filas obsoletas. Las de parser obsoleto se vuelven
+    a parsear; solo se geocodifican las que cambiaron de dirección normalizada
+    o cuyo geocodificador es obsoleto.
+    """
+    updates: dict = {}
+    to_geocode: dict = {}
+    failed = []
+
+    parser_stale = [row for row in rows if row.parser_version != processing.PARSER_VERSION]
+    parsed = processing.parse_addresses([row.original_address for row in parser_stale])
+    for row, parsed_data in zip(parser_stale, parsed):
+        if not parsed_data:
+            failed.append(row.id)
+            continue
+        values = processing.parsed_values(parsed_data)
+        if values["normalized_address"] == row.normalized_address:
+            # Misma entrada para el geocodificador: el resultado anterior sigue siendo válido
+            values["status"] = row.status
+            if row.geocoder_version != processing.GEOCODER_VERSION:
+                to_geocode[row.id] = row.normalized_address
+        else:
+            values.update(GEOCODE_RESET)
+            to_geocode[row.id] = values["normalized_address"]
+        updates[row.id] = values
+
+    for row in rows:
+        if (
+            row.parser_version == processing.PARSER_VERSION
+            and row.normalized_address is not None
+            and row.geocoder_version != processing.GEOCODER_VERSION
+        ):
+            to_geocode[row.id] = row.normalized_address
+
+    geocoded, geocode_failed = _geocode(to_geocode)
+    failed.extend(geocode_failed)
+    for address_id, values in geocoded.items():
+        updates.setdefault(address_id, {}).update(values)
+    return [{"id": address_id, **values} for address_id, values in updates.items()], failed
+
+
+def run_batch(db: Session, batch_id: uuid.UUID, job_id: int | None = None, chunk_size: int = BATCH_CHUNK_SIZE):
+    """Ejecuta (o reanuda desde su punto de control) un lote."""
+    db_batch = crud.get_batch(db, batch_id)
+    if db_batch is None:
+        print(f"[BATCH] ERROR: No se encontró el lote {batch_id}")
+        return
+    if db_batch.status in (models.BatchStatus.COMPLETED, models.BatchStatus.FAILED):
+        return
+
+    kind = db_batch.kind
+    if kind == models.BatchKind.NORMALIZE:
+        columns = (models.Address.id, models.Address.original_address, models.Address.normalized_address, models.Address.status)
+        stage = _normalize_rows
+    elif kind == models.BatchKind.GEOCODE:
+        columns = (models.Address.id, models.Address.normalized_address)
+        stage = _geocode_rows
+    else:
+        columns = (
+            models.Address.id,
+            models.Address.original_address,
+            models.Address.normalized_address,
+            models.Address.status,
+            models.Address.parser_version,
+            models.Address.geocoder_version,
+        )
+        stage = _reprocess_rows
+
+    filters = build_selection_filters(kind, db_batch.selection)
+    last_id = db_batch.last_address_id
+    if db_batch.started_at is None:
+        db_batch.started_at = func.now()
+    db_batch.status = models.BatchStatus.RUNNING
+    db.commit()
+
+    print(f"[BATCH] Lote {batch_id} ({kind.value}) iniciado desde {last_id or 'el principio'}")
+    start = time.monotonic()
+    processed = 0
+    try:
+        while True:
+            query = select(*columns).where(*filters)
+            if last_id is not None:
+                query = query.where(models.Address.id > last_id)
+            with metrics.track("db_read"):
+                rows = db.execute(query.order_by(models.Address.id).limit(chunk_size)).all()
+            if not rows:
+                break
+
+            with metrics.track(f"batch_{kind.value}", items=len(rows)):
+                updates, failed = stage(rows)
+            last_id = rows[-1].id
+            # Una fila puede fallar en el parseo y en la geocodificación; las que no
+            # cambiaron ni fallaron no cuentan como correctas
+            failed = list(dict.fromkeys(failed))
+            succeeded = {row["id"] for row in updates} - set(failed)
+
+            # Escritura del bloque, progreso, eventos y heartbeat en una sola transacción
+            with metrics.track("db_write", items=len(updates)):
+                crud.bulk_update_address_rows(db, updates)
+                dedup.propagate_results(db, [row["id"] for row in updates], commit=False)
+                crud.update_batch_progress(
+                    db, batch_id, last_id, processed=len(rows), succeeded=len(succeeded), failed=len(failed)
+                )
+                events.publish_address_changes(
+                    db, [row["id"] for row in updates] + failed, batch_id=batch_id, failed_ids=failed
+                )
+                events.publish_batch_progress(db, batch_id)
+                if job_id is not None:
+                    jobs.extend_lock(db, job_id)
+                db.commit()
+
+            processed += len(rows)
+            rate = processed / max(time.monotonic() - start, 1e-6)
+            print(f"[BATCH] Lote {batch_id}: {processed} direcciones ({rate:.0f}/s)")
+    except Exception as e:
+        db.rollback()
+        db_batch = crud.get_batch(db, batch_id)
+        db_batch.error = f"{type(e).__name__}: {e}"
+        db.commit()
+        raise
+
+    db_batch = crud.get_batch(db, batch_id)
+    db_batch.status = models.BatchStatus.COMPLETED
+    db_batch.error = None
+    db_batch.finished_at = func.now()
+    events.publish_batch_progress(db, batch_id)
+    db.commit()
+    print(f"[BATCH] Lote {batch_id} terminado: {db_batch.succeeded} correctas, {db_batch.failed} fallidas.")
+
+
+def mark_failed(db: Session, batch_id: uuid.UUID, error: str):
+    """Marca el lote como fallido cuando su tarea agota los reintentos."""
+    db_batch = crud.get_batch(db, batch_id)
+    if db_batch is None:
+        return
+    db_batch.status = models.BatchStatus.FAILED
+    db_batch.error = error[:2000]
+    db_batch.finished_at = func.now()
+    events.publish_batch_progress(db, batch_id)
+    db.commit()
@@ -0,0 +1,243 @@
+"""
+Alta masiva de direcciones por streaming (`POST /addresses/bulk`).
+
+El cuerpo es NDJSON (una fila por línea) o un arreglo JSON, de cualquier
+tamaño. Cada fila es un objeto `{"original_address": ..., "external_id": ...}`
+(`external_id` es opcional y se devuelve tal cual para que el cliente
+relacione los resultados) o directamente el texto de la dirección.
+
+El cuerpo se lee a medida que llega y las filas se insertan por bloques de
+BULK_BATCH_SIZE con el mismo camino que las subidas de archivos (una subida
+`bulk` registra el progreso). En cuanto un bloque queda guardado se responde,
+en NDJSON y en el mismo orden, una línea por fila:
+
+    {"line": 1, "external_id": "a1", "id": "...", "status": "created"}
+    {"line": 2, "external_id": "a2", "id": "...", "status": "duplicate"}
+    {"line": 3, "external_id": null, "status": "error", "error": "..."}
+
+La memoria usada depende del tamaño del bloque, no del cuerpo.
+"""
+import codecs
+import json
+import os
+import time
+from dataclasses import dataclass
+
+from sqlalchemy.orm import Session
+from starlette.responses import StreamingResponse
+
+from . import crud, events, ingest, models
+from .database import AsyncSessionLocal
+
+BULK_BATCH_SIZE = int(os.getenv("BULK_BATCH_SIZE", "1000"))
+# Tiempo máximo que una fila espera a que se complete su bloque (cuerpos que llegan despacio)
+BULK_MAX_DELAY = float(os.getenv("BULK_MAX_DELAY", "1"))
+# Tamaño máximo de una fila; una más larga se rechaza sin acumularla en memoria
+BULK_MAX_ROW_BYTES = 64 * 1024
+
+NDJSON_TYPES = ("application/x-ndjson", "application/jsonl", "application/json-seq")
+JSON_TYPES = ("application/json",)
+
+
+@dataclass
+class BulkRow:
+    line: int
+    original_address: str | None = None
+    external_id: str | int | None = None
+    error: str | None = None
+
+
+def parse_row(line: int, value) -> BulkRow:
+    """Valida una fila ya decodificada de JSON."""
+    if isinstance(value, str):
+        value = {"original_address": value}
+    if not isinstance(value, dict):
+        return BulkRow(line, error="La fila debe ser un objeto o un texto")
+
+    external_id = value.get("external_id")
+    if isinstance(external_id, bool) or (external_id is not None and not isinstance(external_id, (str, int))):
+        return BulkRow(line, error="'external_id' debe ser un texto o un entero")
+    address = value.get("original_address", value.get("address"))
+    if not isinstance(address, str) or not address.strip():
+        return BulkRow(line, external_id=external_id, error="Falta 'original_address'")
+    address = address.strip()
+    if models.address_too_long(address):
+        return BulkRow(line, external_id=external_id, error=f"La dirección supera los {models.MAX_ADDRESS_BYTES} bytes")
+    return BulkRow(line, original_address=address, external_id=external_id)
+
+
+async def iter_ndjson(chunks):
+    """Filas de un cuerpo NDJSON; las líneas vacías se ignoran pero cuentan."""
+    buffer = b""
+    line = 0
+    skipping = False  # Descartando el resto de una línea demasiado larga
+    async for chunk in chunks:
+        buffer += chunk
+        *lines, buffer = buffer.split(b"\n")
+        for raw in lines:
+            line += 1
+            if skipping:
+                skipping = False
+                continue
+            if raw.strip():
+                yield _decode_line(line, raw)
+        if len(buffer) > BULK_MAX_ROW_BYTES:
+            if not skipping:
+                yield BulkRow(line + 1, error=f"La fila supera los {BULK_MAX_ROW_BYTES} bytes")
+            skipping = True
+            buffer = b""
+    if buffer.strip() and not skipping:
+        yield _decode_line(line + 1, buffer)
+
+
+def _decode_line(line: int, raw: bytes) -> BulkRow:
+    try:
+        return parse_row(line, json.loads(raw))
+    except ValueError as e:
+        return BulkRow(line, error=f"JSON inválido: {e}")
+
+
+async def iter_json_array(chunks):
+    """
+    Elementos de un arreglo JSON a medida que llegan. Cada elemento se
+    decodifica con `raw_decode` sobre el texto pendiente, así que solo se
+    guarda en memoria el elemento incompleto. `line` es la posición en el
+    arreglo. Si el arreglo está mal formado se emite una fila con el error y
+    se deja de leer (las filas anteriores sí se insertan).
+    """
+    decoder = json.JSONDecoder()
+    text_decoder = codecs.getincrementaldecoder("utf-8")()
+    buffer = ""
+    started = False
+    expect_value = True  # Tras '[' o ',' viene un elemento; tras un elemento, ',' o ']'
+    position = 0
+    finished = False
+
+    async def feed():
+        nonlocal buffer
+        async for chunk in chunks:
+            buffer += text_decoder.decode(chunk)
+            yield False
+        buffer += text_decoder.decode(b"", final=True)
+        yield True
+
+    async for final in feed():
+        index = 0
+        while not finished:
+            while index < len(buffer) and buffer[index].isspace():
+                index += 1
+            if index == len(buffer):
+                break
+            char = buffer[index]
+            if not started:
+                if char != "[":
+                    yield BulkRow(1, error="El cuerpo debe ser un arreglo JSON")
+                    return
+                started = True
+                index += 1
+            elif char == "]" and (expect_value is False or position == 0):
+                finished = True
+                index += 1
+            elif not expect_value:
+                if char != ",":
+                    yield BulkRow(position + 1, error=f"Se esperaba ',' o ']' después del elemento {position}")
+                    return
+                expect_value = True
+                index += 1
+            else:
+                try:
+                    value, end = decoder.raw_decode(buffer, index)
+                except ValueError as e:
+                    if final or len(buffer) - index > BULK_MAX_ROW_BYTES:
+                        yield BulkRow(position + 1, error=f"JSON inválido: {e}")
+                        return
+                    break  # Elemento incompleto: faltan datos
+                position += 1
+                yield parse_row(position, value)
+                expect_value = False
+                index = end
+        buffer = buffer[index:]
+        if finished and buffer.strip():
+            yield BulkRow(position + 1, error="Datos después del final del arreglo")
+            return
+        if final and not finished:
+            yield BulkRow(position + 1, error="El arreglo JSON está incompleto")
+
+
+def ingest_rows(db: Session, upload: models.Upload, rows: list[BulkRow]) -> list[dict]:
+    """Inserta y encola un bloque de filas. Devuelve el resultado de cada una, en orden."""
+    addresses = [row.original_address for row in rows if row.error is None]
+    created = ingest.ingest_chunk(db, upload, len(rows), addresses)
+    existing = crud.get_address_ids_by_original_address(
+        db, [address for address in set(addresses) if address not in created]
+    )
+
+    results = []
+    reported = set()  # Una dirección repetida dentro del bloque solo se crea una vez
+    for row in rows:
+        result = {"line": row.line, "external_id": row.external_id}
+        if row.error is not None:
+            result.update(status="error", error=row.error)
+        elif row.original_address in created and row.original_address not in reported:
+            result.update(id=str(created[row.original_address]), status="created")
+        else:
+            address_id = created.get(row.original_address) or existing.get(row.original_address)
+            result.update(id=str(address_id) if address_id else None, status="duplicate")
+        reported.add(row.original_address)
+        results.append(result)
+    return results
+
+
+def _ndjson(results: list[dict]) -> bytes:
+    return "".join(json.dumps(result, separators=(",", ":")) + "\n" for result in results).encode()
+
+
+async def stream_results(request, upload_id, content_type: str):
+    """
+    Lee las filas del cuerpo, las inserta por bloques y va respondiendo los
+    resultados. Usa una sesión propia: la respuesta dura más que la petición.
+    """
+    rows_iter = iter_json_array if content_type in JSON_TYPES else iter_ndjson
+    async with AsyncSessionLocal() as db:
+        upload = await db.get(models.Upload, upload_id)
+        batch = []
+        batch_started = 0.0
+        try:
+            async for row in rows_iter(request.stream()):
+                if not batch:
+                    batch_started = time.monotonic()
+                batch.append(row)
+                if len(batch) >= BULK_BATCH_SIZE or time.monotonic() - batch_started >= BULK_MAX_DELAY:
+                    yield _ndjson(await db.run_sync(ingest_rows, upload, batch))
+                    batch = []
+            if batch:
+                yield _ndjson(await db.run_sync(ingest_rows, upload, batch))
+        except Exception as e:
+            # Los bloques anteriores ya quedaron guardados; se informa dónde se cortó
+            print(f"[BULK] Error en la subida {upload.id}: {e}")
+            await db.rollback()
+            await db.run_sync(crud.finish_upload, upload, models.UploadStatus.FAILED, error=str(e))
+            await db.run_sync(events.publish_upload_progress, upload.id)
+            yield _ndjson([{"status": "error", "error": str(e)}])
+            return
+
+        upload = await db.run_sync(crud.finish_upload, upload, models.UploadStatus.COMPLETED)
+        await db.run_sync(events.publish_upload_progress, upload.id)
+        print(
+            f"[BULK] Subida {upload.id}: {upload.rows_found} filas, "
+            f"{upload.new_addresses_created} nuevas, {upload.addresses_skipped} omitidas."
+        )
+
+
+class BulkStreamingResponse(StreamingResponse):
+    """
+    StreamingResponse que no escucha la desconexión del cliente en paralelo:
+    el generador lee el cuerpo de la petición mientras responde y ambos
+    competirían por los mensajes de `receive`. Si el cliente se desconecta,
+    la lectura del cuerpo falla y el stream termina.
+    """
+
+    async def __call__(self, scope, receive, send):
+        await self.stream_response(send)
+        if self.background is not None:
+            await self.background()
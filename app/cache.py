@@ -0,0 +1,322 @@
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+import unicodedata
+import weakref
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import delete, select
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+
+from . import models
+from .database import SessionLocal
+
+# Caché de dos niveles para resultados de servicios externos:
+#   1. LRU acotado en memoria del proceso.
+#   2. Almacenamiento persistente: tabla `cache_entries` de PostgreSQL por
+#      defecto, o Redis si REDIS_URL está configurada y el paquete está instalado.
+# Los valores None se guardan como caché negativa ("sin resultados"), con su propio TTL.
+
+# Marca para distinguir "no está en caché" de un valor None cacheado
+MISSING = object()
+
+_PUNCTUATION_SPACING_RE = re.compile(r"\s*([#,\-])\s*")
+_PUNCTUATION_SPACING = {"#": " # ", ",": ", ", "-": "-"}
+
+
+def canonicalize(text: str) -> str:
+    """
+    Forma canónica de un texto para usarlo como clave: sin tildes, en
+    minúsculas, con espacios colapsados y puntuación homogénea.
+    """
+    folded = unicodedata.normalize("NFKD", text)
+    folded = "".join(ch for ch in folded if not unicodedata.combining(ch))
+    folded = " ".join(folded.lower().split())
+    folded = _PUNCTUATION_SPACING_RE.sub(lambda m: _PUNCTUATION_SPACING[m.group(1)], folded)
+    return " ".join(folded.split()).strip(" ,.")
+
+
+_NON_ALNUM_RE = re.compile(r"[^0-9a-z]+")
+
+
+def fold_text(text: str) -> str:
+    """
+    Forma más agresiva que `canonicalize`: además elimina toda la puntuación.
+    Se usa para textos en bruto escritos por usuarios.
+    """
+    folded = unicodedata.normalize("NFKD", text)
+    folded = "".join(ch for ch in folded if not unicodedata.combining(ch))
+    return " ".join(_NON_ALNUM_RE.sub(" ", folded.lower()).split())
+
+
+def hash_key(key: str) -> str:
+    """Hash estable de una clave, para guardarla con longitud fija."""
+    return hashlib.sha256(key.encode("utf-8")).hexdigest()
+
+
+class LRUCache:
+    """Caché LRU en memoria, acotada y segura entre hilos, con expiración por entrada."""
+
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self._data: OrderedDict[str, tuple[float, object]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return MISSING
+            expires_at, value = entry
+            if expires_at < time.monotonic():
+                del self._data[key]
+                return MISSING
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key: str, value, ttl: float):
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            self._data[key] = (time.monotonic() + ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+class PostgresCacheBackend:
+    """Almacenamiento persistente en la tabla `cache_entries`."""
+
+    def __init__(self, namespace: str):
+        self.namespace = namespace
+
+    def get(self, key: str):
+        with SessionLocal() as db:
+            entry = db.get(models.CacheEntry, (self.namespace, hash_key(key)))
+            if entry is None or entry.expires_at <= datetime.now(timezone.utc):
+                return MISSING
+            return entry.value
+
+    def get_many(self, keys: list[str]) -> dict:
+        """Valores vigentes de varias claves en una sola consulta; las ausentes no aparecen."""
+        hashed = {hash_key(key): key for key in keys}
+        if not hashed:
+            return {}
+        with SessionLocal() as db:
+            rows = db.execute(
+                select(models.CacheEntry.key, models.CacheEntry.value).where(
+                    models.CacheEntry.namespace == self.namespace,
+                    models.CacheEntry.key.in_(list(hashed)),
+                    models.CacheEntry.expires_at > datetime.now(timezone.utc),
+                )
+            ).all()
+        return {hashed[row.key]: row.value for row in rows}
+
+    def set(self, key: str, value, ttl: float):
+        expires_at = datetime.now(timezone.utc) + timedelta(seconds=ttl)
+        stmt = pg_insert(models.CacheEntry).values(
+            namespace=self.namespace, key=hash_key(key), value=value, expires_at=expires_at
+        )
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[models.CacheEntry.namespace, models.CacheEntry.key],
+            set_={"value": stmt.excluded.value, "expires_at": stmt.excluded.expires_at},
+        )
+        with SessionLocal() as db:
+            db.execute(stmt)
+            db.commit()
+
+    def purge_expired(self, chunk_size: int = 10000) -> int:
+        """Elimina las entradas vencidas de este espacio de nombres, por bloques."""
+        total = 0
+        with SessionLocal() as db:
+            while True:
+                expired = (
+                    select(models.CacheEntry.key)
+                    .where(
+                        models.CacheEntry.namespace == self.namespace,
+                        models.CacheEntry.expires_at <= datetime.now(timezone.utc),
+                    )
+                    .limit(chunk_size)
+                )
+                deleted = db.execute(
+                    delete(models.CacheEntry).where(
+                        models.CacheEntry.namespace == self.namespace,
+                        models.CacheEntry.key.in_(expired.scalar_subquery()),
+                    )
+                ).rowcount
+                db.commit()
+                total += deleted
+                if deleted < chunk_size:
+                    return total
+
+
+class RedisCacheBackend:
+    """Almacenamiento persistente en Redis (opcional)."""
+
+    def __init__(self, namespace: str, url: str):
+        import redis
+
+        self.namespace = namespace
+        self._client = redis.Redis.from_url(url)
+
+    def _redis_key(self, key: str) -> str:
+        return f"geofull:{self.namespace}:{hash_key(key)}"
+
+    def get(self, key: str):
+        raw = self._client.get(self._redis_key(key))
+        if raw is None:
+            return MISSING
+        return json.loads(raw)
+
+    def get_many(self, keys: list[str]) -> dict:
+        if not keys:
+            return {}
+        raws = self._client.mget([self._redis_key(key) for key in keys])
+        return {key: json.loads(raw) for key, raw in zip(keys, raws) if raw is not None}
+
+    def set(self, key: str, value, ttl: float):
+        self._client.set(self._redis_key(key), json.dumps(value), ex=int(ttl))
+
+    def purge_expired(self) -> int:
+        # Redis expira las claves por sí mismo
+        return 0
+
+
+def get_persistent_backend(namespace: str):
+    """Usa Redis si REDIS_URL está configurada y disponible; si no, PostgreSQL."""
+    redis_url = os.getenv("REDIS_URL")
+    if redis_url:
+        try:
+            return RedisCacheBackend(namespace, redis_url)
+        except ImportError:
+            print("ADVERTENCIA: REDIS_URL está configurada pero el paquete 'redis' no está instalado. Se usa PostgreSQL.")
+    return PostgresCacheBackend(namespace)
+
+
+class TwoTierCache:
+    """
+    Caché de dos niveles (memoria + persistente) con caché negativa y
+    contadores de aciertos/fallos.
+    """
+
+    _instances = weakref.WeakSet()
+
+    def __init__(self, namespace: str, maxsize: int, ttl: float, negative_ttl: float, backend=None):
+        self.namespace = namespace
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.memory = LRUCache(maxsize)
+        self._backend = backend
+        self._stats = {"memory_hits": 0, "persistent_hits": 0, "misses": 0, "negative_hits": 0, "errors": 0}
+        self._stats_lock = threading.Lock()
+        TwoTierCache._instances.add(self)
+
+    @property
+    def backend(self):
+        """Almacenamiento persistente, creado en el primer uso (no al importar el módulo)."""
+        if self._backend is None:
+            self._backend = get_persistent_backend(self.namespace)
+        return self._backend
+
+    @classmethod
+    def instances(cls) -> list["TwoTierCache"]:
+        """Cachés creadas en el proceso (para las métricas)."""
+        return list(cls._instances)
+
+    def _count(self, name: str):
+        with self._stats_lock:
+            self._stats[name] += 1
+
+    def get(self, key: str):
+        """Devuelve el valor cacheado (puede ser None) o MISSING."""
+        value = self.memory.get(key)
+        if value is not MISSING:
+            self._count("memory_hits")
+        else:
+            try:
+                value = self.backend.get(key)
+            except Exception as e:
+                # Un fallo del almacenamiento persistente no debe detener el pipeline
+                print(f"ADVERTENCIA: Error al leer la caché '{self.namespace}': {e}")
+                self._count("errors")
+                value = MISSING
+            if value is MISSING:
+                self._count("misses")
+                return MISSING
+            self._count("persistent_hits")
+            self.memory.set(key, value, self._ttl_for(value))
+
+        if value is None:
+            self._count("negative_hits")
+        return value
+
+    def get_many(self, keys) -> dict:
+        """
+        Versión por lotes de `get`: {clave: valor} de las claves en caché (las
+        ausentes no aparecen). Las que no están en memoria se leen del
+        almacenamiento persistente en una sola consulta.
+        """
+        found = {}
+        missing = []
+        for key in dict.fromkeys(keys):
+            value = self.memory.get(key)
+            if value is MISSING:
+                missing.append(key)
+            else:
+                self._count("memory_hits")
+                found[key] = value
+
+        if missing:
+            try:
+                stored = self.backend.get_many(missing)
+            except Exception as e:
+                print(f"ADVERTENCIA: Error al leer la caché '{self.namespace}': {e}")
+                self._count("errors")
+                stored = {}
+            for key in missing:
+                if key not in stored:
+                    self._count("misses")
+                    continue
+                self._count("persistent_hits")
+                found[key] = stored[key]
+                self.memory.set(key, stored[key], self._ttl_for(stored[key]))
+
+        for value in found.values():
+            if value is None:
+                self._count("negative_hits")
+        return found
+
+    def set(self, key: str, value):
+        ttl = self._ttl_for(value)
+        self.memory.set(key, value, ttl)
+        try:
+            self.backend.set(key, value, ttl)
+        except Exception as e:
+            print(f"ADVERTENCIA: Error al escribir la caché '{self.namespace}': {e}")
+            self._count("errors")
+
+    def purge_expired(self) -> int:
+        """Elimina del almacenamiento persistente las entradas vencidas."""
+        return self.backend.purge_expired()
+
+    def _ttl_for(self, value) -> float:
+        return self.negative_ttl if value is None else self.ttl
+
+    def stats(self) -> dict:
+        with self._stats_lock:
+            stats = dict(self._stats)
+        lookups = stats["memory_hits"] + stats["persistent_hits"] + stats["misses"]
+        stats["hit_ratio"] = (lookups - stats["misses"]) / lookups if lookups else 0.0
+        stats["memory_size"] = len(self.memory)
+        return stats
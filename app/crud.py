@@ -1,7 +1,11 @@
+from sqlalchemy import cast, column, func, select, tuple_, update, values
+from sqlalchemy.dialects.postgresql import insert as pg_insert
 from sqlalchemy.orm import Session
+import base64
 import uuid
+from datetime import datetime
 
-from . import models, schemas
+from . import models, normalizer, schemas, spatial
 
 
 def get_address(db: Session, address_id: uuid.UUID):
@@ -14,15 +18,68 @@ def get_address_by_original_address(db: Session, original_address: str):
     return db.query(models.Address).filter(models.Address.original_address == original_address).first()
 
 
-def get_addresses(db: Session, skip: int = 0, limit: int = 100):
-    """Obtiene una lista de direcciones."""
-    return db.query(models.Address).offset(skip).limit(limit).all()
+def build_address_filters(
+    status: models.AddressStatus | None = None,
+    neighborhood: str | None = None,
+    postal_code: str | None = None,
+    created_from: datetime | None = None,
+    created_to: datetime | None = None,
+) -> list:
+    """Condiciones SQL para filtrar direcciones (listado y exportación)."""
+    filters = []
+    if status is not None:
+        filters.append(models.Address.status == status)
+    if neighborhood is not None:
+        filters.append(models.Address.neighborhood == neighborhood)
+    if postal_code is not None:
+        filters.append(models.Address.postal_code == postal_code)
+    if created_from is not None:
+        filters.append(models.Address.created_at >= created_from)
+    if created_to is not None:
+        filters.append(models.Address.created_at < created_to)
+    return filters
+
+
+def encode_cursor(address: models.Address) -> str:
+    """Cursor opaco con la posición (created_at, id) de una dirección."""
+    raw = f"{address.created_at.isoformat()}|{address.id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+def decode_cursor(cursor: str) -> tuple[datetime, uuid.UUID]:
+    """Inverso de `encode_cursor`. Lanza ValueError si el cursor no es válido."""
+    try:
+        created_at, address_id = base64.urlsafe_b64decode(cursor.encode()).decode().split("|")
+        return datetime.fromisoformat(created_at), uuid.UUID(address_id)
+    except Exception as e:
+        raise ValueError("Cursor inválido") from e
+
+
+def get_addresses(db: Session, limit: int = 100, cursor: str | None = None, filters: list | None = None):
+    """
+    Obtiene una página de direcciones, de la más reciente a la más antigua.
+
+    Usa paginación por cursor sobre (created_at, id): cada página cuesta lo
+    mismo sin importar su profundidad.
+    """
+    query = db.query(models.Address).filter(*(filters or []))
+    if cursor:
+        created_at, address_id = decode_cursor(cursor)
+        query = query.filter(tuple_(models.Address.created_at, models.Address.id) < (created_at, address_id))
+    return (
+        query.order_by(models.Address.created_at.desc(), models.Address.id.desc())
+        .limit(limit)
+        .all()
+    )
 
 
 def create_address(db: Session, address: schemas.AddressCreate):
     """Crea una nueva dirección en la base de datos."""
     # Crea una instancia del modelo SQLAlchemy a partir de los datos del schema
-    db_address = models.Address(original_address=address.original_address)
+    db_address = models.Address(
+        original_address=address.original_address,
+        fingerprint=normalizer.fingerprint(address.original_address),
+    )
     
     # Añade la instancia a la sesión de la base de datos
     db.add(db_address)
@@ -46,6 +103,11 @@ def update_address(db: Session, address_id: uuid.UUID, address_update: schemas.A
     for key, value in update_data.items():
         setattr(db_address, key, value)
 
+    # Mantiene el índice espacial al corregir las coordenadas a mano
+    if "latitude" in update_data or "longitude" in update_data:
+        db_address.geohash = spatial.encode(db_address.latitude, db_address.longitude)
+        db_address.geocode_failed = False
+
     db.add(db_address)
     db.commit()
     db.refresh(db_address)
@@ -62,6 +124,165 @@ def delete_address(db: Session, address_id: uuid.UUID):
     db.commit()
     return db_address
 
-def get_all_addresses(db: Session):
-    """Obtiene TODAS las direcciones de la base de datos, sin paginación."""
-    return db.query(models.Address).all()
+def bulk_create_addresses(
+    db: Session, original_addresses: list[str], batch_size: int = 1000, upload_id: uuid.UUID | None = None
+):
+    """
+    Inserta direcciones en lote, ignorando las que ya existen.
+
+    Usa INSERT ... ON CONFLICT DO NOTHING sobre el índice único de
+    `original_address`, con un único commit al final. Devuelve
+    {dirección: ID} de las creadas (las duplicadas no aparecen).
+    """
+    created = {}
+    for start in range(0, len(original_addresses), batch_size):
+        batch = original_addresses[start:start + batch_size]
+        stmt = (
+            pg_insert(models.Address)
+            .values([
+                {
+                    "id": uuid.uuid4(),
+                    "original_address": value,
+                    "fingerprint": normalizer.fingerprint(value),
+                    "status": models.AddressStatus.PENDING,
+                    "upload_id": upload_id,
+                }
+                for value in batch
+            ])
+            .on_conflict_do_nothing(index_elements=[models.Address.original_address])
+            .returning(models.Address.original_address, models.Address.id)
+        )
+        created.update(db.execute(stmt).tuples().all())
+
+    db.commit()
+    return created
+
+
+def get_address_ids_by_original_address(db: Session, original_addresses: list[str]) -> dict:
+    """IDs de las direcciones existentes, como {dirección original: ID}."""
+    if not original_addresses:
+        return {}
+    rows = db.execute(
+        select(models.Address.original_address, models.Address.id)
+        .where(models.Address.original_address.in_(original_addresses))
+    ).tuples().all()
+    return dict(rows)
+
+
+def addresses_exist(db: Session, filters: list) -> bool:
+    """Indica si existe al menos una dirección que cumpla los filtros."""
+    return db.query(models.Address.id).filter(*filters).first() is not None
+
+
+def create_upload(db: Session, filename: str, upload_id: uuid.UUID | None = None):
+    """Registra una nueva subida de archivo."""
+    db_upload = models.Upload(id=upload_id or uuid.uuid4(), filename=filename)
+    db.add(db_upload)
+    db.commit()
+    db.refresh(db_upload)
+    return db_upload
+
+
+def get_upload(db: Session, upload_id: uuid.UUID):
+    """Obtiene una subida por su ID."""
+    return db.query(models.Upload).filter(models.Upload.id == upload_id).first()
+
+
+def update_upload_progress(db: Session, upload: models.Upload, rows_found: int, created: int, skipped: int):
+    """Suma el progreso de un bloque a los contadores de la subida."""
+    db.execute(
+        update(models.Upload)
+        .where(models.Upload.id == upload.id)
+        .values(
+            rows_found=models.Upload.rows_found + rows_found,
+            new_addresses_created=models.Upload.new_addresses_created + created,
+            addresses_skipped=models.Upload.addresses_skipped + skipped,
+            updated_at=func.now(),
+        )
+        .execution_options(synchronize_session=False)
+    )
+    db.commit()
+
+
+def finish_upload(db: Session, upload: models.Upload, status: models.UploadStatus, error: str | None = None):
+    """Marca la subida como terminada (o fallida) y devuelve sus datos finales."""
+    upload.status = status
+    upload.error = error
+    upload.finished_at = func.now()
+    db.add(upload)
+    db.commit()
+    db.refresh(upload)
+    return upload
+
+
+def bulk_update_addresses(db: Session, rows: list[dict], fields: list[str], batch_size: int = 1000):
+    """
+    Actualiza muchas direcciones con una sola sentencia por bloque:
+
+        UPDATE addresses SET ... FROM (VALUES ...) AS data WHERE addresses.id = data.id
+
+    Cada fila de `rows` trae el `id` y los campos indicados en `fields`. No
+    hace commit: el llamador decide cuándo confirmar.
+    """
+    table = models.Address.__table__
+    names = ["id", *fields]
+    for start in range(0, len(rows), batch_size):
+        batch = rows[start:start + batch_size]
+        data = values(*[column(name, table.c[name].type) for name in names], name="data").data(
+            [tuple(row[name] for name in names) for row in batch]
+        )
+        # Los parámetros de VALUES llegan sin tipo: se convierten al tipo de cada columna
+        db.execute(
+            update(models.Address)
+            .where(models.Address.id == cast(data.c.id, table.c.id.type))
+            .values({name: cast(data.c[name], table.c[name].type) for name in fields} | {"updated_at": func.now()})
+            .execution_options(synchronize_session=False)
+        )
+
+
+def bulk_update_address_rows(db: Session, rows: list[dict]):
+    """
+    Como `bulk_update_addresses`, pero cada fila puede traer campos distintos:
+    se hace un UPDATE masivo por cada combinación de campos.
+    """
+    groups: dict[tuple, list[dict]] = {}
+    for row in rows:
+        fields = tuple(sorted(key for key in row if key != "id"))
+        groups.setdefault(fields, []).append(row)
+    for fields, group in groups.items():
+        if fields:
+            bulk_update_addresses(db, group, list(fields))
+
+
+def create_batch(db: Session, kind: models.BatchKind, selection: dict, total: int):
+    """Registra un nuevo procesamiento por lotes."""
+    db_batch = models.Batch(kind=kind, selection=selection, total=total)
+    db.add(db_batch)
+    db.commit()
+    db.refresh(db_batch)
+    return db_batch
+
+
+def get_batch(db: Session, batch_id: uuid.UUID):
+    """Obtiene un lote por su ID."""
+    return db.query(models.Batch).filter(models.Batch.id == batch_id).first()
+
+
+def update_batch_progress(
+    db: Session, batch_id: uuid.UUID, last_address_id: uuid.UUID, processed: int, succeeded: int, failed: int
+):
+    """
+    Suma el progreso de un bloque y guarda el punto de control. No hace commit.
+    `processed` incluye las filas que no necesitaron cambios.
+    """
+    db.execute(
+        update(models.Batch)
+        .where(models.Batch.id == batch_id)
+        .values(
+            processed=models.Batch.processed + processed,
+            succeeded=models.Batch.succeeded + succeeded,
+            failed=models.Batch.failed + failed,
+            last_address_id=last_address_id,
+        )
+        .execution_options(synchronize_session=False)
+    )
@@ -0,0 +1,175 @@
+"""
+Detección de variantes de una misma dirección ("Cra 72A #113-21",
+"carrera 72 a 113 21", "CR72A#113-21 piso 2").
+
+Cada dirección guarda una huella (`normalizer.fingerprint`) con índice B-tree,
+que funciona como clave de bloqueo: al ingresar direcciones nuevas solo se
+comparan contra las que comparten huella, sin comparaciones por pares. Las
+variantes se enlazan a la dirección canónica (`canonical_id`), no se encolan,
+y reciben el resultado de parseo y geocodificación de la canónica.
+
+`python -m app.migrate` calcula la huella de las direcciones anteriores a
+esta función. Tras un cambio del formato de la huella (el orden de los
+números en las huellas por palabras, el barrio en las de vía), `--recompute`
+las recalcula todas:
+
+    python -m app.dedup backfill [--recompute]
+
+Si la tarea de una canónica agota sus reintentos, sus variantes pendientes se
+desenlazan y se procesan por su cuenta (`jobs.release_variants`).
+"""
+import argparse
+import uuid
+
+from sqlalchemy import exists, or_, select, true, update
+from sqlalchemy.orm import Session, aliased
+
+from . import models, normalizer
+from .database import SessionLocal
+
+# Campos que las variantes heredan de su dirección canónica. El apartamento y
+# las notas son propios de cada variante.
+REUSED_FIELDS = (
+    "street_info",
+    "neighborhood",
+    "normalized_address",
+    "suggested_address",
+    "latitude",
+    "longitude",
+    "geohash",
+    "postal_code",
+    "status",
+    "parser_version",
+    "geocoder_version",
+    "geocode_failed",
+)
+
+
+def link_near_duplicates(db: Session, new_ids: list[uuid.UUID]) -> list[uuid.UUID]:
+    """
+    Enlaza las direcciones recién creadas que son variantes de otra (existente
+    o del mismo lote). Devuelve los IDs que sí deben procesarse.
+    """
+    if not new_ids:
+        return []
+
+    position = {address_id: index for index, address_id in enumerate(new_ids)}
+    new_rows = db.execute(
+        select(models.Address.id, models.Address.original_address, models.Address.fingerprint)
+        .where(models.Address.id.in_(new_ids))
+    ).all()
+    new_rows.sort(key=lambda row: position[row.id])
+
+    # Una dirección canónica por huella entre las existentes (DISTINCT ON, la más antigua)
+    fingerprints = {row.fingerprint for row in new_rows if row.fingerprint}
+    canonical: dict[str, uuid.UUID] = {}
+    if fingerprints:
+        existing = db.execute(
+            select(models.Address.fingerprint, models.Address.id)
+            .where(
+                models.Address.fingerprint.in_(fingerprints),
+                models.Address.canonical_id.is_(None),
+                models.Address.id.not_in(new_ids),
+                # Ni las que quedaron pendientes porque su tarea agotó los reintentos
+                or_(
+                    models.Address.status != models.AddressStatus.PENDING,
+                    ~exists().where(
+                        models.Job.address_id == models.Address.id, models.Job.status == models.JobStatus.DEAD
+                    ),
+                ),
+            )
+            .order_by(models.Address.fingerprint, models.Address.created_at)
+            .distinct(models.Address.fingerprint)
+        ).all()
+        canonical = {fingerprint: address_id for fingerprint, address_id in existing}
+
+    to_process = []
+    links = []
+    for row in new_rows:
+        canonical_id = canonical.get(row.fingerprint) if row.fingerprint else None
+        if canonical_id is None:
+            if row.fingerprint:
+                canonical[row.fingerprint] = row.id
+            to_process.append(row.id)
+            continue
+        parsed = normalizer.parse_address(row.original_address)
+        links.append({
+            "id": row.id,
+            "canonical_id": canonical_id,
+            "apartment_info": parsed["apartment_info"],
+            "notes": parsed["notes"],
+        })
+
+    if links:
+        # UPDATE masivo por clave primaria
+        db.execute(update(models.Address), links)
+        propagate_results(db, {link["canonical_id"] for link in links}, commit=False)
+        db.commit()
+        print(f"[DEDUP] {len(links)} direcciones enlazadas a una dirección canónica existente.")
+
+    return to_process
+
+
+def propagate_results(db: Session, canonical_ids, commit: bool = True):
+    """Copia el resultado de las direcciones canónicas ya procesadas a sus variantes."""
+    canonical_ids = list(canonical_ids)
+    if not canonical_ids:
+        return
+    canonical = aliased(models.Address)
+    db.execute(
+        update(models.Address)
+        .where(
+            models.Address.canonical_id == canonical.id,
+            canonical.id.in_(canonical_ids),
+            canonical.status != models.AddressStatus.PENDING,
+        )
+        .values({field: getattr(canonical, field) for field in REUSED_FIELDS})
+        .execution_options(synchronize_session=False)
+    )
+    if commit:
+        db.commit()
+
+
+def backfill_fingerprints(db: Session, chunk_size: int = 5000, recompute: bool = False) -> int:
+    """
+    Calcula la huella de las direcciones que no la tienen, por bloques. Con
+    `recompute`, recalcula todas.
+    """
+    missing = models.Address.fingerprint.is_(None)
+    if recompute:
+        missing = true()
+    total = 0
+    last_id = None
+    while True:
+        query = select(models.Address.id, models.Address.original_address).where(missing)
+        if last_id is not None:
+            query = query.where(models.Address.id > last_id)
+        rows = db.execute(query.order_by(models.Address.id).limit(chunk_size)).all()
+        if not rows:
+            return total
+        db.execute(
+            update(models.Address),
+            [{"id": row.id, "fingerprint": normalizer.fingerprint(row.original_address)} for row in rows],
+        )
+        db.commit()
+        total += len(rows)
+        last_id = rows[-1].id
+        print(f"[DEDUP] {total} huellas calculadas...")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Detección de variantes de direcciones.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    backfill = subparsers.add_parser("backfill", help="Calcula la huella de las direcciones existentes.")
+    backfill.add_argument("--chunk-size", type=int, default=5000)
+    backfill.add_argument("--recompute", action="store_true", help="Recalcula todas las huellas (cambio de formato).")
+    args = parser.parse_args()
+
+    with SessionLocal() as db:
+        if args.command == "backfill":
+            total = backfill_fingerprints(db, chunk_size=args.chunk_size, recompute=args.recompute)
+            print(f"[DEDUP] Listo: {total} direcciones actualizadas.")
+
+
+if __name__ == "__main__":
+    main()
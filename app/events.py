@@ -0,0 +1,351 @@
+"""
+Eventos de progreso en tiempo real (Server-Sent Events).
+
+El pipeline publica los cambios de estado con `pg_notify` dentro de la misma
+transacción que los escribe, así que los eventos salen al hacer commit y
+nunca anuncian un resultado que no quedó guardado. Un NOTIFY lleva el estado
+actual de hasta ~120 direcciones (el límite de Postgres es 8000 bytes).
+
+En la API, un solo hilo escucha el canal (LISTEN) y un broker en memoria
+reparte cada evento entre los clientes suscritos a su subida, lote o
+dirección (`GET /uploads/{id}/events`, `GET /batch/{id}/events`,
+`GET /addresses/{id}/events`). Los estados que se emiten son `pending`,
+`normalized`, `verified` y `failed` (la geocodificación no encontró la
+dirección, según marca el pipeline en `geocode_failed`, o la tarea agotó sus
+reintentos).
+"""
+import asyncio
+import json
+import os
+import select as select_module
+import threading
+import time
+import uuid
+from collections import defaultdict
+
+from sqlalchemy import func, or_, select
+from sqlalchemy.orm import Session
+
+from . import models
+
+EVENTS_ENABLED = os.getenv("EVENTS_ENABLED", "true").lower() in ("1", "true", "yes")
+EVENTS_CHANNEL = os.getenv("EVENTS_CHANNEL", "geofull_events")
+# Mínimo entre dos eventos `progress` (conteos agregados) de un mismo stream
+EVENTS_PROGRESS_INTERVAL = float(os.getenv("EVENTS_PROGRESS_INTERVAL", "1"))
+EVENTS_KEEPALIVE = float(os.getenv("EVENTS_KEEPALIVE", "15"))
+EVENTS_QUEUE_SIZE = 1000
+
+_MAX_PAYLOAD_BYTES = 7000
+_EVENT_BYTES = 56  # ["<uuid>","normalized"], con margen
+
+
+# --- Publicación (workers y API) ---
+
+def notify(db: Session, payload: dict):
+    """NOTIFY en la transacción actual: se entrega a los que escuchan al hacer commit."""
+    db.execute(select(func.pg_notify(EVENTS_CHANNEL, json.dumps(payload, separators=(",", ":")))))
+
+
+def publish_address_changes(db: Session, address_ids, batch_id: uuid.UUID | None = None, failed_ids=()):
+    """
+    Publica el estado actual de las direcciones y de sus variantes, agrupado
+    por subida. Debe llamarse después de escribirlas y antes del commit.
+    """
+    address_ids = list(address_ids)
+    if not EVENTS_ENABLED or not address_ids:
+        return
+    failed = set(failed_ids)
+    rows = db.execute(
+        select(
+            models.Address.id,
+            models.Address.canonical_id,
+            models.Address.upload_id,
+            models.Address.status,
+            models.Address.geocode_failed,
+        )
+        .where(or_(models.Address.id.in_(address_ids), models.Address.canonical_id.in_(address_ids)))
+    ).all()
+
+    by_upload = defaultdict(list)
+    for row in rows:
+        status = "failed" if row.geocode_failed or row.id in failed or row.canonical_id in failed else row.status.value
+        by_upload[row.upload_id].append([str(row.id), status])
+
+    per_message = _MAX_PAYLOAD_BYTES // _EVENT_BYTES
+    for upload_id, changes in by_upload.items():
+        for start in range(0, len(changes), per_message):
+            notify(db, {
+                "type": "address",
+                "upload_id": str(upload_id) if upload_id else None,
+                "batch_id": str(batch_id) if batch_id else None,
+                "events": changes[start:start + per_message],
+            })
+
+
+def publish_batch_progress(db: Session, batch_id: uuid.UUID):
+    """Avisa que cambió el progreso (o el estado) de un lote."""
+    if EVENTS_ENABLED:
+        notify(db, {"type": "batch", "batch_id": str(batch_id)})
+
+
+def publish_upload_progress(db: Session, upload_id: uuid.UUID, commit: bool = True):
+    """Avisa que cambió el progreso de la ingesta de una subida."""
+    if EVENTS_ENABLED:
+        notify(db, {"type": "upload", "upload_id": str(upload_id)})
+        if commit:
+            db.commit()
+
+
+# --- Broker en memoria (API) ---
+
+class EventBroker:
+    """
+    Reparte las notificaciones del canal entre las colas asyncio de los
+    suscriptores, por scope (`upload:<id>`, `batch:<id>`, `address:<id>`).
+    Escucha con una conexión dedicada en un hilo, que se abre con el primer
+    suscriptor y se reconecta si se pierde.
+    """
+
+    def __init__(self, channel: str = EVENTS_CHANNEL):
+        self.channel = channel
+        self._subscribers: dict[str, set[asyncio.Queue]] = defaultdict(set)
+        self._address_scopes = 0
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._thread: threading.Thread | None = None
+        self._stop = threading.Event()
+
+    def subscribe(self, scope: str) -> asyncio.Queue:
+        queue = asyncio.Queue(maxsize=EVENTS_QUEUE_SIZE)
+        self._subscribers[scope].add(queue)
+        if scope.startswith("address:"):
+            self._address_scopes += 1
+        self._ensure_listener()
+        return queue
+
+    def unsubscribe(self, scope: str, queue: asyncio.Queue):
+        queues = self._subscribers.get(scope)
+        if queues is None or queue not in queues:
+            return
+        queues.discard(queue)
+        if not queues:
+            del self._subscribers[scope]
+        if scope.startswith("address:"):
+            self._address_scopes -= 1
+
+    def subscriber_count(self) -> int:
+        return sum(len(queues) for queues in self._subscribers.values())
+
+    def _ensure_listener(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._loop = asyncio.get_running_loop()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._listen, name="events-listener", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    @staticmethod
+    def check_driver():
+        """
+        La escucha usa la API de psycopg2 (`poll`, `notifies`): con otro driver
+        síncrono fallaría en cada intento sin que los clientes se enteren, así
+        que la API se niega a arrancar.
+        """
+        if not EVENTS_ENABLED:
+            return
+        from .database import engine
+
+        if engine.dialect.driver != "psycopg2":
+            raise RuntimeError(
+                f"Los eventos SSE requieren el driver psycopg2 y DATABASE_URL usa '{engine.dialect.driver}' "
+                "(EVENTS_ENABLED=false los desactiva)"
+            )
+
+    def _listen(self):
+        from .database import engine
+
+        while not self._stop.is_set():
+            raw = None
+            try:
+                # Conexión fuera del pool: queda ocupada mientras escucha
+                raw = engine.raw_connection()
+                raw.detach()
+                connection = raw.driver_connection
+                connection.autocommit = True
+                with connection.cursor() as cursor:
+                    cursor.execute(f'LISTEN "{self.channel}"')
+                print(f"[EVENTS] Escuchando el canal '{self.channel}'")
+                while not self._stop.is_set():
+                    if select_module.select([connection], [], [], 5) == ([], [], []):
+                        continue
+                    connection.poll()
+                    while connection.notifies:
+                        notification = connection.notifies.pop(0)
+                        self._loop.call_soon_threadsafe(self._dispatch, notification.payload)
+            except Exception as e:
+                print(f"[EVENTS] Error en la escucha de eventos: {e}. Reintentando...")
+                self._stop.wait(2)
+            finally:
+                if raw is not None:
+                    try:
+                        raw.close()
+                    except Exception:
+                        pass
+
+    def _dispatch(self, raw_payload: str):
+        """Corre en el event loop: entrega el mensaje a cada scope interesado."""
+        try:
+            payload = json.loads(raw_payload)
+        except ValueError:
+            return
+        scopes = set()
+        if payload.get("upload_id"):
+            scopes.add(f"upload:{payload['upload_id']}")
+        if payload.get("batch_id"):
+            scopes.add(f"batch:{payload['batch_id']}")
+        if self._address_scopes and payload.get("type") == "address":
+            scopes.update(f"address:{address_id}" for address_id, _ in payload["events"])
+        for scope in scopes:
+            for queue in self._subscribers.get(scope, ()):
+                try:
+                    queue.put_nowait(payload)
+                except asyncio.QueueFull:
+                    # Cliente lento: se pierden eventos individuales, no los conteos agregados
+                    pass
+
+
+broker = EventBroker()
+
+
+# --- Progreso agregado ---
+
+def _status_counts(db: Session, condition) -> dict:
+    """Direcciones por estado; `failed` son aquellas cuya geocodificación no encontró resultados (`geocode_failed`)."""
+    rows = db.execute(
+        select(models.Address.status, models.Address.geocode_failed, func.count())
+        .where(condition)
+        .group_by(models.Address.status, models.Address.geocode_failed)
+    ).all()
+    counts = {status.value: 0 for status in models.AddressStatus}
+    counts["failed"] = 0
+    for status, geocode_failed, count in rows:
+        if geocode_failed:
+            counts["failed"] += count
+        else:
+            counts[status.value] += count
+    return counts
+
+
+def _job_counts(db: Session, condition) -> dict:
+    rows = db.execute(
+        select(models.Job.status, func.count())
+        .join(models.Address, models.Address.id == models.Job.address_id)
+        .where(condition, models.Job.status.in_([models.JobStatus.PENDING, models.JobStatus.RUNNING, models.JobStatus.DEAD]))
+        .group_by(models.Job.status)
+    ).all()
+    counts = {status.value: count for status, count in rows}
+    return {
+        "in_flight": counts.get("pending", 0) + counts.get("running", 0),
+        "dead": counts.get("dead", 0),
+    }
+
+
+def upload_progress(db: Session, upload_id: uuid.UUID) -> dict:
+    """Progreso de la ingesta y del procesamiento de las direcciones de una subida."""
+    upload = db.get(models.Upload, upload_id, populate_existing=True)
+    condition = models.Address.upload_id == upload_id
+    jobs_counts = _job_counts(db, condition)
+    statuses = _status_counts(db, condition)
+    statuses["failed"] += jobs_counts["dead"]
+    statuses["pending"] = max(statuses["pending"] - jobs_counts["dead"], 0)
+    ingesting = upload is None or upload.status == models.UploadStatus.PROCESSING
+    return {
+        "upload_id": str(upload_id),
+        "upload_status": upload.status.value if upload else None,
+        "rows_found": upload.rows_found if upload else 0,
+        "new_addresses_created": upload.new_addresses_created if upload else 0,
+        "addresses_skipped": upload.addresses_skipped if upload else 0,
+        "statuses": statuses,
+        "in_flight": jobs_counts["in_flight"],
+        "finished": not ingesting and jobs_counts["in_flight"] == 0,
+    }
+
+
+def address_progress(db: Session, address_id: uuid.UUID) -> dict | None:
+    """Estado de una dirección y si todavía tiene procesamiento pendiente."""
+    address = db.get(models.Address, address_id, populate_existing=True)
+    if address is None:
+        return None
+    condition = models.Address.id == (address.canonical_id or address_id)
+    jobs_counts = _job_counts(db, condition)
+    status = address.status.value
+    if jobs_counts["dead"] or address.geocode_failed:
+        status = "failed"
+    return {
+        "address_id": str(address_id),
+        "status": status,
+        "in_flight": jobs_counts["in_flight"],
+        "finished": status == "failed" or (jobs_counts["in_flight"] == 0 and address.status != models.AddressStatus.PENDING),
+    }
+
+
+# --- Server-Sent Events ---
+
+def format_sse(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+
+
+async def stream(request, scope: str, snapshot):
+    """
+    Genera el stream SSE de un scope: un `progress` inicial, un `address` por
+    cada grupo de cambios de estado, `progress` como máximo cada
+    EVENTS_PROGRESS_INTERVAL, y `end` cuando `snapshot()` indica `finished`.
+
+    `snapshot` es una corrutina que devuelve el progreso agregado del scope.
+    Sin notificaciones durante EVENTS_KEEPALIVE se recalcula igual: el listener
+    pudo perderlas (reconexión, o arrancó después del último commit).
+    """
+    queue = broker.subscribe(scope)
+    try:
+        progress = await snapshot()
+        yield format_sse("progress", progress)
+        last_progress = time.monotonic()
+        dirty = False
+        while not progress.get("finished"):
+            if await request.is_disconnected():
+                return
+            timeout = EVENTS_KEEPALIVE
+            if dirty:
+                timeout = max(EVENTS_PROGRESS_INTERVAL - (time.monotonic() - last_progress), 0)
+            try:
+                payload = await asyncio.wait_for(queue.get(), timeout=timeout)
+            except asyncio.TimeoutError:
+                payload = None
+                if not dirty:
+                    latest = await snapshot()
+                    if latest == progress:
+                        yield ": keepalive\n\n"
+                    else:
+                        progress = latest
+                        yield format_sse("progress", progress)
+                        last_progress = time.monotonic()
+                    continue
+
+            if payload is not None:
+                dirty = True
+                if payload["type"] == "address":
+                    changes = payload["events"]
+                    if scope.startswith("address:"):
+                        changes = [change for change in changes if f"address:{change[0]}" == scope]
+                    yield format_sse("address", {"events": [{"id": id_, "status": status} for id_, status in changes]})
+
+            if dirty and time.monotonic() - last_progress >= EVENTS_PROGRESS_INTERVAL:
+                progress = await snapshot()
+                yield format_sse("progress", progress)
+                last_progress = time.monotonic()
+                dirty = False
+        yield format_sse("end", progress)
+    finally:
+        broker.unsubscribe(scope, queue)
@@ -0,0 +1,211 @@
+import csv
+import enum
+import io
+import tempfile
+import uuid
+import zlib
+from datetime import datetime
+
+from sqlalchemy import select
+
+from . import metrics, models
+from .database import SessionLocal
+
+# Exportación en streaming con memoria acotada.
+#
+# Las filas se leen con un cursor del lado del servidor en bloques de
+# EXPORT_CHUNK_SIZE y se escriben directamente a la respuesta, sin construir
+# la lista completa ni un DataFrame.
+
+EXPORT_CHUNK_SIZE = 5000
+
+# Las columnas más importantes primero, y las de IA visibles
+EXPORT_COLUMNS = [
+    'id',
+    'original_address',
+    'normalized_address',
+    'suggested_address',
+    'latitude',
+    'longitude',
+    'postal_code',
+    'street_info',
+    'neighborhood',
+    'apartment_info',
+    'notes',
+    'status',
+    'created_at',
+    'updated_at',
+]
+
+EXPORT_FORMATS = {
+    "csv": ("text/csv; charset=utf-8", "csv"),
+    "parquet": ("application/vnd.apache.parquet", "parquet"),
+    "xlsx": ("application/vnd.openxmlformats-officedocument.spreadsheetml.sheet", "xlsx"),
+}
+
+
+def is_format_available(export_format: str) -> bool:
+    """Parquet depende de pyarrow, que es opcional."""
+    if export_format == "parquet":
+        try:
+            import pyarrow  # noqa: F401
+        except ImportError:
+            return False
+    return True
+
+
+def iter_address_chunks(filters: list, chunk_size: int = EXPORT_CHUNK_SIZE):
+    """
+    Recorre las direcciones con un cursor del lado del servidor y devuelve
+    bloques de tuplas en el orden de EXPORT_COLUMNS.
+
+    Abre su propia sesión, porque el generador sigue vivo después de que el
+    endpoint termina.
+    """
+    columns = [getattr(models.Address, name) for name in EXPORT_COLUMNS]
+    stmt = (
+        select(*columns)
+        .where(*filters)
+        .order_by(models.Address.created_at, models.Address.id)
+        .execution_options(stream_results=True, yield_per=chunk_size)
+    )
+    with SessionLocal() as db:
+        result = db.execute(stmt)
+        partitions = result.partitions(chunk_size)
+        while True:
+            with metrics.track("export_read"):
+                partition = next(partitions, None)
+            if partition is None:
+                return
+            yield partition
+
+
+def _to_json_value(value):
+    """Convierte los valores a la misma representación que el schema en modo JSON."""
+    if isinstance(value, enum.Enum):
+        return value.value
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if isinstance(value, uuid.UUID):
+        return str(value)
+    return value
+
+
+def stream_csv(filters: list):
+    """Genera el CSV bloque a bloque, en bytes UTF-8."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(EXPORT_COLUMNS)
+    for chunk in iter_address_chunks(filters):
+        writer.writerows([_to_json_value(value) for value in row] for row in chunk)
+        yield buffer.getvalue().encode("utf-8")
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode("utf-8")
+
+
+def gzip_stream(chunks):
+    """Comprime un flujo de bytes en formato gzip, bloque a bloque."""
+    compressor = zlib.compressobj(wbits=31)
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+class _DrainableSink(io.RawIOBase):
+    """Archivo de solo escritura cuyo contenido se vacía tras cada bloque."""
+
+    def __init__(self):
+        self._parts = []
+        self._position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._parts.append(bytes(data))
+        self._position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    def drain(self) -> bytes:
+        data = b"".join(self._parts)
+        self._parts.clear()
+        return data
+
+
+def stream_parquet(filters: list):
+    """Genera un archivo Parquet con un row group por bloque (requiere pyarrow)."""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    schema = pa.schema([
+        ("id", pa.string()),
+        ("original_address", pa.string()),
+        ("normalized_address", pa.string()),
+        ("suggested_address", pa.string()),
+        ("latitude", pa.float64()),
+        ("longitude", pa.float64()),
+        ("postal_code", pa.string()),
+        ("street_info", pa.string()),
+        ("neighborhood", pa.string()),
+        ("apartment_info", pa.string()),
+        ("notes", pa.string()),
+        ("status", pa.string()),
+        ("created_at", pa.timestamp("us", tz="UTC")),
+        ("updated_at", pa.timestamp("us", tz="UTC")),
+    ])
+    sink = _DrainableSink()
+    writer = pq.ParquetWriter(sink, schema)
+    try:
+        for chunk in iter_address_chunks(filters):
+            columns = list(zip(*chunk))
+            arrays = {
+                name: [_to_json_value(value) if name not in ("created_at", "updated_at") else value for value in values]
+                for name, values in zip(EXPORT_COLUMNS, columns)
+            }
+            writer.write_table(pa.Table.from_pydict(arrays, schema=schema))
+            yield sink.drain()
+    finally:
+        writer.close()
+    yield sink.drain()
+
+
+def stream_xlsx(filters: list):
+    """
+    Genera un XLSX con openpyxl en modo write-only (memoria acotada). El
+    archivo se arma en disco y luego se envía por bloques.
+    """
+    from openpyxl import Workbook
+
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet("addresses")
+    sheet.append(EXPORT_COLUMNS)
+    for chunk in iter_address_chunks(filters):
+        for row in chunk:
+            # Excel no admite fechas con zona horaria
+            sheet.append([
+                value.replace(tzinfo=None) if isinstance(value, datetime) else _to_json_value(value)
+                for value in row
+            ])
+
+    with tempfile.TemporaryFile() as tmp:
+        workbook.save(tmp)
+        tmp.seek(0)
+        while data := tmp.read(1024 * 1024):
+            yield data
+
+
+def export_stream(export_format: str, filters: list, gzip: bool = False):
+    """Devuelve el generador de bytes para el formato pedido."""
+    if export_format == "parquet":
+        return stream_parquet(filters)
+    if export_format == "xlsx":
+        return stream_xlsx(filters)
+    stream = stream_csv(filters)
+    return gzip_stream(stream) if gzip else stream
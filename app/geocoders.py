@@ -0,0 +1,340 @@
+"""
+Proveedores de geocodificación intercambiables.
+
+Cada proveedor implementa `async geocode(address) -> dict | None` (None: el
+proveedor respondió sin resultados; una excepción: no se pudo consultar).
+`HedgedGeocoder` combina varios:
+
+  1. Consulta al proveedor con mejor puntaje (latencia y calidad recientes).
+  2. Si no responde dentro de su percentil GEOCODER_HEDGE_QUANTILE de
+     latencia, lanza la misma consulta al siguiente (petición "hedged").
+     Si un proveedor falla o no encuentra resultados, pasa al siguiente sin
+     esperar.
+  3. Se queda con el primer resultado aceptable y cancela el resto.
+
+La latencia, el hedge y el plazo GEOCODER_TIMEOUT se miden desde que el
+limitador de tasa del proveedor admite la consulta: con Nominatim a 1 req/s,
+un lote de 50 direcciones espera en cola sin que eso cuente como lentitud
+del proveedor ni dispare peticiones hedged.
+
+Con el percentil 0.9, solo ~10% de las consultas generan una segunda
+petición, pero la latencia de cola queda acotada por el proveedor más rápido.
+
+Proveedores disponibles (GEOCODER_PROVIDERS, en orden de preferencia):
+`nominatim` y `mapbox` (requiere MAPBOX_ACCESS_TOKEN).
+"""
+import asyncio
+import os
+import threading
+import time
+from collections import deque
+from urllib.parse import quote
+
+from . import http_client, metrics
+
+GEOCODER_PROVIDERS = [name.strip() for name in os.getenv("GEOCODER_PROVIDERS", "nominatim,mapbox").split(",") if name.strip()]
+GEOCODER_TIMEOUT = float(os.getenv("GEOCODER_TIMEOUT", "15"))
+GEOCODER_HEDGE_QUANTILE = float(os.getenv("GEOCODER_HEDGE_QUANTILE", "0.9"))
+GEOCODER_HEDGE_MIN_DELAY = float(os.getenv("GEOCODER_HEDGE_MIN_DELAY", "0.2"))
+GEOCODER_HEDGE_MAX_DELAY = float(os.getenv("GEOCODER_HEDGE_MAX_DELAY", "3"))
+# Latencia supuesta mientras un proveedor no tiene suficientes mediciones
+GEOCODER_PRIOR_LATENCY = float(os.getenv("GEOCODER_PRIOR_LATENCY", "1"))
+GEOCODER_MIN_SAMPLES = 20
+GEOCODER_STATS_WINDOW = 500
+
+NOMINATIM_URL = os.getenv("NOMINATIM_URL", "https://nominatim.openstreetmap.org/search")
+MAPBOX_URL = os.getenv("MAPBOX_URL", "https://api.mapbox.com/geocoding/v5/mapbox.places")
+MAPBOX_ACCESS_TOKEN = os.getenv("MAPBOX_ACCESS_TOKEN")
+
+
+class GeocodingError(Exception):
+    """Ningún proveedor pudo responder (errores o timeout): el resultado no se cachea."""
+
+
+class ProviderStats:
+    """Latencias y resultados recientes de un proveedor (ventana deslizante)."""
+
+    def __init__(self, window: int = GEOCODER_STATS_WINDOW):
+        self.latencies = deque(maxlen=window)
+        self.outcomes = deque(maxlen=window)  # "result", "empty" o "error"
+        self.wins = 0
+        self._lock = threading.Lock()
+
+    def record(self, latency: float | None, outcome: str):
+        with self._lock:
+            if latency is not None:
+                self.latencies.append(latency)
+            self.outcomes.append(outcome)
+
+    def latency_quantile(self, q: float) -> float | None:
+        with self._lock:
+            if len(self.latencies) < GEOCODER_MIN_SAMPLES:
+                return None
+            values = sorted(self.latencies)
+        return values[min(int(q * len(values)), len(values) - 1)]
+
+    def success_ratio(self) -> float | None:
+        with self._lock:
+            if len(self.outcomes) < GEOCODER_MIN_SAMPLES:
+                return None
+            return sum(1 for outcome in self.outcomes if outcome == "result") / len(self.outcomes)
+
+    def snapshot(self) -> dict:
+        return {
+            "samples": len(self.outcomes),
+            "p50": self.latency_quantile(0.5),
+            "p90": self.latency_quantile(0.9),
+            "success_ratio": self.success_ratio(),
+            "wins": self.wins,
+        }
+
+
+class GeocoderProvider:
+    """Interfaz de un proveedor de geocodificación."""
+
+    name = "base"
+
+    def __init__(self):
+        self.stats = ProviderStats()
+
+    async def geocode(self, address: str, on_admitted=None) -> dict | None:
+        """`on_admitted()` se llama cuando el limitador de tasa deja pasar la consulta."""
+        raise NotImplementedError
+
+    async def timed_geocode(self, address: str, admitted: asyncio.Event | None = None) -> dict | None:
+        """
+        `geocode` con registro de latencia, resultado y métricas. La latencia se
+        mide desde la admisión (sin la espera en cola), que también se avisa con `admitted`.
+        """
+        start = None
+
+        def on_admitted():
+            nonlocal start
+            if start is None:
+                start = time.monotonic()
+                if admitted is not None:
+                    admitted.set()
+
+        try:
+            with metrics.track(f"geocoder:{self.name}"):
+                result = await self.geocode(address, on_admitted=on_admitted)
+        except asyncio.CancelledError:
+            raise  # Cancelado por el hedging: no cuenta como fallo del proveedor
+        except Exception:
+            self.stats.record(None, "error")
+            raise
+        self.stats.record(time.monotonic() - start if start is not None else None, "result" if result else "empty")
+        return result
+
+
+class NominatimGeocoder(GeocoderProvider):
+    """Nominatim (OpenStreetMap), con el límite de tasa del proveedor `nominatim`."""
+
+    name = "nominatim"
+
+    def __init__(self, url: str = NOMINATIM_URL):
+        super().__init__()
+        self.url = url
+
+    async def geocode(self, address: str, on_admitted=None) -> dict | None:
+        params = {'q': address, 'format': 'json', 'addressdetails': 1, 'limit': 1}
+        response = await http_client.nominatim.request("GET", self.url, on_admitted=on_admitted, params=params)
+        data = response.json()
+        if not data:
+            return None
+        result = data[0]
+        return {
+            "latitude": float(result.get("lat")),
+            "longitude": float(result.get("lon")),
+            "suggested_address": result.get("display_name"),
+            "postal_code": result.get("address", {}).get("postcode"),
+        }
+
+
+class MapboxGeocoder(GeocoderProvider):
+    """Mapbox Geocoding API v5 (resultados limitados a Colombia)."""
+
+    name = "mapbox"
+
+    def __init__(self, access_token: str, url: str = MAPBOX_URL):
+        super().__init__()
+        self.access_token = access_token
+        self.url = url.rstrip("/")
+
+    async def geocode(self, address: str, on_admitted=None) -> dict | None:
+        params = {"access_token": self.access_token, "limit": 1, "country": "co", "language": "es"}
+        # La consulta va en la ruta: "#" o "/" sin codificar la cortarían
+        url = f"{self.url}/{quote(address, safe='')}.json"
+        response = await http_client.mapbox.request("GET", url, on_admitted=on_admitted, params=params)
+        features = response.json().get("features") or []
+        if not features:
+            return None
+        feature = features[0]
+        longitude, latitude = feature["center"]
+        postal_code = next(
+            (item.get("text") for item in feature.get("context", []) if item.get("id", "").startswith("postcode")),
+            None,
+        )
+        return {
+            "latitude": float(latitude),
+            "longitude": float(longitude),
+            "suggested_address": feature.get("place_name"),
+            "postal_code": postal_code,
+        }
+
+
+class HedgedGeocoder:
+    """Combina varios proveedores con peticiones hedged; gana el primer resultado aceptable."""
+
+    def __init__(
+        self,
+        providers: list[GeocoderProvider],
+        timeout: float = GEOCODER_TIMEOUT,
+        hedge_quantile: float = GEOCODER_HEDGE_QUANTILE,
+        min_delay: float = GEOCODER_HEDGE_MIN_DELAY,
+        max_delay: float = GEOCODER_HEDGE_MAX_DELAY,
+    ):
+        self.providers = providers
+        self.timeout = timeout
+        self.hedge_quantile = hedge_quantile
+        self.min_delay = min_delay
+        self.max_delay = max_delay
+
+    def _score(self, position: int, provider: GeocoderProvider) -> float:
+        """Tiempo esperado por resultado bueno (menor es mejor); el orden configurado desempata."""
+        latency = provider.stats.latency_quantile(0.5)
+        ratio = provider.stats.success_ratio()
+        if latency is None or ratio is None:
+            return GEOCODER_PRIOR_LATENCY * (1 + 0.1 * position)
+        return latency / max(ratio, 0.05)
+
+    def ordered(self) -> list[GeocoderProvider]:
+        """Proveedores ordenados por su puntaje reciente."""
+        scored = sorted(enumerate(self.providers), key=lambda item: self._score(*item))
+        return [provider for _, provider in scored]
+
+    def hedge_delay(self, provider: GeocoderProvider) -> float:
+        """Espera antes de lanzar la petición al siguiente proveedor."""
+        delay = provider.stats.latency_quantile(self.hedge_quantile)
+        if delay is None:
+            delay = GEOCODER_PRIOR_LATENCY
+        return min(max(delay, self.min_delay), self.max_delay)
+
+    @staticmethod
+    def is_acceptable(result: dict | None) -> bool:
+        return bool(result) and result.get("latitude") is not None and result.get("longitude") is not None
+
+    async def geocode(self, address: str) -> dict | None:
+        """
+        Devuelve el primer resultado aceptable, None si todos los proveedores
+        respondieron sin resultados, o lanza GeocodingError si ninguno pudo responder.
+
+        El plazo corre desde que el primer proveedor admite la consulta, y el
+        hedge de cada proveedor desde que el suyo la admite: la espera en el
+        limitador de tasa no cuenta.
+        """
+        providers = self.ordered()
+        if not providers:
+            raise GeocodingError("No hay proveedores de geocodificación configurados")
+
+        loop = asyncio.get_running_loop()
+        deadline = None
+        pending: dict[asyncio.Task, GeocoderProvider] = {}
+        queue = list(providers)
+        answered_empty = False
+        errors = []
+        last = None
+        last_admitted = None  # asyncio.Event: el último proveedor lanzado ya admitió la consulta
+        last_admitted_at = None
+
+        def launch():
+            nonlocal last, last_admitted, last_admitted_at
+            last = queue.pop(0)
+            last_admitted = asyncio.Event()
+            last_admitted_at = None
+            pending[asyncio.ensure_future(last.timed_geocode(address, last_admitted))] = last
+
+        launch()
+        try:
+            while pending:
+                remaining = None if deadline is None else deadline - loop.time()
+                if remaining is not None and remaining <= 0:
+                    break
+                if not last_admitted.is_set():
+                    # En la cola del limitador: se espera la admisión o una respuesta, sin hedge
+                    waiter = asyncio.ensure_future(last_admitted.wait())
+                    try:
+                        done, _ = await asyncio.wait(
+                            [*pending, waiter], timeout=remaining, return_when=asyncio.FIRST_COMPLETED
+                        )
+                    finally:
+                        waiter.cancel()
+                    done.discard(waiter)
+                    if last_admitted.is_set():
+                        last_admitted_at = loop.time()
+                        if deadline is None:
+                            deadline = last_admitted_at + self.timeout
+                else:
+                    hedge_in = self.hedge_delay(last) - (loop.time() - last_admitted_at)
+                    wait = min(max(hedge_in, 0), remaining) if queue else remaining
+                    done, _ = await asyncio.wait(pending, timeout=wait, return_when=asyncio.FIRST_COMPLETED)
+                    if not done:
+                        if queue and hedge_in <= wait:
+                            # El proveedor en curso superó su percentil de latencia
+                            metrics.record_hedge(last.name)
+                            launch()
+                        continue
+
+                for task in done:
+                    provider = pending.pop(task)
+                    try:
+                        result = task.result()
+                    except Exception as e:
+                        errors.append(f"{provider.name}: {type(e).__name__} {e}")
+                        continue
+                    if self.is_acceptable(result):
+                        provider.stats.wins += 1
+                        return result
+                    answered_empty = True
+
+                # Un fallo o una respuesta vacía no esperan al hedge: se pasa al siguiente
+                if queue and not pending:
+                    launch()
+        finally:
+            for task in pending:
+                task.cancel()
+
+        if answered_empty:
+            return None
+        raise GeocodingError("; ".join(errors) or f"Sin respuesta en {self.timeout:.0f}s")
+
+    def stats(self) -> dict:
+        return {provider.name: provider.stats.snapshot() for provider in self.providers}
+
+
+def build_provider(name: str) -> GeocoderProvider | None:
+    """Crea un proveedor por nombre; None si falta su configuración."""
+    if name == "nominatim":
+        return NominatimGeocoder()
+    if name == "mapbox":
+        if not MAPBOX_ACCESS_TOKEN:
+            return None
+        return MapboxGeocoder(MAPBOX_ACCESS_TOKEN)
+    print(f"ADVERTENCIA: Proveedor de geocodificación desconocido: '{name}'")
+    return None
+
+
+_geocoder: HedgedGeocoder | None = None
+_geocoder_lock = threading.Lock()
+
+
+def get_geocoder() -> HedgedGeocoder:
+    """Geocodificador compuesto según GEOCODER_PROVIDERS, creado una vez por proceso."""
+    global _geocoder
+    if _geocoder is None:
+        with _geocoder_lock:
+            if _geocoder is None:
+                providers = [provider for provider in map(build_provider, GEOCODER_PROVIDERS) if provider]
+                print(f"[GEOCODER] Proveedores: {', '.join(provider.name for provider in providers) or 'ninguno'}")
+                _geocoder = HedgedGeocoder(providers)
+    return _geocoder
@@ -0,0 +1,363 @@
+import asyncio
+import email.utils
+import os
+import random
+import threading
+import time
+from datetime import datetime, timezone
+
+import httpx
+
+from . import metrics
+
+# Capa compartida para las llamadas a servicios externos (Nominatim, Gemini).
+#
+# Todas las llamadas se ejecutan en un único event loop de asyncio que corre
+# en un hilo propio, de modo que el pool de conexiones (keep-alive), los
+# limitadores de tasa y los circuit breakers se comparten entre todos los
+# hilos del proceso. El código síncrono (workers, pipeline) usa `run()`.
+#
+# El límite de Nominatim se comparte además entre procesos y hosts (varios
+# `app.worker`, la API) a través de Postgres: `NOMINATIM_RATE` es la tasa total,
+# no la de cada proceso. `<PROVEEDOR>_SHARED_RATE=false` lo vuelve local.
+
+HTTP_MAX_CONNECTIONS = int(os.getenv("HTTP_MAX_CONNECTIONS", "20"))
+HTTP_MAX_KEEPALIVE = int(os.getenv("HTTP_MAX_KEEPALIVE", "10"))
+USER_AGENT = os.getenv("HTTP_USER_AGENT", "GeoFullApp/0.1 (mailto:tu-email-aqui@example.com)")
+
+
+class ProviderError(Exception):
+    """Error al llamar a un proveedor externo."""
+
+
+class CircuitOpenError(ProviderError):
+    """El circuit breaker del proveedor está abierto: no se intenta la llamada."""
+
+
+class RetryableHTTPError(ProviderError):
+    """Respuesta 429/5xx: la llamada se puede reintentar."""
+
+    def __init__(self, status_code: int, retry_after: float | None = None):
+        super().__init__(f"HTTP {status_code}")
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+
+def parse_retry_after(value: str | None) -> float | None:
+    """Interpreta la cabecera Retry-After (segundos o fecha HTTP)."""
+    if not value:
+        return None
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+    try:
+        when = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max((when - datetime.now(timezone.utc)).total_seconds(), 0.0)
+
+
+def raise_for_status(response: httpx.Response):
+    """429/5xx se convierten en RetryableHTTPError; el resto de errores HTTP se lanzan tal cual."""
+    if response.status_code == 429 or response.status_code >= 500:
+        raise RetryableHTTPError(response.status_code, parse_retry_after(response.headers.get("Retry-After")))
+    response.raise_for_status()
+
+
+class TokenBucket:
+    """Limitador de tasa token-bucket: `rate` solicitudes por segundo con ráfagas de `burst`."""
+
+    def __init__(self, rate: float, burst: int = 1):
+        self.rate = rate
+        self.capacity = max(burst, 1)
+        self.tokens = float(self.capacity)
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+        self._lock = asyncio.Lock()
+
+    def pause(self, seconds: float):
+        """Bloquea el limitador (p. ej. tras un 429 con Retry-After)."""
+        self.blocked_until = max(self.blocked_until, time.monotonic() + seconds)
+        self.tokens = 0.0
+
+    async def acquire(self):
+        if self.rate <= 0:
+            return  # Sin límite
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self.blocked_until:
+                    await asyncio.sleep(self.blocked_until - now)
+                    continue
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+class SharedRateLimiter:
+    """
+    Límite de tasa común a todos los procesos, en la tabla `rate_limits`: cada
+    llamada reserva con una sola sentencia el siguiente turno libre (`1 / rate`
+    segundos después del anterior) y espera hasta que llegue. Sin ráfagas: la
+    tasa total nunca supera `rate`. Si la base de datos no responde se usa el
+    limitador local (`fallback`).
+    """
+
+    _RESERVE_SQL = """
+        INSERT INTO rate_limits (name, next_at)
+        VALUES (:name, clock_timestamp() + make_interval(secs => :pause + :interval))
+        ON CONFLICT (name) DO UPDATE SET next_at = greatest(
+            rate_limits.next_at, clock_timestamp() + make_interval(secs => :pause)
+        ) + make_interval(secs => :interval)
+        RETURNING extract(epoch FROM rate_limits.next_at - clock_timestamp()) - :interval
+    """
+
+    def __init__(self, name: str, rate: float, fallback: TokenBucket):
+        self.name = name
+        self.rate = rate
+        self.fallback = fallback
+        self._pause = 0.0
+
+    def pause(self, seconds: float):
+        """Bloquea el limitador; el resto de procesos lo ven en la siguiente reserva."""
+        self._pause = max(self._pause, seconds)
+        self.fallback.pause(seconds)
+
+    def _reserve(self, pause: float) -> float:
+        """Reserva un turno y devuelve cuántos segundos faltan para él."""
+        from sqlalchemy import text
+
+        from .database import engine
+
+        with engine.begin() as conn:
+            return float(conn.execute(
+                text(self._RESERVE_SQL), {"name": self.name, "interval": 1 / self.rate, "pause": pause}
+            ).scalar_one())
+
+    async def acquire(self):
+        if self.rate <= 0:
+            return  # Sin límite
+        pause, self._pause = self._pause, 0.0
+        try:
+            wait = await asyncio.to_thread(self._reserve, pause)
+        except Exception as e:
+            print(f"[HTTP] {self.name}: límite de tasa compartido no disponible ({type(e).__name__}: {e}); se usa el local")
+            await self.fallback.acquire()
+            return
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+
+class CircuitBreaker:
+    """
+    Circuit breaker clásico: tras `failure_threshold` fallos seguidos se abre
+    durante `reset_timeout` segundos; luego deja pasar una llamada de prueba
+    y, mientras esta no termina, rechaza las demás.
+    """
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.state = "closed"
+        self.opened_at = 0.0
+        self.probe_in_flight = False
+
+    def before_call(self, name: str) -> bool:
+        """Lanza CircuitOpenError si no se puede llamar. Devuelve True si la llamada es la de prueba."""
+        if self.state == "open":
+            if time.monotonic() - self.opened_at < self.reset_timeout:
+                raise CircuitOpenError(f"Circuito abierto para '{name}'")
+            self.state = "half_open"
+        if self.state == "half_open":
+            if self.probe_in_flight:
+                raise CircuitOpenError(f"Circuito semiabierto para '{name}': hay una llamada de prueba en curso")
+            self.probe_in_flight = True
+            return True
+        return False
+
+    def release_probe(self):
+        """La llamada de prueba terminó sin veredicto (cancelada o error no transitorio)."""
+        self.probe_in_flight = False
+
+    def record_success(self):
+        self.failures = 0
+        self.state = "closed"
+        self.probe_in_flight = False
+
+    def record_failure(self):
+        self.failures += 1
+        self.probe_in_flight = False
+        if self.state == "half_open" or self.failures >= self.failure_threshold:
+            self.state = "open"
+            self.opened_at = time.monotonic()
+
+
+class Provider:
+    """
+    Proveedor externo con límite de tasa, concurrencia acotada, reintentos con
+    backoff exponencial (respetando Retry-After) y circuit breaker.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        rate: float,
+        burst: int = 1,
+        concurrency: int = 4,
+        timeout: float = 10.0,
+        max_retries: int = 3,
+        backoff_base: float = 1.0,
+        backoff_max: float = 60.0,
+        failure_threshold: int = 5,
+        reset_timeout: float = 30.0,
+        is_retryable=None,
+        shared_rate: bool = False,
+    ):
+        self.name = name
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.bucket = TokenBucket(rate, burst)
+        if shared_rate:
+            self.bucket = SharedRateLimiter(name, rate, fallback=self.bucket)
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.breaker = CircuitBreaker(failure_threshold, reset_timeout)
+        self.is_retryable = is_retryable
+
+    @classmethod
+    def from_env(cls, name: str, **defaults):
+        """Crea el proveedor leyendo `<NOMBRE>_RATE`, `<NOMBRE>_BURST`, etc. del entorno."""
+        prefix = name.upper()
+        for option, cast in (("rate", float), ("burst", int), ("concurrency", int), ("timeout", float), ("max_retries", int)):
+            value = os.getenv(f"{prefix}_{option.upper()}")
+            if value is not None:
+                defaults[option] = cast(value)
+        shared_rate = os.getenv(f"{prefix}_SHARED_RATE")
+        if shared_rate is not None:
+            defaults["shared_rate"] = shared_rate.lower() in ("1", "true", "yes")
+        return cls(name, **defaults)
+
+    def _should_retry(self, error: Exception) -> bool:
+        if isinstance(error, (RetryableHTTPError, asyncio.TimeoutError, httpx.TransportError)):
+            return True
+        return bool(self.is_retryable and self.is_retryable(error))
+
+    async def call(self, fn, on_admitted=None):
+        """
+        Ejecuta `fn()` (una función que devuelve una corrutina) bajo las políticas del proveedor.
+
+        `on_admitted()` se llama en cada intento cuando el limitador de tasa y
+        el límite de concurrencia dejan pasar la llamada: lo anterior es espera
+        en cola, no latencia del proveedor.
+        """
+        attempt = 0
+        while True:
+            probe = self.breaker.before_call(self.name)
+            try:
+                result = await self._attempt(fn, on_admitted)
+            except asyncio.CancelledError:
+                if probe:
+                    self.breaker.release_probe()
+                raise
+            except Exception as e:
+                if not self._should_retry(e):
+                    if probe:
+                        self.breaker.release_probe()
+                    raise
+                self.breaker.record_failure()
+                if attempt >= self.max_retries:
+                    raise
+                metrics.record_retry(self.name, e)
+                retry_after = getattr(e, "retry_after", None)
+                if retry_after is not None:
+                    self.bucket.pause(retry_after)
+                    delay = retry_after
+                else:
+                    delay = min(self.backoff_max, self.backoff_base * 2 ** attempt) * random.uniform(0.5, 1.0)
+                print(f"[HTTP] {self.name}: {type(e).__name__} {e}; reintento {attempt + 1} en {delay:.1f}s")
+                attempt += 1
+            else:
+                self.breaker.record_success()
+                return result
+            await asyncio.sleep(delay)
+
+    async def _attempt(self, fn, on_admitted):
+        """Un intento: espera turno en el limitador y en el semáforo y llama con timeout."""
+        await self.bucket.acquire()
+        async with self.semaphore:
+            if on_admitted is not None:
+                on_admitted()
+            with metrics.track(f"provider:{self.name}"):
+                return await asyncio.wait_for(fn(), self.timeout)
+
+    async def request(self, method: str, url: str, on_admitted=None, **kwargs) -> httpx.Response:
+        """Solicitud HTTP con el cliente compartido; 429/5xx se reintentan."""
+
+        async def send():
+            response = await get_client().request(method, url, **kwargs)
+            raise_for_status(response)
+            return response
+
+        return await self.call(send, on_admitted=on_admitted)
+
+
+def _is_gemini_retryable(error: Exception) -> bool:
+    """Errores transitorios del cliente de Gemini (cuotas, sobrecarga, timeouts)."""
+    try:
+        from google.api_core import exceptions as google_exceptions
+    except ImportError:
+        return False
+    return isinstance(
+        error,
+        (
+            google_exceptions.ResourceExhausted,
+            google_exceptions.ServiceUnavailable,
+            google_exceptions.InternalServerError,
+            google_exceptions.DeadlineExceeded,
+        ),
+    )
+
+
+# Proveedores configurados. La política pública de Nominatim es 1 solicitud/segundo
+# en total, así que su límite se comparte entre todos los procesos.
+nominatim = Provider.from_env("nominatim", rate=1.0, burst=1, concurrency=2, timeout=10.0, shared_rate=True)
+mapbox = Provider.from_env("mapbox", rate=10.0, burst=10, concurrency=8, timeout=10.0)
+gemini = Provider.from_env(
+    "gemini", rate=2.0, burst=4, concurrency=4, timeout=120.0, is_retryable=_is_gemini_retryable
+)
+
+_client: httpx.AsyncClient | None = None
+_loop: asyncio.AbstractEventLoop | None = None
+_loop_lock = threading.Lock()
+
+
+def get_client() -> httpx.AsyncClient:
+    """Cliente HTTP compartido (pool de conexiones keep-alive). Solo se usa dentro del loop."""
+    global _client
+    if _client is None:
+        _client = httpx.AsyncClient(
+            limits=httpx.Limits(max_connections=HTTP_MAX_CONNECTIONS, max_keepalive_connections=HTTP_MAX_KEEPALIVE),
+            headers={"User-Agent": USER_AGENT},
+        )
+    return _client
+
+
+def get_loop() -> asyncio.AbstractEventLoop:
+    """Event loop compartido, iniciado en un hilo daemon la primera vez que se usa."""
+    global _loop
+    with _loop_lock:
+        if _loop is None:
+            _loop = asyncio.new_event_loop()
+            threading.Thread(target=_loop.run_forever, name="http-client-loop", daemon=True).start()
+    return _loop
+
+
+def run(coro):
+    """Ejecuta una corrutina en el loop compartido y espera su resultado (para código síncrono)."""
+    return asyncio.run_coroutine_threadsafe(coro, get_loop()).result()
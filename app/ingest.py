@@ -0,0 +1,151 @@
+import asyncio
+import os
+
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from . import crud, dedup, events, jobs, metrics, models
+
+# Ingesta de archivos CSV/XLSX en streaming.
+#
+# El archivo se lee por bloques (CSV con `chunksize`, XLSX con el iterador de
+# filas de openpyxl en modo read-only). Cada bloque se inserta y se encola en
+# cuanto se parsea, y el progreso queda registrado en la tabla `uploads`, de
+# modo que la memoria usada no depende del tamaño del archivo.
+
+UPLOAD_CHUNK_SIZE = int(os.getenv("UPLOAD_CHUNK_SIZE", "5000"))
+
+ADDRESS_COLUMNS = ['direccion', 'address', 'Dirección', 'Address']
+
+
+class MissingAddressColumnError(ValueError):
+    """El archivo no tiene ninguna de las columnas de dirección reconocidas."""
+
+    def __init__(self):
+        super().__init__("El archivo debe contener una columna llamada 'direccion' o 'address'.")
+
+
+def find_address_column(columns) -> str | None:
+    """Devuelve la primera columna de dirección reconocida, en orden de prioridad."""
+    columns = list(columns)
+    for col in ADDRESS_COLUMNS:
+        if col in columns:
+            return col
+    return None
+
+
+def _clean(value) -> str | None:
+    """
+    Descarta celdas vacías y las que superan `models.MAX_ADDRESS_BYTES` (no
+    caben en el índice único y abortarían el bloque); el resto se convierte a texto.
+    """
+    if value is None:
+        return None
+    text = str(value).strip()
+    if not text or models.address_too_long(text):
+        return None
+    return text
+
+
+def iter_csv_chunks(fileobj, chunk_size: int = UPLOAD_CHUNK_SIZE):
+    """Lee un CSV por bloques. Devuelve pares (filas leídas, direcciones no vacías)."""
+    import pandas as pd
+
+    address_col = None
+    for df in pd.read_csv(fileobj, chunksize=chunk_size, dtype=str, keep_default_na=False):
+        if address_col is None:
+            address_col = find_address_column(df.columns)
+            if address_col is None:
+                raise MissingAddressColumnError()
+        values = [_clean(value) for value in df[address_col]]
+        yield len(df), [value for value in values if value]
+
+
+def iter_xlsx_chunks(fileobj, chunk_size: int = UPLOAD_CHUNK_SIZE):
+    """Lee la primera hoja de un XLSX fila a fila (read-only). Mismo formato que `iter_csv_chunks`."""
+    from openpyxl import load_workbook
+
+    workbook = load_workbook(fileobj, read_only=True, data_only=True)
+    try:
+        rows = workbook.worksheets[0].iter_rows(values_only=True)
+        header = next(rows, None) or ()
+        address_col = find_address_column(header)
+        if address_col is None:
+            raise MissingAddressColumnError()
+        index = list(header).index(address_col)
+
+        rows_read = 0
+        chunk = []
+        for row in rows:
+            rows_read += 1
+            value = _clean(row[index]) if index < len(row) else None
+            if value:
+                chunk.append(value)
+            if rows_read == chunk_size:
+                yield rows_read, chunk
+                rows_read, chunk = 0, []
+        if rows_read:
+            yield rows_read, chunk
+    finally:
+        workbook.close()
+
+
+def iter_file_chunks(filename: str, fileobj, chunk_size: int = UPLOAD_CHUNK_SIZE):
+    """Elige el lector según la extensión del archivo."""
+    if filename.endswith('.xlsx'):
+        return iter_xlsx_chunks(fileobj, chunk_size)
+    return iter_csv_chunks(fileobj, chunk_size)
+
+
+def ingest_chunk(db: Session, upload: models.Upload, rows_read: int, addresses: list[str]) -> dict:
+    """
+    Inserta y encola un bloque y suma su progreso a la subida. Devuelve
+    {dirección: ID} de las direcciones creadas.
+    """
+    with metrics.track("upload_write", items=len(addresses)):
+        # Deduplica dentro del bloque; entre bloques lo resuelve ON CONFLICT
+        created = crud.bulk_create_addresses(db, list(dict.fromkeys(addresses)), upload_id=upload.id)
+        new_ids = list(created.values())
+        # Las variantes de direcciones ya conocidas no se procesan de nuevo
+        jobs.enqueue_addresses(db, dedup.link_near_duplicates(db, new_ids))
+    # Los eventos salen con el commit del progreso
+    events.publish_address_changes(db, new_ids)
+    events.publish_upload_progress(db, upload.id, commit=False)
+    crud.update_upload_progress(
+        db,
+        upload,
+        rows_found=rows_read,
+        created=len(new_ids),
+        skipped=len(addresses) - len(new_ids),
+    )
+    return created
+
+
+async def ingest_chunks_async(db: AsyncSession, upload: models.Upload, chunks) -> models.Upload:
+    """
+    Inserta y encola cada bloque a medida que se lee, actualizando el progreso
+    de la subida. Las direcciones ya existentes se cuentan como omitidas.
+
+    La lectura y el parseo de cada bloque (pandas/openpyxl) corren en un hilo,
+    y las escrituras usan la sesión asíncrona, de modo que una subida grande
+    no bloquea la API.
+    """
+    chunks = iter(chunks)
+
+    def read_chunk():
+        with metrics.track("upload_parse"):
+            return next(chunks, None)
+
+    try:
+        while (chunk := await asyncio.to_thread(read_chunk)) is not None:
+            rows_read, addresses = chunk
+            await db.run_sync(ingest_chunk, upload, rows_read, addresses)
+    except Exception as e:
+        await db.rollback()
+        await db.run_sync(crud.finish_upload, upload, models.UploadStatus.FAILED, error=str(e))
+        await db.run_sync(events.publish_upload_progress, upload.id)
+        raise
+
+    upload = await db.run_sync(crud.finish_upload, upload, models.UploadStatus.COMPLETED)
+    await db.run_sync(events.publish_upload_progress, upload.id)
+    return upload
@@ -0,0 +1,259 @@
+import os
+import random
+import threading
+import uuid
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import exists, func, insert, literal, select, update
+from sqlalchemy.orm import Session
+
+from . import models
+from .database import SessionLocal
+
+# Cola de tareas persistente sobre PostgreSQL.
+#
+# Los workers reclaman tareas con SELECT ... FOR UPDATE SKIP LOCKED, de modo
+# que varios hilos, procesos o máquinas pueden consumir la misma cola sin
+# bloquearse entre sí. Una tarea reclamada queda "invisible" hasta
+# `locked_until`; si el worker muere, vuelve a la cola al vencer ese plazo.
+
+JOB_PROCESS_ADDRESS = "process_address"
+JOB_RUN_BATCH = "run_batch"
+
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "5"))
+JOB_VISIBILITY_TIMEOUT = float(os.getenv("JOB_VISIBILITY_TIMEOUT", "300"))
+JOB_BACKOFF_BASE = float(os.getenv("JOB_BACKOFF_BASE", "10"))
+JOB_BACKOFF_MAX = float(os.getenv("JOB_BACKOFF_MAX", "3600"))
+# Cada cuánto renueva su plazo una tarea larga (ver `heartbeat`)
+JOB_HEARTBEAT_INTERVAL = JOB_VISIBILITY_TIMEOUT / 3
+
+
+def enqueue_addresses(db: Session, address_ids: list[uuid.UUID]):
+    """Crea una tarea de procesamiento por cada dirección, en una sola sentencia."""
+    if not address_ids:
+        return
+    db.execute(
+        insert(models.Job),
+        [
+            {"kind": JOB_PROCESS_ADDRESS, "address_id": address_id, "max_attempts": JOB_MAX_ATTEMPTS}
+            for address_id in address_ids
+        ],
+    )
+    db.commit()
+
+
+def enqueue_batch(db: Session, batch_id: uuid.UUID):
+    """Encola la ejecución de un procesamiento por lotes."""
+    db.execute(
+        insert(models.Job),
+        [{"kind": JOB_RUN_BATCH, "batch_id": batch_id, "max_attempts": JOB_MAX_ATTEMPTS}],
+    )
+    db.commit()
+
+
+def claim_jobs(db: Session, worker_id: str, limit: int, kind: str | None = None) -> list:
+    """
+    Reclama hasta `limit` tareas pendientes para este worker (solo del tipo
+    `kind`, si se indica).
+    Devuelve filas con (id, kind, address_id, batch_id, attempts, max_attempts).
+    """
+    now = func.now()
+    conditions = [models.Job.status == models.JobStatus.PENDING, models.Job.run_after <= now]
+    if kind is not None:
+        conditions.append(models.Job.kind == kind)
+    candidates = (
+        select(models.Job.id)
+        .where(*conditions)
+        .order_by(models.Job.run_after)
+        .limit(limit)
+        .with_for_update(skip_locked=True)
+    )
+    stmt = (
+        update(models.Job)
+        .where(models.Job.id.in_(candidates.scalar_subquery()))
+        .values(
+            status=models.JobStatus.RUNNING,
+            attempts=models.Job.attempts + 1,
+            locked_by=worker_id,
+            locked_until=now + timedelta(seconds=JOB_VISIBILITY_TIMEOUT),
+            updated_at=now,
+        )
+        .returning(
+            models.Job.id,
+            models.Job.kind,
+            models.Job.address_id,
+            models.Job.batch_id,
+            models.Job.attempts,
+            models.Job.max_attempts,
+        )
+        .execution_options(synchronize_session=False)
+    )
+    rows = db.execute(stmt).all()
+    db.commit()
+    return rows
+
+
+def extend_lock(db: Session, job_id: int):
+    """Renueva el plazo de visibilidad de una tarea larga (heartbeat). No hace commit."""
+    db.execute(
+        update(models.Job)
+        .where(models.Job.id == job_id)
+        .values(locked_until=func.now() + timedelta(seconds=JOB_VISIBILITY_TIMEOUT), updated_at=func.now())
+        .execution_options(synchronize_session=False)
+    )
+
+
+@contextmanager
+def heartbeat(job_id: int, interval: float = JOB_HEARTBEAT_INTERVAL):
+    """
+    Renueva el plazo de visibilidad de la tarea desde un hilo, con su propia
+    sesión, mientras dura el bloque: un paso largo (p. ej. un bloque de un lote
+    geocodificado a 1 req/s) no la devuelve a la cola y no la ejecutan dos workers.
+    """
+    stop = threading.Event()
+
+    def beat():
+        while not stop.wait(interval):
+            try:
+                with SessionLocal() as db:
+                    extend_lock(db, job_id)
+                    db.commit()
+            except Exception as e:
+                print(f"[JOBS] Error al renovar el plazo de la tarea {job_id}: {e}")
+
+    thread = threading.Thread(target=beat, name=f"heartbeat-{job_id}", daemon=True)
+    thread.start()
+    try:
+        yield
+    finally:
+        stop.set()
+        thread.join()
+
+
+def complete_jobs(db: Session, job_ids: list[int], commit: bool = True):
+    """Marca las tareas como terminadas."""
+    if not job_ids:
+        return
+    db.execute(
+        update(models.Job)
+        .where(models.Job.id.in_(job_ids))
+        .values(status=models.JobStatus.DONE, locked_until=None, last_error=None, updated_at=func.now())
+        .execution_options(synchronize_session=False)
+    )
+    if commit:
+        db.commit()
+
+
+def backoff_delay(attempts: int) -> float:
+    """Backoff exponencial con jitter, acotado por JOB_BACKOFF_MAX."""
+    delay = min(JOB_BACKOFF_MAX, JOB_BACKOFF_BASE * 2 ** max(attempts - 1, 0))
+    return delay * random.uniform(0.5, 1.0)
+
+
+def fail_job(db: Session, job, error: str):
+    """
+    Registra el fallo de una tarea: la reprograma con backoff o, si agotó sus
+    intentos, la pasa al estado `dead`.
+    """
+    values = {"last_error": error[:2000], "locked_until": None, "updated_at": func.now()}
+    if job.attempts >= job.max_attempts:
+        values["status"] = models.JobStatus.DEAD
+        print(f"[JOBS] Tarea {job.id} agotó sus {job.max_attempts} intentos: {error}")
+    else:
+        values["status"] = models.JobStatus.PENDING
+        values["run_after"] = datetime.now(timezone.utc) + timedelta(seconds=backoff_delay(job.attempts))
+
+    db.execute(
+        update(models.Job)
+        .where(models.Job.id == job.id)
+        .values(**values)
+        .execution_options(synchronize_session=False)
+    )
+    db.commit()
+
+
+def requeue_expired_jobs(db: Session) -> int:
+    """Devuelve a la cola las tareas cuyo worker no terminó dentro del plazo de visibilidad."""
+    expired = (
+        (models.Job.status == models.JobStatus.RUNNING)
+        & (models.Job.locked_until < func.now())
+    )
+    dead = db.execute(
+        update(models.Job)
+        .where(expired, models.Job.attempts >= models.Job.max_attempts)
+        .values(status=models.JobStatus.DEAD, last_error="visibility timeout", locked_until=None)
+        .execution_options(synchronize_session=False)
+    ).rowcount
+    requeued = db.execute(
+        update(models.Job)
+        .where(expired)
+        .values(status=models.JobStatus.PENDING, run_after=func.now(), locked_until=None)
+        .execution_options(synchronize_session=False)
+    ).rowcount
+    db.commit()
+    if requeued or dead:
+        print(f"[JOBS] {requeued} tareas vencidas devueltas a la cola, {dead} pasadas a 'dead'.")
+    return requeued
+
+
+def release_variants(db: Session, canonical_ids: list[uuid.UUID] | None = None) -> list[uuid.UUID]:
+    """
+    Desenlaza las variantes pendientes de direcciones canónicas cuya tarea
+    quedó `dead` (sin otra en curso), para que se procesen por su cuenta: de
+    lo contrario esperarían para siempre un resultado que no va a llegar.
+    Sin `canonical_ids` revisa todas. Devuelve los IDs liberados; no hace commit.
+    """
+    live = exists().where(
+        models.Job.address_id == models.Address.canonical_id,
+        models.Job.status.in_([models.JobStatus.PENDING, models.JobStatus.RUNNING]),
+    )
+    dead = select(models.Job.address_id).where(
+        models.Job.kind == JOB_PROCESS_ADDRESS, models.Job.status == models.JobStatus.DEAD
+    )
+    stmt = update(models.Address).where(
+        models.Address.status == models.AddressStatus.PENDING,
+        models.Address.canonical_id.in_(dead.scalar_subquery()),
+        ~live,
+    )
+    if canonical_ids is not None:
+        stmt = stmt.where(models.Address.canonical_id.in_(canonical_ids))
+    released = db.execute(
+        stmt.values(canonical_id=None).returning(models.Address.id).execution_options(synchronize_session=False)
+    ).scalars().all()
+    if released:
+        print(f"[JOBS] {len(released)} variantes de direcciones fallidas se procesarán por su cuenta.")
+    return released
+
+
+def enqueue_orphan_addresses(db: Session) -> int:
+    """
+    Encola las direcciones en estado `pending` que no tienen ninguna tarea
+    (por ejemplo, creadas justo antes de una caída del servidor), incluidas
+    las variantes que se desenlazan de una canónica fallida.
+    """
+    release_variants(db)
+    orphans = select(
+        models.Address.id,
+        literal(JOB_PROCESS_ADDRESS),
+        literal(models.JobStatus.PENDING, type_=models.Job.status.type),
+        literal(0),
+        literal(JOB_MAX_ATTEMPTS),
+    ).where(
+        models.Address.status == models.AddressStatus.PENDING,
+        models.Address.canonical_id.is_(None),  # Las variantes esperan a su canónica
+        ~exists().where(models.Job.address_id == models.Address.id),
+    )
+    result = db.execute(
+        insert(models.Job).from_select(["address_id", "kind", "status", "attempts", "max_attempts"], orphans)
+    )
+    db.commit()
+    if result.rowcount:
+        print(f"[JOBS] {result.rowcount} direcciones pendientes sin tarea fueron encoladas.")
+    return result.rowcount
+
+
+def queue_depth(db: Session) -> dict:
+    """Cantidad de tareas por estado."""
+    rows = db.execute(select(models.Job.status, func.count()).group_by(models.Job.status)).all()
+    return {status.value: count for status, count in rows}
@@ -0,0 +1,318 @@
+"""
+Geocodificador local para el área metropolitana de Medellín.
+
+Resuelve direcciones colombianas "Calle X # Y-Z" sin salir a la red: busca la
+intersección de la vía principal (Calle X) con la vía cruzada (Carrera Y) en
+un índice precalculado a partir de un extracto de OpenStreetMap, y avanza Z
+metros por la vía principal hacia la siguiente intersección.
+
+El índice es un directorio con arreglos de numpy que se abren con
+memory-mapping (arranque casi instantáneo, páginas compartidas entre procesos):
+
+    streets.json      nombres canónicos de vías y códigos postales
+    keys.npy          int64, clave (vía principal << 32 | vía cruzada), ordenado
+    points.npy        float64 (N, 2), latitud y longitud de cada intersección
+    postcodes.npy     int32, índice en la lista de códigos postales (-1 si no hay)
+
+Para construirlo (requiere el paquete opcional `osmium`):
+
+    python -m app.local_geocoder build medellin.osm.pbf data/geocoder
+"""
+import argparse
+import json
+import math
+import os
+import re
+import threading
+from pathlib import Path
+
+from . import normalizer
+
+LOCAL_GEOCODER_INDEX = os.getenv("LOCAL_GEOCODER_INDEX")
+LOCAL_GEOCODER_MIN_CONFIDENCE = float(os.getenv("LOCAL_GEOCODER_MIN_CONFIDENCE", "0.6"))
+
+# Tipos de vía que cruzan a cada tipo de vía principal, en orden de preferencia
+CROSS_VIA_TYPES = {
+    "Calle": ("Carrera", "Transversal"),
+    "Diagonal": ("Carrera", "Transversal"),
+    "Carrera": ("Calle", "Diagonal"),
+    "Transversal": ("Calle", "Diagonal"),
+    "Circular": ("Carrera", "Calle", "Transversal", "Diagonal"),
+    "Autopista": ("Calle", "Carrera"),
+}
+
+_EARTH_RADIUS_M = 6_371_000.0
+_NUMBER_RE = re.compile(r"(\d+)([a-z]*)")
+
+
+def _pair_key(primary_id: int, cross_id: int) -> int:
+    return (primary_id << 32) | cross_id
+
+
+def _distance_m(a, b) -> float:
+    """Distancia aproximada (equirectangular) en metros; suficiente para una cuadra."""
+    lat = math.radians((a[0] + b[0]) / 2)
+    dx = math.radians(b[1] - a[1]) * math.cos(lat)
+    dy = math.radians(b[0] - a[0])
+    return _EARTH_RADIUS_M * math.hypot(dx, dy)
+
+
+def _number_order(street_key: str) -> tuple:
+    """Orden de numeración de una vía ("carrera 43a" -> (43, "a")) para hallar la siguiente."""
+    parts = street_key.split(" ", 1)
+    match = _NUMBER_RE.match(parts[1]) if len(parts) > 1 else None
+    if not match:
+        return (math.inf, "")
+    return (int(match.group(1)), match.group(2))
+
+
+class LocalGeocoder:
+    """Índice de intersecciones en memoria (memory-mapped) con interpolación por placa."""
+
+    def __init__(self, index_dir: str):
+        # numpy solo se importa si hay índice: la API y los workers sin índice no lo cargan
+        import numpy as np
+
+        path = Path(index_dir)
+        meta = json.loads((path / "streets.json").read_text(encoding="utf-8"))
+        self.streets: list[str] = meta["streets"]
+        self.postcodes: list[str] = meta["postcodes"]
+        self.street_ids = {name: index for index, name in enumerate(self.streets)}
+        self.keys = np.load(path / "keys.npy", mmap_mode="r")
+        self.points = np.load(path / "points.npy", mmap_mode="r")
+        self.postcode_ids = np.load(path / "postcodes.npy", mmap_mode="r")
+
+    def _find(self, primary_id: int, cross_id: int) -> int | None:
+        key = _pair_key(primary_id, cross_id)
+        position = int(self.keys.searchsorted(key))
+        if position < len(self.keys) and self.keys[position] == key:
+            return position
+        return None
+
+    def _crossings(self, primary_id: int) -> range:
+        """Posiciones de todas las intersecciones de una vía (son contiguas en el índice)."""
+        start = int(self.keys.searchsorted(_pair_key(primary_id, 0)))
+        end = int(self.keys.searchsorted(_pair_key(primary_id + 1, 0)))
+        return range(start, end)
+
+    def _next_crossing(self, primary_id: int, cross_key: str) -> int | None:
+        """Intersección con la siguiente vía cruzada del mismo tipo (Carrera 43 -> Carrera 43A/44)."""
+        via = cross_key.split(" ", 1)[0]
+        current = _number_order(cross_key)
+        best, best_order = None, None
+        for position in self._crossings(primary_id):
+            other = self.streets[int(self.keys[position]) & 0xFFFFFFFF]
+            if not other.startswith(via + " "):
+                continue
+            order = _number_order(other)
+            if order > current and (best_order is None or order < best_order):
+                best, best_order = position, order
+        return best
+
+    def geocode(self, address: str) -> dict | None:
+        """
+        Geocodifica una dirección. Devuelve latitude, longitude, postal_code,
+        suggested_address y confidence, o None si no se puede resolver.
+        """
+        components = normalizer.parse_street_components(address)
+        if not components:
+            return None
+        primary_id = self.street_ids.get(components["primary_key"])
+        if primary_id is None:
+            return None
+
+        confidence = 0.9
+        position = cross_key = None
+        for cross_via in CROSS_VIA_TYPES.get(components["via"], ()):
+            candidates = [normalizer.street_key(cross_via, components["cross_number"], components["cross_quadrant"])]
+            # Si "Carrera 43A" no existe en el índice, se aproxima con "Carrera 43"
+            base_number = _NUMBER_RE.match(components["cross_number"]).group(1)
+            if base_number != components["cross_number"]:
+                candidates.append(normalizer.street_key(cross_via, base_number, components["cross_quadrant"]))
+            for index, candidate in enumerate(candidates):
+                cross_id = self.street_ids.get(candidate)
+                if cross_id is not None:
+                    position = self._find(primary_id, cross_id)
+                    if position is not None:
+                        cross_key = candidate
+                        confidence -= 0.2 * index
+                        break
+            if position is not None:
+                break
+        if position is None:
+            return None
+
+        corner = self.points[position]
+        latitude, longitude = float(corner[0]), float(corner[1])
+
+        # Interpolación: la placa son los metros desde la esquina hacia la siguiente vía cruzada
+        next_position = self._next_crossing(primary_id, cross_key)
+        if next_position is not None:
+            target = self.points[next_position]
+            block_length = _distance_m(corner, target)
+            if block_length > 0:
+                fraction = min(components["plate"] / block_length, 0.95)
+                latitude += (float(target[0]) - latitude) * fraction
+                longitude += (float(target[1]) - longitude) * fraction
+        else:
+            confidence -= 0.2
+
+        postcode_id = int(self.postcode_ids[position])
+        return {
+            "latitude": latitude,
+            "longitude": longitude,
+            "suggested_address": f"{components['street_info']}, Medellín, Antioquia, Colombia",
+            "postal_code": self.postcodes[postcode_id] if postcode_id >= 0 else None,
+            "confidence": round(confidence, 2),
+        }
+
+
+_geocoder: LocalGeocoder | None = None
+_geocoder_lock = threading.Lock()
+_geocoder_loaded = False
+
+
+def get_local_geocoder() -> LocalGeocoder | None:
+    """Carga el índice una sola vez por proceso. Devuelve None si no está configurado."""
+    global _geocoder, _geocoder_loaded
+    if not _geocoder_loaded:
+        with _geocoder_lock:
+            if not _geocoder_loaded:
+                if LOCAL_GEOCODER_INDEX:
+                    try:
+                        _geocoder = LocalGeocoder(LOCAL_GEOCODER_INDEX)
+                    except (OSError, ValueError, KeyError) as e:
+                        print(f"ADVERTENCIA: No se pudo cargar el índice del geocodificador local: {e}")
+                _geocoder_loaded = True
+    return _geocoder
+
+
+def geocode(address: str) -> dict | None:
+    """Geocodifica con el índice local si está disponible y el resultado es confiable."""
+    geocoder = get_local_geocoder()
+    if geocoder is None or not address:
+        return None
+    result = geocoder.geocode(address)
+    if result is None or result["confidence"] < LOCAL_GEOCODER_MIN_CONFIDENCE:
+        return None
+    return result
+
+
+# --- Construcción del índice ---
+
+HIGHWAY_TYPES = {
+    "motorway", "trunk", "primary", "secondary", "tertiary", "unclassified",
+    "residential", "living_street", "service", "pedestrian",
+    "motorway_link", "trunk_link", "primary_link", "secondary_link", "tertiary_link",
+}
+NAME_TAGS = ("name", "alt_name", "official_name", "old_name", "ref")
+
+
+STREET_NAME_RE = re.compile(
+    rf"""
+    (?:(?:{normalizer._AVENUE_ALT})\.?\s*)?
+    (?P<via>{normalizer._VIA_ALT})\.?\s*
+    (?P<num>\d{{1,3}})\s*(?P<let>[a-h]{{1,2}})?
+    (?:\s*(?P<bis>bis))?
+    (?:\s*(?P<quad>{normalizer._QUADRANT}))?
+    """,
+    re.IGNORECASE | re.VERBOSE,
+)
+
+
+def _street_keys_from_tags(tags) -> set[str]:
+    """Claves canónicas de una vía OSM a partir de sus nombres ("Calle 10 Sur", "Carrera 43A"...)."""
+    keys = set()
+    for tag in NAME_TAGS:
+        value = tags.get(tag)
+        if not value:
+            continue
+        for name in value.split(";"):
+            match = STREET_NAME_RE.fullmatch(" ".join(name.split()).translate(normalizer._FOLD))
+            if match:
+                number = match["num"] + (match["let"] or "") + (" bis" if match["bis"] else "")
+                keys.add(normalizer.street_key(match["via"], number, match["quad"]))
+    return keys
+
+
+def build_index(osm_file: str, output_dir: str):
+    """Construye el índice de intersecciones a partir de un extracto OSM (.osm.pbf)."""
+    import numpy as np
+    import osmium
+
+    street_ids: dict[str, int] = {}
+    postcodes: dict[str, int] = {}
+    node_streets: dict[int, set[int]] = {}
+    node_points: dict[int, tuple[float, float]] = {}
+    street_postcode: dict[int, int] = {}
+
+    class StreetHandler(osmium.SimpleHandler):
+        def way(self, way):
+            if way.tags.get("highway") not in HIGHWAY_TYPES:
+                return
+            keys = _street_keys_from_tags(way.tags)
+            if not keys:
+                return
+            ids = [street_ids.setdefault(key, len(street_ids)) for key in keys]
+            postcode = way.tags.get("postal_code") or way.tags.get("addr:postcode")
+            if postcode:
+                for street_id in ids:
+                    street_postcode.setdefault(street_id, postcodes.setdefault(postcode, len(postcodes)))
+            for node in way.nodes:
+                if not node.location.valid():
+                    continue
+                node_streets.setdefault(node.ref, set()).update(ids)
+                node_points[node.ref] = (node.location.lat, node.location.lon)
+
+    StreetHandler().apply_file(osm_file, locations=True)
+
+    # Una intersección es un nodo compartido por vías distintas; se guardan ambos sentidos
+    pairs: dict[int, tuple[float, float, int]] = {}
+    for node_id, ids in node_streets.items():
+        if len(ids) < 2:
+            continue
+        point = node_points[node_id]
+        for primary_id in ids:
+            for cross_id in ids:
+                if primary_id != cross_id:
+                    postcode = street_postcode.get(primary_id, street_postcode.get(cross_id, -1))
+                    pairs.setdefault(_pair_key(primary_id, cross_id), (point[0], point[1], postcode))
+
+    keys = np.array(sorted(pairs), dtype=np.int64)
+    points = np.array([pairs[key][:2] for key in keys.tolist()], dtype=np.float64).reshape(-1, 2)
+    postcode_ids = np.array([pairs[key][2] for key in keys.tolist()], dtype=np.int32)
+
+    path = Path(output_dir)
+    path.mkdir(parents=True, exist_ok=True)
+    streets = sorted(street_ids, key=street_ids.get)
+    (path / "streets.json").write_text(
+        json.dumps({"streets": streets, "postcodes": sorted(postcodes, key=postcodes.get)}, ensure_ascii=False),
+        encoding="utf-8",
+    )
+    np.save(path / "keys.npy", keys)
+    np.save(path / "points.npy", points)
+    np.save(path / "postcodes.npy", postcode_ids)
+    print(f"Índice construido: {len(streets)} vías, {len(keys)} intersecciones en {path}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Geocodificador local de GeoFull.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    build = subparsers.add_parser("build", help="Construye el índice a partir de un extracto OSM.")
+    build.add_argument("osm_file")
+    build.add_argument("output_dir")
+
+    query = subparsers.add_parser("query", help="Geocodifica una dirección con un índice existente.")
+    query.add_argument("index_dir")
+    query.add_argument("address")
+
+    args = parser.parse_args()
+    if args.command == "build":
+        build_index(args.osm_file, args.output_dir)
+    else:
+        print(json.dumps(LocalGeocoder(args.index_dir).geocode(args.address), ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
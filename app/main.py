@@ -1,23 +1,67 @@
+import asyncio
+import os
+import time
 import uuid
-import pandas as pd
-import io
-from fastapi import BackgroundTasks, Depends, FastAPI, HTTPException, File, UploadFile
+from contextlib import asynccontextmanager
+from datetime import datetime
+from fastapi import Depends, FastAPI, HTTPException, File, Query, Request, Response, UploadFile
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 from starlette.responses import StreamingResponse
 
-from . import crud, models, schemas, processing
-from .database import SessionLocal, engine
+from . import batch, bulk, crud, dedup, events, export, ingest, jobs, metrics, migrate, models, processing, schemas, spatial
+from .database import AsyncSessionLocal, SessionLocal
+
+# El esquema se aplica con `python -m app.migrate`; con DB_AUTO_MIGRATE=true,
+# también al arrancar (cómodo en desarrollo, no con varias réplicas a la vez)
+DB_AUTO_MIGRATE = os.getenv("DB_AUTO_MIGRATE", "false").lower() in ("1", "true", "yes")
+# La API no parsea direcciones: el modelo de IA se carga en los workers
+API_PRELOAD_AI = os.getenv("API_PRELOAD_AI", "false").lower() in ("1", "true", "yes")
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """
+    Arranque y apagado de la API. Importar `app.main` no abre conexiones ni
+    carga dependencias pesadas: todo se inicializa aquí una sola vez.
+    """
+    start = time.perf_counter()
+    events.broker.check_driver()
+    if DB_AUTO_MIGRATE:
+        await asyncio.to_thread(migrate.upgrade)
+    await asyncio.to_thread(processing.init_clients, API_PRELOAD_AI)
+    print(f"[STARTUP] API lista en {time.perf_counter() - start:.3f}s")
+    yield
+    events.broker.stop()
 
-# Crea la tabla en la base de datos si no existe.
-# Nota: Para producción, es mejor usar un sistema de migraciones como Alembic.
-models.Base.metadata.create_all(bind=engine)
 
 app = FastAPI(
     title="GeoFull API",
     description="Backend para normalización y geocodificación de direcciones.",
     version="0.1.0",
+    lifespan=lifespan,
 )
 
+
+@app.middleware("http")
+async def instrument_requests(request: Request, call_next):
+    """
+    Mide la latencia de cada petición por ruta. Con PROFILING_ENABLED=true y la
+    cabecera `X-Profile: 1`, la petición se perfila (solo el hilo del event loop).
+    """
+    start = time.perf_counter()
+    status = 500
+    try:
+        with metrics.maybe_profile(request.headers.get("X-Profile") == "1", f"{request.method} {request.url.path}"):
+            response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        route = request.scope.get("route")
+        metrics.HTTP_REQUEST_DURATION.labels(
+            request.method, route.path if route else "unmatched", str(status)
+        ).observe(time.perf_counter() - start)
+
 # --- Dependencias ---
 
 def get_db():
@@ -29,6 +73,31 @@ def get_db():
         db.close()
 
 
+async def get_async_db():
+    """
+    Dependencia para los endpoints `async def`: sesión asíncrona (asyncpg).
+    Las funciones de `crud` se ejecutan con `run_sync` sin bloquear el event loop.
+    """
+    async with AsyncSessionLocal() as db:
+        yield db
+
+
+def _snapshot(function, *args):
+    """Corrutina que consulta el progreso con una sesión propia (el stream dura más que la petición)."""
+    async def snapshot():
+        async with AsyncSessionLocal() as db:
+            return await db.run_sync(function, *args)
+    return snapshot
+
+
+def _event_stream_response(request: Request, scope: str, snapshot) -> StreamingResponse:
+    return StreamingResponse(
+        events.stream(request, scope, snapshot),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
 # --- Endpoints ---
 
 @app.get("/")
@@ -36,17 +105,28 @@ def read_root():
     return {"project": "GeoFull API", "status": "ok"}
 
 
+@app.get("/metrics", tags=["Utilities"], include_in_schema=False)
+def metrics_endpoint():
+    """
+    Métricas en formato Prometheus: latencia y resultados por etapa, cachés,
+    cola de tareas y proveedores externos.
+    """
+    if not metrics.is_available():
+        raise HTTPException(status_code=501, detail="Las métricas requieren el paquete 'prometheus_client'.")
+    body, content_type = metrics.render()
+    return Response(content=body, media_type=content_type)
+
+
 @app.post("/addresses/", response_model=schemas.Address, tags=["Addresses"])
 def create_address_endpoint(
     address: schemas.AddressCreate, 
-    background_tasks: BackgroundTasks,
     db: Session = Depends(get_db)
 ):
     """
-    Crea una nueva dirección y lanza el pipeline de procesamiento en segundo plano.
+    Crea una nueva dirección y encola su procesamiento.
     
     La respuesta es inmediata, y el procesamiento (normalización y geocodificación)
-    ocurre automáticamente.
+    lo realizan los workers (`python -m app.worker`).
     """
     db_address = crud.get_address_by_original_address(db, original_address=address.original_address)
     if db_address:
@@ -54,34 +134,183 @@ def create_address_endpoint(
     
     new_address = crud.create_address(db=db, address=address)
     
-    # Añade el pipeline de procesamiento como una tarea en segundo plano
-    background_tasks.add_task(processing.run_processing_pipeline, address_id=new_address.id)
+    # Encola el pipeline de procesamiento en la cola persistente, salvo que
+    # sea una variante de una dirección conocida (reutiliza su resultado)
+    jobs.enqueue_addresses(db, dedup.link_near_duplicates(db, [new_address.id]))
+    db.refresh(new_address)
     
-    print(f"Address {new_address.id} created. Processing task added to background.")
+    print(f"Address {new_address.id} created. Processing job enqueued.")
     
     return new_address
 
 
+@app.post("/addresses/bulk", tags=["Addresses"])
+async def bulk_create_addresses_endpoint(
+    request: Request,
+    upload_id: uuid.UUID | None = None,
+    db: AsyncSession = Depends(get_async_db),
+):
+    """
+    Crea direcciones en masa a partir de un cuerpo NDJSON (`application/x-ndjson`)
+    o un arreglo JSON (`application/json`) de cualquier tamaño. Cada fila es
+    `{"original_address": ..., "external_id": ...}` (`external_id` opcional) o
+    el texto de la dirección.
+
+    Las filas se insertan por bloques a medida que llega el cuerpo, y la
+    respuesta (NDJSON, una línea por fila con `id`, `status` = created |
+    duplicate | error y el `external_id` recibido) se envía en cuanto cada
+    bloque queda guardado. El progreso se registra como una subida: la
+    cabecera `X-Upload-Id` sirve para `GET /uploads/{upload_id}/events`.
+    """
+    content_type = request.headers.get("content-type", "").split(";")[0].strip().lower()
+    if content_type not in bulk.NDJSON_TYPES + bulk.JSON_TYPES:
+        raise HTTPException(status_code=415, detail="Use application/x-ndjson o application/json")
+    if upload_id is not None and await db.run_sync(crud.get_upload, upload_id=upload_id):
+        raise HTTPException(status_code=409, detail="Upload ID already used")
+
+    upload = await db.run_sync(crud.create_upload, filename="bulk", upload_id=upload_id)
+    return bulk.BulkStreamingResponse(
+        bulk.stream_results(request, upload.id, content_type),
+        media_type="application/x-ndjson",
+        headers={"X-Upload-Id": str(upload.id), "X-Accel-Buffering": "no"},
+    )
+
+
 @app.get("/addresses/", response_model=list[schemas.Address], tags=["Addresses"])
-def read_addresses_endpoint(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
+async def read_addresses_endpoint(
+    response: Response,
+    limit: int = Query(100, ge=1, le=1000),
+    cursor: str | None = None,
+    status: models.AddressStatus | None = None,
+    neighborhood: str | None = None,
+    postal_code: str | None = None,
+    created_from: datetime | None = None,
+    created_to: datetime | None = None,
+    db: AsyncSession = Depends(get_async_db),
+):
     """
-    Obtiene una lista de direcciones, con paginación.
+    Obtiene una lista de direcciones, de la más reciente a la más antigua.
+
+    Paginación por cursor: si hay más resultados, la cabecera `X-Next-Cursor`
+    trae el valor de `cursor` para pedir la página siguiente.
     """
-    addresses = crud.get_addresses(db, skip=skip, limit=limit)
+    filters = crud.build_address_filters(
+        status=status,
+        neighborhood=neighborhood,
+        postal_code=postal_code,
+        created_from=created_from,
+        created_to=created_to,
+    )
+    try:
+        addresses = await db.run_sync(crud.get_addresses, limit=limit, cursor=cursor, filters=filters)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if len(addresses) == limit:
+        response.headers["X-Next-Cursor"] = crud.encode_cursor(addresses[-1])
+    return addresses
+
+
+@app.get("/addresses/near", response_model=list[schemas.AddressNearby], tags=["Addresses"])
+async def read_addresses_near_endpoint(
+    response: Response,
+    lat: float = Query(..., ge=-90, le=90),
+    lon: float = Query(..., ge=-180, le=180),
+    radius: float = Query(1000, gt=0, le=spatial.MAX_RADIUS_METERS, description="Radio en metros."),
+    limit: int = Query(10, ge=1, le=1000, description="Cantidad de vecinos más cercanos."),
+    cursor: str | None = None,
+    db: AsyncSession = Depends(get_async_db),
+):
+    """
+    Obtiene las direcciones geocodificadas más cercanas a un punto dentro de un
+    radio, de la más cercana a la más lejana, con su distancia en metros.
+
+    La cabecera `X-Next-Cursor` permite pedir los siguientes vecinos.
+    """
+    try:
+        results, next_cursor = await db.run_sync(spatial.find_near, lat, lon, radius, limit=limit, cursor=cursor)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+    return [
+        schemas.AddressNearby(**schemas.Address.model_validate(address).model_dump(), distance_meters=distance)
+        for address, distance in results
+    ]
+
+
+@app.get("/addresses/within", response_model=list[schemas.Address], tags=["Addresses"])
+async def read_addresses_in_bbox_endpoint(
+    response: Response,
+    min_lat: float = Query(..., ge=-90, le=90),
+    min_lon: float = Query(..., ge=-180, le=180),
+    max_lat: float = Query(..., ge=-90, le=90),
+    max_lon: float = Query(..., ge=-180, le=180),
+    limit: int = Query(100, ge=1, le=1000),
+    cursor: str | None = None,
+    db: AsyncSession = Depends(get_async_db),
+):
+    """
+    Obtiene las direcciones geocodificadas dentro de un rectángulo (bounding box).
+
+    Paginación por cursor: la cabecera `X-Next-Cursor` trae la página siguiente.
+    """
+    if min_lat > max_lat or min_lon > max_lon:
+        raise HTTPException(status_code=400, detail="El rectángulo debe cumplir min_lat <= max_lat y min_lon <= max_lon.")
+    try:
+        addresses, next_cursor = await db.run_sync(
+            spatial.find_in_bbox, min_lat, min_lon, max_lat, max_lon, limit=limit, cursor=cursor
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+    return addresses
+
+
+@app.post("/addresses/within/polygon", response_model=list[schemas.Address], tags=["Addresses"])
+async def read_addresses_in_polygon_endpoint(
+    polygon: schemas.PolygonQuery,
+    response: Response,
+    limit: int = Query(100, ge=1, le=1000),
+    cursor: str | None = None,
+    db: AsyncSession = Depends(get_async_db),
+):
+    """
+    Obtiene las direcciones geocodificadas dentro de un polígono (por ejemplo,
+    una zona de entrega), con la misma paginación por cursor.
+    """
+    points = [(point.latitude, point.longitude) for point in polygon.points]
+    try:
+        addresses, next_cursor = await db.run_sync(spatial.find_in_polygon, points, limit=limit, cursor=cursor)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
     return addresses
 
 
 @app.get("/addresses/{address_id}", response_model=schemas.Address, tags=["Addresses"])
-def read_address_endpoint(address_id: uuid.UUID, db: Session = Depends(get_db)):
+async def read_address_endpoint(address_id: uuid.UUID, db: AsyncSession = Depends(get_async_db)):
     """
     Obtiene una dirección específica por su ID.
     """
-    db_address = crud.get_address(db, address_id=address_id)
+    db_address = await db.run_sync(crud.get_address, address_id=address_id)
     if db_address is None:
         raise HTTPException(status_code=404, detail="Address not found")
     return db_address
 
 
+@app.get("/addresses/{address_id}/events", tags=["Addresses"])
+async def address_events_endpoint(address_id: uuid.UUID, request: Request, db: AsyncSession = Depends(get_async_db)):
+    """
+    Stream SSE con los cambios de estado de una dirección (`pending` →
+    `normalized` → `verified`/`failed`); termina con un evento `end`.
+    """
+    if await db.run_sync(crud.get_address, address_id=address_id) is None:
+        raise HTTPException(status_code=404, detail="Address not found")
+    return _event_stream_response(request, f"address:{address_id}", _snapshot(events.address_progress, address_id))
+
+
 @app.put("/addresses/{address_id}", response_model=schemas.Address, tags=["Addresses"])
 def update_address_endpoint(address_id: uuid.UUID, address_update: schemas.AddressUpdate, db: Session = Depends(get_db)):
     """
@@ -108,108 +337,166 @@ def delete_address_endpoint(address_id: uuid.UUID, db: Session = Depends(get_db)
 
 @app.post("/upload", tags=["Files"])
 async def upload_file_endpoint(
-    background_tasks: BackgroundTasks,
     file: UploadFile = File(...), 
-    db: Session = Depends(get_db)
+    upload_id: uuid.UUID | None = None,
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
-    Sube un archivo, crea las nuevas direcciones e inicia su procesamiento en segundo plano.
+    Sube un archivo, crea las nuevas direcciones y encola su procesamiento.
+
+    El archivo se procesa por bloques: cada bloque se inserta y se encola en
+    cuanto se lee. Si el cliente envía su propio `upload_id`, puede consultar
+    el progreso en `GET /uploads/{upload_id}` mientras la subida está en curso.
+
+    El parseo del archivo corre en un hilo aparte y no bloquea otras peticiones.
     """
     if not file.filename.endswith(('.xlsx', '.csv')):
         raise HTTPException(status_code=400, detail="Formato de archivo no soportado. Use .xlsx o .csv")
+    if upload_id is not None and await db.run_sync(crud.get_upload, upload_id=upload_id):
+        raise HTTPException(status_code=409, detail="Upload ID already used")
 
+    upload = await db.run_sync(crud.create_upload, filename=file.filename, upload_id=upload_id)
     try:
-        if file.filename.endswith('.xlsx'):
-            df = pd.read_excel(file.file)
-        else:
-            df = pd.read_csv(file.file)
-
-        address_col = None
-        for col in ['direccion', 'address', 'Dirección', 'Address']:
-            if col in df.columns:
-                address_col = col
-                break
-        
-        if not address_col:
-            raise HTTPException(status_code=400, detail="El archivo debe contener una columna llamada 'direccion' o 'address'.")
-
-        created_count = 0
-        skipped_count = 0
-
-        for address_str in df[address_col].dropna():
-            db_address = crud.get_address_by_original_address(db, original_address=address_str)
-            if db_address:
-                skipped_count += 1
-            else:
-                address_schema = schemas.AddressCreate(original_address=address_str)
-                new_address = crud.create_address(db=db, address=address_schema)
-                created_count += 1
-                # Añade la tarea de procesamiento para la nueva dirección
-                background_tasks.add_task(processing.run_processing_pipeline, address_id=new_address.id)
-
-        return {
-            "message": f"Archivo '{file.filename}' aceptado. Se iniciaron {created_count} nuevas tareas de procesamiento.",
-            "rows_found": len(df),
-            "new_addresses_created": created_count,
-            "addresses_skipped (duplicates)": skipped_count,
-        }
-
+        upload = await ingest.ingest_chunks_async(db, upload, ingest.iter_file_chunks(file.filename, file.file))
+    except ingest.MissingAddressColumnError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
-            raise HTTPException(status_code=500, detail=f"Error al procesar el archivo: {e}")
+        raise HTTPException(status_code=500, detail=f"Error al procesar el archivo: {e}")
+
+    return {
+        "message": f"Archivo '{file.filename}' aceptado. Se iniciaron {upload.new_addresses_created} nuevas tareas de procesamiento.",
+        "upload_id": upload.id,
+        "rows_found": upload.rows_found,
+        "new_addresses_created": upload.new_addresses_created,
+        "addresses_skipped (duplicates)": upload.addresses_skipped,
+    }
 
 
-@app.get("/export/csv", tags=["Utilities"])
-async def export_addresses_to_csv(db: Session = Depends(get_db)):
+@app.get("/uploads/{upload_id}", response_model=schemas.Upload, tags=["Files"])
+async def read_upload_endpoint(upload_id: uuid.UUID, db: AsyncSession = Depends(get_async_db)):
     """
-    Exporta todas las direcciones procesadas a un archivo CSV.
+    Obtiene el progreso de una subida de archivo.
     """
-    addresses = crud.get_all_addresses(db) # Obtiene todas las direcciones
+    db_upload = await db.run_sync(crud.get_upload, upload_id=upload_id)
+    if db_upload is None:
+        raise HTTPException(status_code=404, detail="Upload not found")
+    return db_upload
 
-    # Convierte los objetos SQLAlchemy a diccionarios usando el schema Pydantic
-    # Esto asegura que todos los campos estén presentes y en el formato correcto
-    addresses_data = [
-        schemas.Address.model_validate(addr).model_dump(mode='json') 
-        for addr in addresses
-    ]
 
-    if not addresses_data:
+@app.get("/uploads/{upload_id}/events", tags=["Files"])
+async def upload_events_endpoint(upload_id: uuid.UUID, request: Request, db: AsyncSession = Depends(get_async_db)):
+    """
+    Stream SSE del progreso de una subida: eventos `address` con los cambios
+    de estado de sus direcciones, `progress` con los conteos agregados (como
+    máximo uno por segundo) y `end` cuando ya no queda nada por procesar.
+
+    La subida se registra al empezar `POST /upload?upload_id=...`, así que se
+    puede abrir mientras dura para seguir también la ingesta.
+    """
+    if await db.run_sync(crud.get_upload, upload_id=upload_id) is None:
+        raise HTTPException(status_code=404, detail="Upload not found")
+    return _event_stream_response(request, f"upload:{upload_id}", _snapshot(events.upload_progress, upload_id))
+
+
+@app.post("/batch/normalize", response_model=schemas.Batch, status_code=202, tags=["Processing"])
+async def batch_normalize_endpoint(request: schemas.BatchRequest, db: AsyncSession = Depends(get_async_db)):
+    """
+    Normaliza en lote las direcciones seleccionadas por IDs o filtros.
+
+    El lote lo ejecutan los workers; el progreso se consulta en `GET /batch/{batch_id}`.
+    """
+    return batch.describe_batch(await db.run_sync(batch.create_batch, models.BatchKind.NORMALIZE, request))
+
+
+@app.post("/batch/geocode", response_model=schemas.Batch, status_code=202, tags=["Processing"])
+async def batch_geocode_endpoint(request: schemas.BatchRequest, db: AsyncSession = Depends(get_async_db)):
+    """
+    Geocodifica en lote las direcciones seleccionadas que ya tienen dirección normalizada.
+    """
+    return batch.describe_batch(await db.run_sync(batch.create_batch, models.BatchKind.GEOCODE, request))
+
+
+@app.get("/batch/{batch_id}", response_model=schemas.Batch, tags=["Processing"])
+async def read_batch_endpoint(batch_id: uuid.UUID, db: AsyncSession = Depends(get_async_db)):
+    """
+    Obtiene el progreso y el rendimiento (filas por segundo) de un lote.
+    """
+    db_batch = await db.run_sync(crud.get_batch, batch_id=batch_id)
+    if db_batch is None:
+        raise HTTPException(status_code=404, detail="Batch not found")
+    return batch.describe_batch(db_batch)
+
+
+@app.get("/batch/{batch_id}/events", tags=["Processing"])
+async def batch_events_endpoint(batch_id: uuid.UUID, request: Request, db: AsyncSession = Depends(get_async_db)):
+    """
+    Stream SSE del progreso de un lote: cambios de estado de sus direcciones
+    y el progreso agregado, hasta que el lote termina.
+    """
+    if await db.run_sync(crud.get_batch, batch_id=batch_id) is None:
+        raise HTTPException(status_code=404, detail="Batch not found")
+    return _event_stream_response(request, f"batch:{batch_id}", _snapshot(batch.batch_progress, batch_id))
+
+
+async def _export_response(
+    db: AsyncSession,
+    export_format: str,
+    gzip: bool,
+    status: models.AddressStatus | None,
+    created_from: datetime | None,
+    created_to: datetime | None,
+):
+    if export_format not in export.EXPORT_FORMATS:
+        raise HTTPException(status_code=400, detail="Formato no soportado. Use csv, parquet o xlsx.")
+    if not export.is_format_available(export_format):
+        raise HTTPException(status_code=501, detail="La exportación a Parquet requiere el paquete 'pyarrow'.")
+
+    filters = crud.build_address_filters(status=status, created_from=created_from, created_to=created_to)
+    if not await db.run_sync(crud.addresses_exist, filters):
         raise HTTPException(status_code=404, detail="No hay direcciones para exportar.")
 
-    # Crea un DataFrame de pandas
-    df = pd.DataFrame(addresses_data)
-
-    # Reordena las columnas para que las más importantes estén al principio
-    # y las nuevas columnas de IA sean visibles
-    ordered_columns = [
-        'id',
-        'original_address',
-        'normalized_address',
-        'suggested_address',
-        'latitude',
-        'longitude',
-        'postal_code',
-        'street_info',
-        'neighborhood',
-        'apartment_info',
-        'notes',
-        'status',
-        'created_at',
-        'updated_at',
-    ]
-    # Asegura que todas las columnas existan, si no, las añade al final
-    df = df[ordered_columns + [col for col in df.columns if col not in ordered_columns]]
-
-    # Crea un buffer en memoria para el CSV
-    output = io.StringIO()
-    df.to_csv(output, index=False, encoding='utf-8')
-    output.seek(0)
-
-    # Prepara la respuesta para la descarga del archivo
-    headers = {
-        'Content-Disposition': 'attachment; filename="addresses_export.csv"',
-        'Content-Type': 'text/csv; charset=utf-8',
-    }
-    return StreamingResponse(output, headers=headers, media_type="text/csv")
+    media_type, extension = export.EXPORT_FORMATS[export_format]
+    gzip = gzip and export_format == "csv"  # Parquet y XLSX ya van comprimidos
+    filename = f"addresses_export.{extension}" + (".gz" if gzip else "")
+
+    # Prepara la respuesta para la descarga del archivo. El generador lee con un
+    # cursor del lado del servidor y Starlette lo recorre en su pool de hilos.
+    headers = {'Content-Disposition': f'attachment; filename="{filename}"'}
+    if gzip:
+        media_type = "application/gzip"
+    return StreamingResponse(
+        export.export_stream(export_format, filters, gzip=gzip),
+        headers=headers,
+        media_type=media_type,
+    )
+
+
+@app.get("/export", tags=["Utilities"])
+async def export_addresses(
+    format: str = "csv",
+    gzip: bool = False,
+    status: models.AddressStatus | None = None,
+    created_from: datetime | None = None,
+    created_to: datetime | None = None,
+    db: AsyncSession = Depends(get_async_db),
+):
+    """
+    Exporta las direcciones en CSV, Parquet o XLSX, en streaming y con memoria acotada.
 
+    Permite filtrar por estado y rango de fechas de creación; `gzip=true` comprime el CSV.
+    """
+    return await _export_response(db, format, gzip, status, created_from, created_to)
 
 
+@app.get("/export/csv", tags=["Utilities"])
+async def export_addresses_to_csv(
+    gzip: bool = False,
+    status: models.AddressStatus | None = None,
+    created_from: datetime | None = None,
+    created_to: datetime | None = None,
+    db: AsyncSession = Depends(get_async_db),
+):
+    """
+    Exporta las direcciones procesadas a un archivo CSV.
+    """
+    return await _export_response(db, "csv", gzip, status, created_from, created_to)
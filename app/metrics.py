@@ -0,0 +1,262 @@
+"""
+Métricas de la aplicación en formato Prometheus (`GET /metrics`).
+
+Cada etapa del pipeline (parseo por reglas y por IA, geocodificación,
+lecturas y escrituras en la DB, parseo de subidas, exportación) se mide con
+`track(stage)`: histograma de latencia, contador de resultados
+(success/failure/timeout) y gauge de operaciones en curso. Las llamadas a
+proveedores externos registran además sus reintentos y el estado del
+circuit breaker. El costo por medición es de unos pocos microsegundos.
+
+Depende de `prometheus_client`, que es opcional: sin él, las mediciones no
+hacen nada y `/metrics` responde 501.
+
+Perfilado opcional por petición: con PROFILING_ENABLED=true, las peticiones
+con la cabecera `X-Profile: 1` se ejecutan bajo cProfile y el resumen se
+imprime en el log.
+"""
+import asyncio
+import cProfile
+import io
+import os
+import pstats
+import threading
+import time
+from contextlib import contextmanager
+
+try:
+    import prometheus_client
+    from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily
+except ImportError:  # pragma: no cover - dependencia opcional
+    prometheus_client = None
+
+PROFILING_ENABLED = os.getenv("PROFILING_ENABLED", "false").lower() in ("1", "true", "yes")
+PROFILE_TOP = int(os.getenv("PROFILE_TOP", "30"))
+
+# Límites de los buckets: de 1 ms (caché, reglas) a 2 min (lotes de IA)
+_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+
+def is_available() -> bool:
+    return prometheus_client is not None
+
+
+class _NoopMetric:
+    """Sustituto de las métricas cuando prometheus_client no está instalado."""
+
+    def labels(self, *args, **kwargs):
+        return self
+
+    def observe(self, value):
+        pass
+
+    def inc(self, amount=1):
+        pass
+
+    def dec(self, amount=1):
+        pass
+
+    def set(self, value):
+        pass
+
+
+if prometheus_client is not None:
+    STAGE_DURATION = prometheus_client.Histogram(
+        "geofull_stage_duration_seconds", "Duración de cada etapa del pipeline.", ["stage"], buckets=_BUCKETS
+    )
+    STAGE_RESULTS = prometheus_client.Counter(
+        "geofull_stage_results_total", "Resultados de cada etapa del pipeline.", ["stage", "outcome"]
+    )
+    STAGE_ITEMS = prometheus_client.Counter(
+        "geofull_stage_items_total", "Direcciones procesadas por cada etapa.", ["stage"]
+    )
+    STAGE_IN_FLIGHT = prometheus_client.Gauge(
+        "geofull_stage_in_flight", "Operaciones en curso por etapa.", ["stage"]
+    )
+    PROVIDER_RETRIES = prometheus_client.Counter(
+        "geofull_provider_retries_total", "Reintentos de llamadas a proveedores externos.", ["provider", "reason"]
+    )
+    HTTP_REQUEST_DURATION = prometheus_client.Histogram(
+        "geofull_http_request_duration_seconds", "Duración de las peticiones a la API.",
+        ["method", "route", "status"], buckets=_BUCKETS,
+    )
+    DB_STATEMENTS = prometheus_client.Counter(
+        "geofull_db_statements_total", "Sentencias enviadas a la base de datos (round trips)."
+    )
+    GEOCODER_HEDGES = prometheus_client.Counter(
+        "geofull_geocoder_hedges_total", "Peticiones hedged lanzadas porque el proveedor superó su percentil.", ["provider"]
+    )
+else:
+    STAGE_DURATION = STAGE_RESULTS = STAGE_ITEMS = STAGE_IN_FLIGHT = _NoopMetric()
+    PROVIDER_RETRIES = HTTP_REQUEST_DURATION = DB_STATEMENTS = GEOCODER_HEDGES = _NoopMetric()
+
+
+def _outcome(error: BaseException | None) -> str:
+    if error is None:
+        return "success"
+    if isinstance(error, (TimeoutError, asyncio.TimeoutError)):
+        return "timeout"
+    if isinstance(error, asyncio.CancelledError):
+        return "cancelled"
+    return "failure"
+
+
+@contextmanager
+def track(stage: str, items: int | None = None):
+    """
+    Mide una etapa. Uso:
+
+        with metrics.track("geocode", items=len(addresses)):
+            ...
+    """
+    STAGE_IN_FLIGHT.labels(stage).inc()
+    start = time.perf_counter()
+    error = None
+    try:
+        yield
+    except BaseException as e:
+        error = e
+        raise
+    finally:
+        STAGE_DURATION.labels(stage).observe(time.perf_counter() - start)
+        STAGE_RESULTS.labels(stage, _outcome(error)).inc()
+        STAGE_IN_FLIGHT.labels(stage).dec()
+        if items:
+            STAGE_ITEMS.labels(stage).inc(items)
+
+
+def record_retry(provider: str, error: BaseException):
+    """Cuenta un reintento; los 429 se distinguen como `throttled`."""
+    status = getattr(error, "status_code", None)
+    if status == 429:
+        reason = "throttled"
+    elif isinstance(error, (TimeoutError, asyncio.TimeoutError)):
+        reason = "timeout"
+    else:
+        reason = type(error).__name__
+    PROVIDER_RETRIES.labels(provider, reason).inc()
+
+
+def record_hedge(provider: str):
+    """Cuenta una petición hedged lanzada porque `provider` tardó demasiado."""
+    GEOCODER_HEDGES.labels(provider).inc()
+
+
+def instrument_engine(engine):
+    """Cuenta cada sentencia que el engine envía a la base de datos."""
+    if prometheus_client is None:
+        return
+    from sqlalchemy import event
+
+    event.listen(engine, "before_cursor_execute", lambda *args: DB_STATEMENTS.inc())
+
+
+class _StateCollector:
+    """Métricas que se leen en el momento del scrape: cachés, cola y circuit breakers."""
+
+    def collect(self):
+        # Importaciones diferidas: evitan dependencias circulares al importar el módulo
+        from . import cache, geocoders, http_client, jobs
+        from .database import SessionLocal
+
+        hits = CounterMetricFamily("geofull_cache_lookups", "Consultas a las cachés por resultado.", labels=["cache", "result"])
+        ratio = GaugeMetricFamily("geofull_cache_hit_ratio", "Proporción de aciertos de cada caché.", labels=["cache"])
+        size = GaugeMetricFamily("geofull_cache_memory_entries", "Entradas en el nivel de memoria.", labels=["cache"])
+        for instance in cache.TwoTierCache.instances():
+            stats = instance.stats()
+            for result in ("memory_hits", "persistent_hits", "misses", "negative_hits", "errors"):
+                hits.add_metric([instance.namespace, result], stats[result])
+            ratio.add_metric([instance.namespace], stats["hit_ratio"])
+            size.add_metric([instance.namespace], stats["memory_size"])
+        yield hits
+        yield ratio
+        yield size
+
+        breaker = GaugeMetricFamily(
+            "geofull_provider_circuit_open", "1 si el circuit breaker del proveedor está abierto.", labels=["provider"]
+        )
+        for provider in (http_client.nominatim, http_client.mapbox, http_client.gemini):
+            breaker.add_metric([provider.name], 1.0 if provider.breaker.state == "open" else 0.0)
+        yield breaker
+
+        # Estadísticas recientes que ordenan a los proveedores de geocodificación
+        latency = GaugeMetricFamily(
+            "geofull_geocoder_latency_seconds", "Latencia reciente por proveedor.", labels=["provider", "quantile"]
+        )
+        quality = GaugeMetricFamily(
+            "geofull_geocoder_success_ratio", "Proporción reciente de respuestas con resultado.", labels=["provider"]
+        )
+        wins = CounterMetricFamily("geofull_geocoder_wins", "Consultas ganadas por cada proveedor.", labels=["provider"])
+        for name, stats in geocoders.get_geocoder().stats().items():
+            for quantile in ("p50", "p90"):
+                if stats[quantile] is not None:
+                    latency.add_metric([name, quantile], stats[quantile])
+            if stats["success_ratio"] is not None:
+                quality.add_metric([name], stats["success_ratio"])
+            wins.add_metric([name], stats["wins"])
+        yield latency
+        yield quality
+        yield wins
+
+        depth = GaugeMetricFamily("geofull_queue_jobs", "Tareas en la cola por estado.", labels=["status"])
+        try:
+            with SessionLocal() as db:
+                for status, count in jobs.queue_depth(db).items():
+                    depth.add_metric([status], count)
+        except Exception as e:
+            print(f"ADVERTENCIA: No se pudo leer la profundidad de la cola: {e}")
+        yield depth
+
+
+_collector_registered = False
+_collector_lock = threading.Lock()
+
+
+def _register_collector():
+    global _collector_registered
+    with _collector_lock:
+        if not _collector_registered:
+            prometheus_client.REGISTRY.register(_StateCollector())
+            _collector_registered = True
+
+
+def render() -> tuple[bytes, str]:
+    """Cuerpo y content-type de `GET /metrics`."""
+    _register_collector()
+    return prometheus_client.generate_latest(), prometheus_client.CONTENT_TYPE_LATEST
+
+
+def start_server(port: int):
+    """Expone las métricas en un servidor HTTP propio (para los procesos worker)."""
+    if prometheus_client is None:
+        print("ADVERTENCIA: prometheus_client no está instalado; el worker no expone métricas.")
+        return
+    _register_collector()
+    prometheus_client.start_http_server(port)
+    print(f"[METRICS] Métricas disponibles en :{port}/metrics")
+
+
+# --- Perfilado por petición ---
+
+_profile_lock = threading.Lock()
+
+
+@contextmanager
+def maybe_profile(enabled: bool, label: str):
+    """
+    Perfila el bloque con cProfile si `enabled`. Solo se perfila una petición
+    a la vez; si ya hay otra en curso, el bloque se ejecuta sin perfilar.
+    """
+    if not (enabled and PROFILING_ENABLED) or not _profile_lock.acquire(blocking=False):
+        yield
+        return
+    profiler = cProfile.Profile()
+    try:
+        profiler.enable()
+        yield
+    finally:
+        profiler.disable()
+        _profile_lock.release()
+        output = io.StringIO()
+        pstats.Stats(profiler, stream=output).sort_stats("cumulative").print_stats(PROFILE_TOP)
+        print(f"[PROFILE] {label}\n{output.getvalue()}")
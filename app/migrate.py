@@ -0,0 +1,231 @@
+"""
+Creación y actualización del esquema de la base de datos.
+
+La API y los workers ya no tocan el esquema al importarse: se aplica con un
+paso explícito antes de desplegar (o al arrancar la API con DB_AUTO_MIGRATE=true):
+
+    python -m app.migrate           # aplica los cambios pendientes
+    python -m app.migrate --check   # solo lista lo que falta (código 1 si hay cambios)
+
+Los cambios son aditivos e idempotentes: crea las tablas nuevas, agrega las
+columnas y los índices que falten en las existentes y los valores nuevos de
+los tipos ENUM. La única modificación de columnas es NOT NULL cuando el
+modelo lo pide y la columna tiene valor por defecto: los NULL existentes
+reciben ese valor antes. No borra columnas; para eso hace falta un sistema
+de migraciones completo (Alembic).
+
+La única excepción son las direcciones duplicadas que pudo dejar la
+inserción anterior (consulta + insert sin bloqueo): antes de crear el índice
+único de `original_address` se conserva una de cada grupo (la procesada y
+geocodificada antes que la pendiente; a igualdad, la más antigua), las
+variantes que apuntaban a las demás pasan a apuntarle a ella y el resto se borra.
+
+También calcula la huella (`fingerprint`, ver `dedup`) de las direcciones que
+no la tienen, las anteriores a la detección de variantes.
+"""
+import argparse
+import sys
+
+from sqlalchemy import Enum, inspect, literal, text
+from sqlalchemy.engine import Engine
+
+from . import models
+from .database import engine as default_engine
+
+ORIGINAL_ADDRESS_INDEX = "ix_addresses_original_address"
+
+# Direcciones repetidas (misma `original_address`) y la que se conserva de cada
+# grupo: primero las procesadas y con coordenadas, para no perder resultados
+_DUPLICATES_SQL = """
+    SELECT id, keep_id FROM (
+        SELECT id, first_value(id) OVER (
+            PARTITION BY original_address
+            ORDER BY (status = 'PENDING'), (latitude IS NULL), created_at NULLS LAST, id
+        ) AS keep_id
+        FROM addresses
+    ) ranked
+    WHERE id <> keep_id
+"""
+
+# Direcciones sin huella que sí pueden tenerla (las que no tienen letras ni números no)
+_MISSING_FINGERPRINTS_SQL = (
+    "SELECT count(*) FROM addresses WHERE fingerprint IS NULL AND original_address ~ '[[:alnum:]]'"
+)
+
+
+def _default_ddl(column, dialect) -> str | None:
+    """Valor por defecto de la columna como SQL (server_default o un default escalar)."""
+    if column.server_default is not None:
+        arg = column.server_default.arg
+        if isinstance(arg, str):
+            return "'" + arg.replace("'", "''") + "'"
+        return str(arg.compile(dialect=dialect))
+    if column.default is not None and column.default.is_scalar:
+        value = literal(column.default.arg, column.type)
+        return str(value.compile(dialect=dialect, compile_kwargs={"literal_binds": True}))
+    return None
+
+
+def _column_ddl(column, dialect) -> str:
+    """Definición de una columna para ALTER TABLE ... ADD COLUMN."""
+    ddl = f'"{column.name}" {column.type.compile(dialect=dialect)}'
+    default = _default_ddl(column, dialect)
+    if default is not None:
+        ddl += f" DEFAULT {default}"
+    # Sin valor por defecto, NOT NULL fallaría con filas existentes
+    if not column.nullable and default is not None:
+        ddl += " NOT NULL"
+    for foreign_key in column.foreign_keys:
+        target = foreign_key.column
+        ddl += f' REFERENCES "{target.table.name}" ("{target.name}")'
+        if foreign_key.ondelete:
+            ddl += f" ON DELETE {foreign_key.ondelete}"
+    return ddl
+
+
+def pending_changes(engine: Engine = default_engine) -> list[tuple[str, str]]:
+    """
+    Cambios que faltan en la base: [(descripción, sentencia SQL o "")]. La
+    limpieza de duplicadas previa al índice único se marca con "DEDUPE" y el
+    cálculo de las huellas que faltan con "FINGERPRINTS".
+    """
+    inspector = inspect(engine)
+    dialect = engine.dialect
+    existing_tables = set(inspector.get_table_names())
+    existing_enums = {enum["name"]: enum["labels"] for enum in inspector.get_enums()} if dialect.name == "postgresql" else {}
+    changes = []
+
+    for table in models.Base.metadata.sorted_tables:
+        if table.name not in existing_tables:
+            changes.append((f"crear tabla {table.name}", ""))
+            continue
+        columns = {column["name"]: column for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name not in columns:
+                changes.append((
+                    f"agregar columna {table.name}.{column.name}",
+                    f'ALTER TABLE "{table.name}" ADD COLUMN IF NOT EXISTS {_column_ddl(column, dialect)}',
+                ))
+                continue
+            default = _default_ddl(column, dialect)
+            if not column.nullable and columns[column.name]["nullable"] and default is not None:
+                changes.append((
+                    f"rellenar los NULL de {table.name}.{column.name}",
+                    f'UPDATE "{table.name}" SET "{column.name}" = {default} WHERE "{column.name}" IS NULL',
+                ))
+                changes.append((
+                    f"NOT NULL en {table.name}.{column.name}",
+                    f'ALTER TABLE "{table.name}" ALTER COLUMN "{column.name}" SET NOT NULL',
+                ))
+        indexes = {index["name"] for index in inspector.get_indexes(table.name)}
+        for index in table.indexes:
+            if index.name not in indexes:
+                if index.name == ORIGINAL_ADDRESS_INDEX:
+                    with engine.connect() as conn:
+                        duplicates = conn.execute(text(f"SELECT count(*) FROM ({_DUPLICATES_SQL}) d")).scalar()
+                    if duplicates:
+                        changes.append((f"eliminar {duplicates} direcciones duplicadas", "DEDUPE"))
+                changes.append((f"crear índice {index.name}", ""))
+
+    seen = set()
+    for table in models.Base.metadata.sorted_tables:
+        for column in table.columns:
+            if not isinstance(column.type, Enum) or column.type.name in seen or column.type.name not in existing_enums:
+                continue
+            seen.add(column.type.name)
+            for label in column.type.enums:
+                if label not in existing_enums[column.type.name]:
+                    changes.append((
+                        f"agregar valor {label} al tipo {column.type.name}",
+                        f"ALTER TYPE {column.type.name} ADD VALUE IF NOT EXISTS '{label}'",
+                    ))
+
+    if "addresses" in existing_tables:
+        with engine.connect() as conn:
+            if "fingerprint" in {column["name"] for column in inspector.get_columns("addresses")}:
+                missing = conn.execute(text(_MISSING_FINGERPRINTS_SQL)).scalar()
+            else:
+                missing = conn.execute(text("SELECT count(*) FROM addresses")).scalar()
+        if missing:
+            changes.append((f"calcular la huella de {missing} direcciones", "FINGERPRINTS"))
+    return changes
+
+
+def _dedupe_original_addresses(conn) -> int:
+    """
+    Deja una sola fila por `original_address` para poder crear el índice único.
+    Devuelve cuántas se borraron.
+    """
+    conn.execute(text(f"CREATE TEMP TABLE address_duplicates ON COMMIT DROP AS {_DUPLICATES_SQL}"))
+    conn.execute(text(
+        "UPDATE addresses a SET canonical_id = NULLIF(d.keep_id, a.id) "
+        "FROM address_duplicates d WHERE a.canonical_id = d.id"
+    ))
+    # Sus tareas se borran en cascada; la que se conserva tiene las suyas
+    return conn.execute(text("DELETE FROM addresses WHERE id IN (SELECT id FROM address_duplicates)")).rowcount
+
+
+def upgrade(engine: Engine = default_engine) -> int:
+    """Aplica los cambios pendientes. Devuelve cuántos se aplicaron."""
+    changes = pending_changes(engine)
+    if not changes:
+        print("[MIGRATE] El esquema está al día.")
+        return 0
+
+    # ALTER TYPE ... ADD VALUE no puede usarse en la misma transacción que lo agrega
+    enum_changes = [sql for description, sql in changes if sql.startswith("ALTER TYPE")]
+    if enum_changes:
+        with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+            for sql in enum_changes:
+                conn.execute(text(sql))
+
+    with engine.begin() as conn:
+        # Tablas nuevas (con sus índices y tipos ENUM)
+        models.Base.metadata.create_all(bind=conn, checkfirst=True)
+        for column in (c for table in models.Base.metadata.sorted_tables for c in table.columns):
+            if isinstance(column.type, Enum):
+                column.type.create(bind=conn, checkfirst=True)
+        for description, sql in changes:
+            if sql.startswith(("ALTER TABLE", "UPDATE")):
+                conn.execute(text(sql))
+        if any(sql == "DEDUPE" for _, sql in changes):
+            deleted = _dedupe_original_addresses(conn)
+            print(f"[MIGRATE] {deleted} direcciones duplicadas eliminadas")
+        # Índices de las columnas recién agregadas
+        for table in models.Base.metadata.sorted_tables:
+            for index in table.indexes:
+                index.create(bind=conn, checkfirst=True)
+
+    if any(sql == "FINGERPRINTS" for _, sql in changes):
+        # Después del commit y por bloques: en tablas grandes tarda
+        from sqlalchemy.orm import Session
+
+        from . import dedup
+
+        with Session(engine) as db:
+            dedup.backfill_fingerprints(db)
+
+    for description, _ in changes:
+        print(f"[MIGRATE] {description}")
+    print(f"[MIGRATE] {len(changes)} cambios aplicados.")
+    return len(changes)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Crea o actualiza el esquema de la base de datos.")
+    parser.add_argument("--check", action="store_true", help="Solo lista los cambios pendientes.")
+    args = parser.parse_args()
+
+    if args.check:
+        changes = pending_changes()
+        for description, _ in changes:
+            print(f"[MIGRATE] Pendiente: {description}")
+        if changes:
+            sys.exit(1)
+        print("[MIGRATE] El esquema está al día.")
+        return
+    upgrade()
+
+
+if __name__ == "__main__":
+    main()
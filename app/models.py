@@ -1,26 +1,63 @@
 import enum
 import uuid
 
-from sqlalchemy import Column, DateTime, Float, String, Text, Enum
-from sqlalchemy.dialects.postgresql import UUID
+from sqlalchemy import BigInteger, Boolean, Column, DateTime, Enum, Float, ForeignKey, Index, Integer, String, Text
+from sqlalchemy.dialects.postgresql import JSONB, UUID
 from sqlalchemy.sql import func
 
 from .database import Base
 
 
+# Tamaño máximo (UTF-8) de `original_address`; ver el índice único en Address
+MAX_ADDRESS_BYTES = 2000
+
+
+def address_too_long(value: str) -> bool:
+    return len(value.encode("utf-8")) > MAX_ADDRESS_BYTES
+
+
 class AddressStatus(str, enum.Enum):
     PENDING = "pending"
     NORMALIZED = "normalized"
     VERIFIED = "verified"
 
 
+class JobStatus(str, enum.Enum):
+    PENDING = "pending"
+    RUNNING = "running"
+    DONE = "done"
+    DEAD = "dead"  # Agotó sus reintentos (dead-letter)
+
+
+class UploadStatus(str, enum.Enum):
+    PROCESSING = "processing"
+    COMPLETED = "completed"
+    FAILED = "failed"
+
+
+class BatchKind(str, enum.Enum):
+    NORMALIZE = "normalize"
+    GEOCODE = "geocode"
+    REPROCESS = "reprocess"  # Solo filas producidas por versiones anteriores del pipeline
+
+
+class BatchStatus(str, enum.Enum):
+    PENDING = "pending"
+    RUNNING = "running"
+    COMPLETED = "completed"
+    FAILED = "failed"
+
+
 class Address(Base):
     __tablename__ = "addresses"
 
     id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
     
     # Direcciones
-    original_address = Column(Text, nullable=False)
+    # Índice único: permite deduplicar con INSERT ... ON CONFLICT DO NOTHING.
+    # Las entradas se limitan a MAX_ADDRESS_BYTES (el B-tree no admite claves
+    # de más de ~2,7 KB y una sola fila más larga aborta todo el INSERT)
+    original_address = Column(Text, nullable=False, unique=True, index=True)
     normalized_address = Column(Text, nullable=True)  # La que se usa para geocodificar
     suggested_address = Column(Text, nullable=True)   # La que devuelve el geocodificador
     
@@ -35,8 +72,123 @@ class Address(Base):
     latitude = Column(Float, nullable=True)
     longitude = Column(Float, nullable=True)
     postal_code = Column(String(10), nullable=True)
+    # Geohash de las coordenadas (ver `spatial`); collation "C" para que el
+    # orden del índice coincida con el de los prefijos
+    geohash = Column(String(12, collation="C"), nullable=True)
     
+    # Detección de variantes: la huella agrupa direcciones del mismo predio y
+    # las variantes apuntan a la dirección canónica cuyo resultado reutilizan
+    fingerprint = Column(String(128), nullable=True, index=True)
+    canonical_id = Column(UUID(as_uuid=True), ForeignKey("addresses.id", ondelete="SET NULL"), nullable=True, index=True)
+
+    # Subida que creó la dirección (eventos de progreso por subida)
+    upload_id = Column(UUID(as_uuid=True), ForeignKey("uploads.id", ondelete="SET NULL"), nullable=True, index=True)
+
+    # Versiones del parser y del geocodificador que produjeron el resultado
+    # (ver `processing.PARSER_VERSION` y `processing.GEOCODER_VERSION`)
+    parser_version = Column(String(32), nullable=True)
+    geocoder_version = Column(String(32), nullable=True)
+    # La geocodificación no encontró la dirección (respuesta definitiva); lo
+    # escribe el pipeline y los eventos lo publican como `failed`
+    geocode_failed = Column(Boolean, default=False, nullable=False)
+
     # Metadatos
     status = Column(Enum(AddressStatus), default=AddressStatus.PENDING, nullable=False)
+    # NOT NULL: la paginación por cursor compara (created_at, id) y un NULL quedaría fuera
+    created_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+    updated_at = Column(DateTime(timezone=True), onupdate=func.now())
+
+    # Índices para la paginación por cursor (created_at, id) y sus filtros
+    __table_args__ = (
+        Index("ix_addresses_created_at_id", "created_at", "id"),
+        Index("ix_addresses_status_created_at_id", "status", "created_at", "id"),
+        Index("ix_addresses_neighborhood_created_at_id", "neighborhood", "created_at", "id"),
+        Index("ix_addresses_postal_code_created_at_id", "postal_code", "created_at", "id"),
+        # Índice espacial: rangos de geohash y paginación por (geohash, id)
+        Index("ix_addresses_geohash_id", "geohash", "id"),
+    )
+
+
+class Upload(Base):
+    """Progreso de la ingesta de un archivo subido."""
+    __tablename__ = "uploads"
+
+    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    filename = Column(Text, nullable=False)
+    status = Column(Enum(UploadStatus), default=UploadStatus.PROCESSING, nullable=False)
+
+    rows_found = Column(Integer, default=0, nullable=False)
+    new_addresses_created = Column(Integer, default=0, nullable=False)
+    addresses_skipped = Column(Integer, default=0, nullable=False)
+    error = Column(Text, nullable=True)
+
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    updated_at = Column(DateTime(timezone=True), onupdate=func.now())
+    finished_at = Column(DateTime(timezone=True), nullable=True)
+
+
+class Batch(Base):
+    """Procesamiento por lotes (normalización o geocodificación) y su progreso."""
+    __tablename__ = "batches"
+
+    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    kind = Column(Enum(BatchKind), nullable=False)
+    status = Column(Enum(BatchStatus), default=BatchStatus.PENDING, nullable=False)
+    selection = Column(JSONB, nullable=False)  # IDs o filtros con los que se eligen las direcciones
+
+    total = Column(Integer, default=0, nullable=False)
+    processed = Column(Integer, default=0, nullable=False)
+    succeeded = Column(Integer, default=0, nullable=False)
+    failed = Column(Integer, default=0, nullable=False)
+    last_address_id = Column(UUID(as_uuid=True), nullable=True)  # Punto de control para reanudar
+    error = Column(Text, nullable=True)
+
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    started_at = Column(DateTime(timezone=True), nullable=True)
+    finished_at = Column(DateTime(timezone=True), nullable=True)
+
+
+class CacheEntry(Base):
+    """Entrada de la caché persistente de resultados externos (geocodificación, IA)."""
+    __tablename__ = "cache_entries"
+
+    namespace = Column(String(32), primary_key=True)
+    key = Column(String(64), primary_key=True)  # sha256 de la clave canónica
+    value = Column(JSONB, nullable=True)        # NULL = caché negativa ("sin resultados")
+    expires_at = Column(DateTime(timezone=True), nullable=False, index=True)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+
+class RateLimit(Base):
+    """Próximo turno libre de un límite de tasa compartido entre procesos (ver `http_client`)."""
+    __tablename__ = "rate_limits"
+
+    name = Column(String(32), primary_key=True)
+    next_at = Column(DateTime(timezone=True), nullable=False)
+
+
+class Job(Base):
+    """Tarea de la cola persistente de procesamiento."""
+    __tablename__ = "jobs"
+
+    id = Column(BigInteger, primary_key=True, autoincrement=True)
+    kind = Column(String(32), nullable=False, default="process_address")
+    address_id = Column(UUID(as_uuid=True), ForeignKey("addresses.id", ondelete="CASCADE"), nullable=True, index=True)
+    batch_id = Column(UUID(as_uuid=True), ForeignKey("batches.id", ondelete="CASCADE"), nullable=True, index=True)
+
+    status = Column(Enum(JobStatus), default=JobStatus.PENDING, nullable=False)
+    attempts = Column(Integer, default=0, nullable=False)
+    max_attempts = Column(Integer, default=5, nullable=False)
+    last_error = Column(Text, nullable=True)
+
+    # Planificación y bloqueo (visibility timeout)
+    run_after = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+    locked_until = Column(DateTime(timezone=True), nullable=True)
+    locked_by = Column(String(128), nullable=True)
+
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
+
+    __table_args__ = (
+        Index("ix_jobs_status_run_after", "status", "run_after"),
+    )
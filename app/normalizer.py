@@ -0,0 +1,290 @@
+import os
+import re
+import unicodedata
+
+# Normalizador de direcciones colombianas basado en reglas.
+#
+# Implementa la misma jerarquía que el "super-prompt" de la IA, pero con
+# expresiones regulares compiladas una sola vez:
+#   a. "Avenida" junto a "Calle"/"Carrera" se ignora.
+#   b. El primer tipo de vía que aparece es el principal.
+#   c. Cualquier otro tipo de vía posterior se ignora al construir `street_info`.
+# Devuelve además un puntaje de confianza; solo las direcciones con baja
+# confianza deben enviarse a la IA.
+
+# Versión de las reglas: se incrementa con cada cambio que altere el resultado
+# del parseo, para que `python -m app.reprocess` reprocese las filas afectadas.
+RULES_VERSION = "2"
+
+# Umbral mínimo de confianza para aceptar el resultado sin pasar por la IA
+CONFIDENCE_THRESHOLD = float(os.getenv("RULES_CONFIDENCE_THRESHOLD", "0.8"))
+
+# Tipos de vía y sus abreviaturas más comunes
+VIA_TYPES = {
+    "Calle": ("calle", "clle", "call", "cll", "cl", "cal"),
+    "Carrera": ("carrera", "carr", "cra", "crr", "kra", "cr", "kr", "k"),
+    "Diagonal": ("diagonal", "diag", "dg"),
+    "Transversal": ("transversal", "transv", "tranv", "trans", "tv", "tr"),
+    "Circular": ("circular", "circ", "cir", "cq"),
+    "Autopista": ("autopista", "auto", "aut"),
+}
+AVENUE_ALIASES = ("avenida", "avda", "av")
+
+_VIA_LOOKUP = {alias: name for name, aliases in VIA_TYPES.items() for alias in aliases}
+# Las abreviaturas más largas primero para que la alternancia no corte palabras
+_VIA_ALT = "|".join(sorted(_VIA_LOOKUP, key=len, reverse=True))
+_AVENUE_ALT = "|".join(AVENUE_ALIASES)
+
+# Traducción que conserva la longitud del texto, para poder recortar el original
+_FOLD = str.maketrans("áéíóúÁÉÍÓÚüÜñÑ", "aeiouAEIOUuUnN")
+
+_LETTER = r"[a-h]{1,2}(?![a-z])"
+_QUADRANT = r"sur|este|norte|oeste"
+
+STREET_RE = re.compile(
+    rf"""
+    (?<![a-z])
+    (?:(?:{_AVENUE_ALT})\.?\s*)?                        # "Av." junto a la vía: se ignora
+    (?P<via>{_VIA_ALT})\.?\s*
+    (?P<num>\d{{1,3}})\s*(?P<let>{_LETTER})?
+    (?:\s*(?P<bis>bis)(?![a-z]))?(?:\s*(?P<bis_let>[a-h])(?![a-z]))?
+    (?:\s*(?P<quad>{_QUADRANT})(?![a-z]))?
+    \s*(?:\#|n[o°º]\.?(?![a-z])|nro\.?|num(?:ero)?\.?|(?:{_VIA_ALT})\.?(?=\s*\d))?\s*
+    (?P<cross>\d{{1,3}})\s*(?P<cross_let>{_LETTER})?
+    (?:\s*(?P<cross_bis>bis)(?![a-z]))?
+    (?:\s*(?P<cross_quad_first>{_QUADRANT})(?![a-z]))?      # "# 1 sur-100": cuadrante antes de la placa
+    \s*(?:-|\s)\s*
+    (?P<plate>\d{{1,3}})(?!\d)
+    (?:\s*(?P<cross_quad>{_QUADRANT})(?![a-z]))?
+    """,
+    re.IGNORECASE | re.VERBOSE,
+)
+
+APARTMENT_RE = re.compile(
+    r"""
+    (?<![a-z])
+    (?:
+        (?:\d+\s*(?:er|ro|do|to|vo|no|mo|o|°|º)?|primer|primero|segundo|tercer|tercero|cuarto|quinto|sexto)\s*piso
+      | (?:piso|apartamento|apto|apt|ap|interior|int|torre|bloque|bl|casa|local|oficina|of|unidad|etapa|mz|manzana|lote)
+        \.?\s*(?:no\.?\s*|\#\s*)?[a-z]?\d+[a-z]?
+    )
+    (?![a-z0-9])
+    """,
+    re.IGNORECASE | re.VERBOSE,
+)
+
+NEIGHBORHOOD_RE = re.compile(
+    r"^(?:barrio|b/|br|urbanizacion|urb|sector|vereda|conjunto|unidad residencial|parcelacion)\b\.?",
+    re.IGNORECASE,
+)
+
+NOTES_RE = re.compile(
+    r"^(?:frente|al lado|diagonal a|cerca|junto|detras|esquina|entre|por|porteria|reja|color|casa de|"
+    r"tienda|llamar|timbre|referencia|ref|entregar|dejar|preguntar|edificio|edif|port[oó]n)\b",
+    re.IGNORECASE,
+)
+COLOR_RE = re.compile(
+    r"\b(?:azul|verde|roj[oa]|blanc[oa]|amarill[oa]|negr[oa]|gris|naranja|rosad[oa]|morad[oa]|caf[eé])\b",
+    re.IGNORECASE,
+)
+
+# Ciudad/país al final del barrio: ya se agregan al construir la dirección normalizada
+CITY_SUFFIX_RE = re.compile(
+    r"[\s,.-]*\b(?:medell[ií]n|antioquia|colombia)\.?(?:[\s,.-]+(?:antioquia|colombia)\.?)*\s*$",
+    re.IGNORECASE,
+)
+SEPARATOR_RE = re.compile(r"\s*[,;]\s*|\s+-\s+")
+TRIM_CHARS = " ,.;:-/"
+
+
+def _cross_quadrant(match: re.Match) -> str | None:
+    """Cuadrante de la vía cruzada, esté antes ("# 1 sur-100") o después ("# 1-100 sur") de la placa."""
+    return match["cross_quad"] or match["cross_quad_first"]
+
+
+def _format_street(match: re.Match) -> str:
+    """Construye el `street_info` en formato estándar (Ej: "Carrera 44B # 13-16")."""
+    via = _VIA_LOOKUP[match["via"].lower()]
+    primary = match["num"] + (match["let"] or "").upper()
+    if match["bis"]:
+        primary += " Bis" + (f" {match['bis_let'].upper()}" if match["bis_let"] else "")
+    if match["quad"]:
+        primary += f" {match['quad'].capitalize()}"
+
+    cross = match["cross"] + (match["cross_let"] or "").upper()
+    if match["cross_bis"]:
+        cross += " Bis"
+    plate = match["plate"]
+    if _cross_quadrant(match):
+        plate += f" {_cross_quadrant(match).capitalize()}"
+
+    return f"{via} {primary} # {cross}-{plate}"
+
+
+def street_key(via: str, number: str, quadrant: str | None = None) -> str:
+    """
+    Clave canónica de una vía (Ej: "carrera 43a", "calle 10 sur"), usada para
+    cruzar direcciones con el índice del geocodificador local.
+    """
+    parts = [_VIA_LOOKUP.get(via.lower(), via).lower(), "".join(number.lower().split())]
+    if quadrant:
+        parts.append(quadrant.lower())
+    return " ".join(parts)
+
+
+def parse_street_components(text: str) -> dict | None:
+    """
+    Extrae los componentes de la vía principal de una dirección: tipo de vía,
+    claves de la vía principal y de la vía cruzada, y la placa (metros desde
+    la esquina). Devuelve None si no hay una vía reconocible.
+    """
+    match = STREET_RE.search(" ".join(text.split()).translate(_FOLD))
+    if not match:
+        return None
+    primary = match["num"] + (match["let"] or "") + (" bis" if match["bis"] else "") + (match["bis_let"] or "")
+    cross = match["cross"] + (match["cross_let"] or "") + (" bis" if match["cross_bis"] else "")
+    return {
+        "via": _VIA_LOOKUP[match["via"].lower()],
+        "primary_key": street_key(match["via"], primary, match["quad"]),
+        "cross_number": cross,
+        "cross_quadrant": _cross_quadrant(match),
+        "plate": int(match["plate"]),
+        "street_info": _format_street(match),
+    }
+
+
+def _classify_remainder(text: str) -> tuple[str | None, str | None, str | None, float]:
+    """
+    Separa el texto sobrante en apartamento, barrio y notas.
+
+    Devuelve también la penalización de confianza acumulada.
+    """
+    penalty = 0.0
+
+    apartment_parts = [m.group(0).strip() for m in APARTMENT_RE.finditer(text)]
+    rest = APARTMENT_RE.sub(",", text)
+
+    neighborhood_parts = []
+    note_parts = []
+    for segment in SEPARATOR_RE.split(rest):
+        segment = CITY_SUFFIX_RE.sub("", segment).strip(TRIM_CHARS)
+        if not segment:
+            continue
+        if NOTES_RE.match(segment) or COLOR_RE.search(segment) or STREET_RE.search(segment.translate(_FOLD)):
+            note_parts.append(segment)
+        elif NEIGHBORHOOD_RE.match(segment):
+            neighborhood_parts.append(segment)
+        else:
+            # Texto libre sin palabra clave: se asume barrio, con menos certeza
+            neighborhood_parts.append(segment)
+            penalty += 0.15
+            if any(ch.isdigit() for ch in segment):
+                penalty += 0.2
+
+    neighborhood = " ".join(neighborhood_parts)
+    return (
+        " ".join(apartment_parts) or None,
+        neighborhood or None,
+        ", ".join(note_parts) or None,
+        penalty,
+    )
+
+
+def parse_address(address: str) -> dict:
+    """
+    Parsea una dirección con reglas y devuelve los mismos campos que la IA,
+    más un puntaje `confidence` entre 0 y 1.
+    """
+    result = {
+        "street_info": None,
+        "neighborhood": None,
+        "apartment_info": None,
+        "notes": None,
+        "confidence": 0.0,
+    }
+    if not address or not address.strip():
+        return result
+
+    text = " ".join(address.split())
+    match = STREET_RE.search(text.translate(_FOLD))
+    if not match:
+        return result
+
+    confidence = 1.0
+    leading = text[:match.start()].strip(TRIM_CHARS)
+    trailing = text[match.end():]
+
+    apartment_info, neighborhood, notes, penalty = _classify_remainder(trailing)
+    confidence -= penalty
+
+    if leading:
+        # Texto antes de la vía: puede ser barrio, nombre de edificio, etc.
+        confidence -= 0.3
+        notes = ", ".join(filter(None, [leading, notes]))
+
+    result.update(
+        street_info=_format_street(match),
+        neighborhood=neighborhood,
+        apartment_info=apartment_info,
+        notes=notes,
+        confidence=round(max(confidence, 0.0), 2),
+    )
+    return result
+
+
+def parse_addresses(addresses: list[str]) -> list[dict]:
+    """
+    Versión por lotes de `parse_address`; conserva el orden de entrada.
+
+    Las cadenas repetidas dentro del lote se parsean una sola vez.
+    """
+    parsed = {address: parse_address(address) for address in dict.fromkeys(addresses)}
+    return [dict(parsed[address]) for address in addresses]
+
+
+def is_confident(parsed: dict, threshold: float = CONFIDENCE_THRESHOLD) -> bool:
+    """Indica si el resultado de las reglas es suficiente para omitir la IA."""
+    return parsed.get("confidence", 0.0) >= threshold
+
+
+_NON_ALNUM_RE = re.compile(r"[^0-9a-z]+")
+
+
+def _tokens(text: str) -> list[str]:
+    """Palabras del texto en minúsculas, sin tildes ni puntuación."""
+    folded = unicodedata.normalize("NFKD", text.lower())
+    folded = "".join(ch for ch in folded if not unicodedata.combining(ch))
+    return _NON_ALNUM_RE.sub(" ", folded).split()
+
+
+def fingerprint(address: str) -> str | None:
+    """
+    Huella de una dirección para detectar variantes del mismo predio.
+
+    Si la vía se reconoce, la huella es "vía principal|vía cruzada|placa"
+    (Ej: "carrera 72a|113|21"), así que "Cra 72A #113-21", "carrera 72 a 113 21"
+    y "CR72A#113-21 piso 2" coinciden. Si la dirección trae barrio, se agrega
+    al final ("carrera 72a|113|21|laureles"): la misma placa en dos barrios son
+    predios distintos. Si no se reconoce la vía, se usan las palabras del texto
+    sin tildes ni puntuación, ordenadas, seguidas de los números en el orden
+    en que aparecen ("finca 3 lote 5" y "finca 5 lote 3" son predios distintos).
+    """
+    if not address or not address.strip():
+        return None
+    components = parse_street_components(address)
+    if components:
+        cross = components["cross_number"].replace(" ", "")
+        if components["cross_quadrant"]:
+            cross += f" {components['cross_quadrant'].lower()}"
+        key = f"{components['primary_key']}|{cross.lower()}|{components['plate']}"
+        neighborhood = parse_address(address)["neighborhood"]
+        if neighborhood:
+            key += "|" + " ".join(_tokens(NEIGHBORHOOD_RE.sub("", neighborhood)))
+        return key.rstrip("|")[:128]
+
+    tokens = _tokens(address)
+    if not tokens:
+        return None
+    numbers = [token for token in tokens if any(ch.isdigit() for ch in token)]
+    words = sorted(set(tokens) - set(numbers))
+    return f"t:{' '.join(words)}|{' '.join(numbers)}"[:128]
@@ -1,40 +1,108 @@
+import asyncio
 import re
 import uuid
-import requests
 import os
 import json
-import google.generativeai as genai
+import threading
+from sqlalchemy import select
 
-from . import crud, models, schemas
+from . import cache, geocoders, http_client, local_geocoder, metrics, models, normalizer, spatial
+from . import sink as sink_module
 from .database import SessionLocal
 
 
-# Configuración de la API de IA (se lee de las variables de entorno)
-if os.getenv("GEMINI_API_KEY"):
-    try:
-        genai.configure(api_key=os.environ["GEMINI_API_KEY"])
-    except Exception as e:
-        print(f"ADVERTENCIA: No se pudo configurar la API de Gemini. Error: {e}")
-else:
-    print("ADVERTENCIA: La variable de entorno GEMINI_API_KEY no está configurada. La IA no funcionará.")
+GEMINI_MODEL_NAME = "gemini-1.5-flash-latest"
 
+# Endpoint REST alternativo (p. ej. el servidor simulado de `bench/`). Si está
+# definido, las llamadas se hacen con el cliente HTTP compartido en lugar del SDK.
+GEMINI_API_ENDPOINT = os.getenv("GEMINI_API_ENDPOINT")
 
-def parse_address_with_ai(address: str) -> dict | None:
+# Límites de los lotes enviados a la IA
+AI_BATCH_MAX_SIZE = int(os.getenv("AI_BATCH_MAX_SIZE", "50"))
+AI_BATCH_TOKEN_BUDGET = int(os.getenv("AI_BATCH_TOKEN_BUDGET", "8000"))
+# Estimación aproximada: ~4 caracteres por token, ~80 tokens de salida por dirección
+_CHARS_PER_TOKEN = 4
+_OUTPUT_TOKENS_PER_ADDRESS = 80
+
+_ai_model = None
+_ai_model_lock = threading.Lock()
+# Tamaño adaptativo de los lotes a la IA, compartido por los hilos del worker
+_ai_batch_size = AI_BATCH_MAX_SIZE
+_ai_batch_size_lock = threading.Lock()
+
+
+class _RestResponse:
+    def __init__(self, text: str):
+        self.text = text
+
+
+class RestGenerativeModel:
     """
-    Usa un modelo de IA (Gemini) para parsear una dirección compleja en un formato estructurado,
-    siguiendo reglas y ejemplos específicos.
+    Cliente mínimo de la API REST `generateContent` de Gemini, con la misma
+    interfaz que usa el pipeline del modelo del SDK (`generate_content_async`).
     """
-    if not genai.get_model("models/gemini-1.5-flash-latest"): 
-        print("Error: El modelo de IA no está disponible. Verifica la configuración de la API Key.")
-        return None
 
-    model = genai.GenerativeModel('gemini-1.5-flash-latest')
+    def __init__(self, endpoint: str, model_name: str, api_key: str | None):
+        self.url = f"{endpoint.rstrip('/')}/v1beta/models/{model_name}:generateContent"
+        self.api_key = api_key
 
-    # "Super-prompt" v4, con reglas jerárquicas.
-    prompt = f""" 
-    Eres un asistente experto en la limpieza y estructuración de direcciones de Colombia.
-    Tu tarea es analizar la siguiente dirección en bruto y devolver un objeto JSON con los campos especificados.
+    async def generate_content_async(self, prompt: str, generation_config: dict | None = None):
+        body = {"contents": [{"parts": [{"text": prompt}]}]}
+        if generation_config:
+            # La API REST usa camelCase: response_mime_type -> responseMimeType
+            body["generationConfig"] = {
+                re.sub(r"_(\w)", lambda m: m.group(1).upper(), key): value for key, value in generation_config.items()
+            }
+        response = await http_client.get_client().post(self.url, params={"key": self.api_key or ""}, json=body)
+        http_client.raise_for_status(response)
+        data = response.json()
+        return _RestResponse(data["candidates"][0]["content"]["parts"][0]["text"])
+
+
+def get_ai_model():
+    """
+    Devuelve el modelo de IA, creado una sola vez por proceso.
+    Si el modelo no está disponible, devuelve None.
 
+    El SDK de Gemini se importa y se configura aquí, no al importar el módulo:
+    solo su import tarda cientos de milisegundos y la API no lo necesita.
+    """
+    global _ai_model
+    if _ai_model is None and GEMINI_API_ENDPOINT:
+        _ai_model = RestGenerativeModel(GEMINI_API_ENDPOINT, GEMINI_MODEL_NAME, os.getenv("GEMINI_API_KEY"))
+    if _ai_model is None:
+        with _ai_model_lock:
+            if _ai_model is None:
+                if not os.getenv("GEMINI_API_KEY"):
+                    print("ADVERTENCIA: La variable de entorno GEMINI_API_KEY no está configurada. La IA no funcionará.")
+                    return None
+                try:
+                    import google.generativeai as genai
+
+                    genai.configure(api_key=os.environ["GEMINI_API_KEY"])
+                    genai.get_model(f"models/{GEMINI_MODEL_NAME}")
+                    _ai_model = genai.GenerativeModel(GEMINI_MODEL_NAME)
+                except Exception as e:
+                    print(f"Error: El modelo de IA no está disponible. Verifica la configuración de la API Key. ({e})")
+                    return None
+    return _ai_model
+
+
+def init_clients(load_ai: bool = True):
+    """
+    Inicializa una sola vez los clientes externos: geocodificadores, índice
+    local y, si `load_ai`, el modelo de IA. Lo llaman el arranque de la API
+    (lifespan) y el de los workers, para no pagar la carga en la primera tarea.
+    """
+    geocoders.get_geocoder()
+    local_geocoder.get_local_geocoder()
+    if load_ai:
+        get_ai_model()
+
+
+# "Super-prompt" v4, con reglas jerárquicas. Las reglas y los ejemplos se
+# comparten entre el prompt individual y el prompt por lotes.
+AI_PROMPT_RULES = """
     **Reglas Clave:**
     1.  **Regla de Jerarquía de Vías:**
         a. Primero, si encuentras "Avenida" (o "Av.") junto a "Carrera" o "Calle", **ignora "Avenida" por completo**.
@@ -51,42 +119,106 @@ def parse_address_with_ai(address: str) -> dict | None:
 
     Dirección Bruta: "Cra72a#113-21 2do piso"
     JSON:
-    {{
+    {
       "street_info": "Carrera 72a # 113-21",
       "neighborhood": null,
       "apartment_info": "2do piso",
       "notes": null
-    }}
+    }
 
     Dirección Bruta: "Av. Calle 108 A # 77 B-06 Primer piso"
     JSON:
-    {{
+    {
       "street_info": "Calle 108 A # 77 B-06",
       "neighborhood": null,
       "apartment_info": "Primer piso",
       "notes": null
-    }}
+    }
 
     Dirección Bruta: "Carrera 30 CC calle 100 B-7 la aldea santo domingo Medellín"
     JSON:
-    {{
+    {
       "street_info": "Carrera 30 CC # 100 B-7",
       "neighborhood": "la aldea santo domingo Medellín",
       "apartment_info": null,
       "notes": null
-    }}
+    }
 
     Dirección Bruta: "av. carrera 44B calle 13-16"
     JSON:
-    {{
+    {
       "street_info": "Carrera 44B # 13-16",
       "neighborhood": null,
       "apartment_info": null,
       "notes": null
-    }}
+    }
 
     ---
+"""
+
+AI_PARSED_FIELDS = ("street_info", "neighborhood", "apartment_info", "notes")
+
+# Versión del prompt: cambia automáticamente cuando cambian las reglas, los
+# ejemplos o el modelo, e invalida así las entradas de caché anteriores.
+AI_PROMPT_VERSION = cache.hash_key(GEMINI_MODEL_NAME + AI_PROMPT_RULES)[:12]
+
+# Versión del formato de `normalized_address` (ver `build_normalized_address`)
+NORMALIZED_ADDRESS_VERSION = "1"
+
+# Versión del parser que se guarda en cada dirección: reglas, formato de la
+# dirección normalizada y prompt de la IA. Si cambia cualquiera de las tres,
+# `python -m app.reprocess` vuelve a parsear las filas anteriores.
+PARSER_VERSION = f"{normalizer.RULES_VERSION}.{NORMALIZED_ADDRESS_VERSION}.{AI_PROMPT_VERSION}"
+
+# Caché persistente de resultados de la IA
+AI_CACHE_SIZE = int(os.getenv("AI_CACHE_SIZE", "20000"))
+AI_CACHE_TTL = float(os.getenv("AI_CACHE_TTL", str(90 * 24 * 3600)))
+
+ai_parse_cache = cache.TwoTierCache(
+    "ai_parse",
+    maxsize=AI_CACHE_SIZE,
+    ttl=AI_CACHE_TTL,
+    negative_ttl=0,
+)
+
+
+def _ai_cache_key(address: str) -> str:
+    return f"{AI_PROMPT_VERSION}:{cache.fold_text(address)}"
+
 
+def _clean_ai_response(text: str) -> str:
+    """Quita los bloques de código Markdown que a veces añade el modelo."""
+    return text.strip().replace("```json", "").replace("```", "").strip()
+
+
+def parse_address_with_ai(address: str) -> dict | None:
+    """
+    Usa un modelo de IA (Gemini) para parsear una dirección compleja en un formato estructurado,
+    siguiendo reglas y ejemplos específicos.
+
+    Los resultados se guardan en caché por dirección normalizada y versión del prompt.
+    """
+    key = _ai_cache_key(address)
+    cached = ai_parse_cache.get(key)
+    if cached is not cache.MISSING and cached is not None:
+        return cached
+
+    parsed = _parse_address_with_ai_uncached(address)
+    if parsed:
+        # Los fallos no se cachean: suelen ser transitorios
+        ai_parse_cache.set(key, parsed)
+    return parsed
+
+
+def _parse_address_with_ai_uncached(address: str) -> dict | None:
+    model = get_ai_model()
+    if model is None:
+        return None
+
+    prompt = f"""
+    Eres un asistente experto en la limpieza y estructuración de direcciones de Colombia.
+    Tu tarea es analizar la siguiente dirección en bruto y devolver un objeto JSON con los campos especificados.
+{AI_PROMPT_RULES}
     **Analiza esta dirección:**
 
     Dirección Bruta: "{address}"
@@ -95,98 +227,360 @@ def parse_address_with_ai(address: str) -> dict | None:
     """
 
     try:
-        response = model.generate_content(prompt)
-        cleaned_response = response.text.strip().replace("```json", "").replace("```", "").strip()
-        parsed_json = json.loads(cleaned_response)
+        with metrics.track("ai_parse", items=1):
+            response = http_client.run(http_client.gemini.call(lambda: model.generate_content_async(prompt)))
+            parsed_json = json.loads(_clean_ai_response(response.text))
         return parsed_json
     except Exception as e:
         print(f"Error al parsear la dirección con IA: {e}")
         return None
 
 
-def geocode_address(address: str) -> dict | None:
-    # (Esta función no necesita cambios)
-    if not address:
-        return None
-    url = "https://nominatim.openstreetmap.org/search"
-    params = {'q': address, 'format': 'json', 'addressdetails': 1, 'limit': 1}
-    headers = {'User-Agent': 'GeoFullApp/0.1 (mailto:tu-email-aqui@example.com)'}
+def _build_batch_prompt(items: list[tuple[str, str]]) -> str:
+    """Construye el prompt para un lote de pares (id, dirección)."""
+    payload = json.dumps([{"id": item_id, "address": address} for item_id, address in items], ensure_ascii=False)
+    return f"""
+    Eres un asistente experto en la limpieza y estructuración de direcciones de Colombia.
+    Tu tarea es analizar una lista de direcciones en bruto y devolver, para cada una, un objeto JSON con los campos especificados.
+{AI_PROMPT_RULES}
+    **Formato de Salida para este lote:** Devuelve **únicamente un arreglo JSON** con un objeto por dirección.
+    Cada objeto debe incluir el mismo `id` recibido y los campos `street_info`, `neighborhood`, `apartment_info` y `notes`.
+
+    **Analiza estas direcciones:**
+
+    {payload}
+
+    JSON:
+    """
+
+
+def _parse_batch_response(text: str) -> dict[str, dict]:
+    """
+    Convierte la respuesta del modelo en un diccionario {id: resultado}.
+    Lanza ValueError si la respuesta no es un arreglo JSON válido.
+    """
+    data = json.loads(_clean_ai_response(text))
+    if isinstance(data, dict):
+        # Algunos modelos envuelven el arreglo: {"results": [...]}
+        data = next((value for value in data.values() if isinstance(value, list)), None)
+    if not isinstance(data, list):
+        raise ValueError("La respuesta de la IA no es un arreglo JSON.")
+
+    results = {}
+    for item in data:
+        if isinstance(item, dict) and "id" in item:
+            results[str(item["id"])] = {field: item.get(field) for field in AI_PARSED_FIELDS}
+    return results
+
+
+def _estimate_tokens(address: str) -> int:
+    return len(address) // _CHARS_PER_TOKEN + _OUTPUT_TOKENS_PER_ADDRESS
+
+
+def _next_batch(items: list[tuple[str, str]]) -> list[tuple[str, str]]:
+    """Toma del inicio de `items` el lote más grande que cabe en el presupuesto de tokens."""
+    prefix_tokens = len(AI_PROMPT_RULES) // _CHARS_PER_TOKEN
+    budget = AI_BATCH_TOKEN_BUDGET - prefix_tokens
+    batch = []
+    for item in items[:_ai_batch_size]:
+        budget -= _estimate_tokens(item[1])
+        if batch and budget < 0:
+            break
+        batch.append(item)
+    return batch
+
+
+def _adjust_batch_size(success: bool):
+    """Crecimiento aditivo tras un lote correcto, reducción a la mitad tras un fallo."""
+    global _ai_batch_size
+    with _ai_batch_size_lock:
+        if success:
+            _ai_batch_size = min(AI_BATCH_MAX_SIZE, _ai_batch_size + 5)
+        else:
+            _ai_batch_size = max(1, _ai_batch_size // 2)
+
+
+def _parse_batch_with_ai(model, items: list[tuple[str, str]]) -> dict[str, dict]:
+    """
+    Envía un lote a la IA. Si la respuesta es inválida, divide el lote en dos y
+    reintenta; si es parcial, reintenta solo las direcciones que faltan.
+    """
+    if len(items) == 1:
+        # Una sola dirección: el prompt individual es más robusto
+        item_id, address = items[0]
+        parsed = _parse_address_with_ai_uncached(address)
+        return {item_id: parsed} if parsed else {}
+
     try:
-        response = requests.get(url, params=params, headers=headers, timeout=10)
-        response.raise_for_status()
-        data = response.json()
-        if not data:
-            print(f"Geocodificación no encontró resultados para: {address}")
-            return None
-        result = data[0]
-        return {
-            "latitude": float(result.get("lat")),
-            "longitude": float(result.get("lon")),
-            "suggested_address": result.get("display_name"),
-            "postal_code": result.get("address", {}).get("postcode")
-        }
-    except requests.exceptions.RequestException as e:
+        with metrics.track("ai_parse_batch", items=len(items)):
+            prompt = _build_batch_prompt(items)
+            response = http_client.run(http_client.gemini.call(
+                lambda: model.generate_content_async(prompt, generation_config={"response_mime_type": "application/json"})
+            ))
+            results = _parse_batch_response(response.text)
+            if not results:
+                raise ValueError("La respuesta de la IA no contiene ningún ID del lote.")
+    except Exception as e:
+        print(f"Error al parsear un lote de {len(items)} direcciones con IA, se divide y reintenta: {e}")
+        _adjust_batch_size(False)
+        middle = len(items) // 2
+        return {**_parse_batch_with_ai(model, items[:middle]), **_parse_batch_with_ai(model, items[middle:])}
+
+    expected = {item_id for item_id, _ in items}
+    results = {item_id: value for item_id, value in results.items() if item_id in expected}
+    missing = [item for item in items if item[0] not in results]
+    _adjust_batch_size(not missing)
+    if missing:
+        results.update(_parse_batch_with_ai(model, missing))
+    return results
+
+
+def parse_addresses_with_ai(addresses: list[str]) -> list[dict | None]:
+    """
+    Versión por lotes de `parse_address_with_ai`: empaqueta varias direcciones
+    por prompt, cada una con un ID estable. Devuelve los resultados en el mismo
+    orden que la entrada (None para las que no se pudieron parsear).
+    """
+    # Las direcciones repetidas se envían una sola vez; el ID es su posición
+    unique = list(dict.fromkeys(addresses))
+    by_address: dict[str, dict | None] = {}
+    pending = []
+    cached_by_key = ai_parse_cache.get_many([_ai_cache_key(address) for address in unique])
+    for index, address in enumerate(unique):
+        cached = cached_by_key.get(_ai_cache_key(address))
+        if cached is not None:
+            by_address[address] = cached
+        else:
+            pending.append((str(index), address))
+
+    model = get_ai_model() if pending else None
+    if pending and model is None:
+        pending = []
+
+    results: dict[str, dict] = {}
+    while pending:
+        batch = _next_batch(pending)
+        pending = pending[len(batch):]
+        results.update(_parse_batch_with_ai(model, batch))
+
+    for index, address in enumerate(unique):
+        if address in by_address:
+            continue
+        parsed = results.get(str(index))
+        if parsed:
+            ai_parse_cache.set(_ai_cache_key(address), parsed)
+        by_address[address] = parsed
+    return [by_address[address] for address in addresses]
+
+
+def parse_address(address: str) -> dict | None:
+    """
+    Parsea una dirección usando primero las reglas deterministas y, solo si
+    la confianza es baja, el modelo de IA.
+    """
+    parsed = normalizer.parse_address(address)
+    if normalizer.is_confident(parsed):
+        return parsed
+    return parse_address_with_ai(address)
+
+
+def parse_addresses(addresses: list[str]) -> list[dict | None]:
+    """
+    Versión por lotes de `parse_address`: las reglas procesan todo el lote y
+    solo las direcciones con baja confianza se envían juntas a la IA.
+    """
+    with metrics.track("rules_parse", items=len(addresses)):
+        results = normalizer.parse_addresses(addresses)
+    low_confidence = [index for index, parsed in enumerate(results) if not normalizer.is_confident(parsed)]
+    if low_confidence:
+        ai_results = parse_addresses_with_ai([addresses[index] for index in low_confidence])
+        for index, parsed in zip(low_confidence, ai_results):
+            results[index] = parsed
+    return results
+
+
+# Caché de geocodificación: LRU en memoria + tabla persistente (o Redis)
+GEOCODE_CACHE_SIZE = int(os.getenv("GEOCODE_CACHE_SIZE", "10000"))
+GEOCODE_CACHE_TTL = float(os.getenv("GEOCODE_CACHE_TTL", str(30 * 24 * 3600)))
+GEOCODE_CACHE_NEGATIVE_TTL = float(os.getenv("GEOCODE_CACHE_NEGATIVE_TTL", str(24 * 3600)))
+
+geocode_cache = cache.TwoTierCache(
+    "geocode",
+    maxsize=GEOCODE_CACHE_SIZE,
+    ttl=GEOCODE_CACHE_TTL,
+    negative_ttl=GEOCODE_CACHE_NEGATIVE_TTL,
+)
+
+
+# Versión de la geocodificación; se incrementa al cambiar de proveedores o de lógica
+GEOCODER_VERSION = os.getenv("GEOCODER_VERSION", "1")
+
+# Resultado de `geocode_addresses` cuando ningún proveedor pudo responder
+# (timeout, 5xx, circuito abierto). A diferencia de None (sin resultados), no es
+# definitivo: no se cachea ni se registra `geocoder_version`, para reintentarlo.
+GEOCODE_UNAVAILABLE = object()
+
+
+async def _geocode_uncached(address: str):
+    """
+    Geocodifica sin caché con los proveedores configurados (peticiones hedged).
+    Si ningún proveedor pudo responder, el error se reporta, no se cachea y se
+    devuelve GEOCODE_UNAVAILABLE.
+    """
+    key = cache.canonicalize(address)
+    try:
+        with metrics.track("geocode_remote", items=1):
+            result = await geocoders.get_geocoder().geocode(address)
+    except geocoders.GeocodingError as e:
         print(f"Error de conexión al geocodificar: {e}")
-        return None
+        return GEOCODE_UNAVAILABLE
+    if result is None:
+        print(f"Geocodificación no encontró resultados para: {address}")
+    # La caché persistente es síncrona: se escribe fuera del event loop
+    await asyncio.to_thread(geocode_cache.set, key, result)
+    return result
+
+
+def geocode_address(address: str) -> dict | None:
+    """Geocodifica una dirección, consultando primero la caché."""
+    result = geocode_addresses([address])[0]
+    return None if result is GEOCODE_UNAVAILABLE else result
+
+
+def geocode_addresses(addresses: list[str]) -> list:
+    """
+    Geocodifica un lote de direcciones. Se intenta primero el geocodificador
+    local; las que no resuelve y no están en caché se consultan a los
+    proveedores remotos (`geocoders`) de forma concurrente, respetando el
+    límite de tasa de cada proveedor.
+
+    Cada resultado es un dict, None si no hubo resultados o GEOCODE_UNAVAILABLE
+    si los proveedores no pudieron responder.
+    """
+    results: dict[str, dict | None] = {}
+    not_local = []
+    for address in dict.fromkeys(filter(None, addresses)):
+        # Primero el índice local (sin red); los proveedores remotos quedan como respaldo
+        with metrics.track("geocode_local"):
+            local = local_geocoder.geocode(address)
+        if local:
+            results[address] = local
+        else:
+            not_local.append(address)
+
+    # Una sola lectura de la caché persistente para todo el lote
+    cached = geocode_cache.get_many([cache.canonicalize(address) for address in not_local])
+    pending = []
+    for address in not_local:
+        key = cache.canonicalize(address)
+        if key in cached:
+            results[address] = cached[key]
+        else:
+            pending.append(address)
+
+    if pending:
+        async def geocode_pending():
+            return await asyncio.gather(*(_geocode_uncached(address) for address in pending))
+
+        for address, result in zip(pending, http_client.run(geocode_pending())):
+            results[address] = result
+
+    return [results.get(address) if address else None for address in addresses]
+
+
+def build_normalized_address(parsed_data: dict) -> str:
+    """Construye la dirección normalizada que se envía al geocodificador."""
+    norm_parts = [
+        parsed_data.get('street_info'),
+        parsed_data.get('neighborhood'),
+        "Medellin",
+        "Colombia"
+    ]
+    return ", ".join(filter(None, norm_parts))
+
+
+def parsed_values(parsed_data: dict) -> dict:
+    """Campos de la dirección que escribe la etapa de parseo."""
+    return {
+        "street_info": parsed_data.get('street_info'),
+        "neighborhood": parsed_data.get('neighborhood'),
+        "apartment_info": parsed_data.get('apartment_info'),
+        "notes": parsed_data.get('notes'),
+        "normalized_address": build_normalized_address(parsed_data),
+        "status": models.AddressStatus.NORMALIZED,
+        "parser_version": PARSER_VERSION,
+    }
+
+
+def geocoded_values(geocoded_data: dict) -> dict:
+    """Campos de la dirección que escribe la etapa de geocodificación."""
+    return {
+        "latitude": geocoded_data["latitude"],
+        "longitude": geocoded_data["longitude"],
+        "geohash": spatial.encode(geocoded_data["latitude"], geocoded_data["longitude"]),
+        "suggested_address": geocoded_data["suggested_address"],
+        "postal_code": geocoded_data["postal_code"],
+        "status": models.AddressStatus.VERIFIED,
+        "geocoder_version": GEOCODER_VERSION,
+        "geocode_failed": False,
+    }
 
 
 def run_processing_pipeline(address_id: uuid.UUID):
     """
-    Pipeline mejorado que usa el nuevo prompt de IA.
+    Procesa una sola dirección (parseo + geocodificación) con una única
+    escritura al final.
     """
-    print(f"[AI PIPELINE v2] Iniciando para address_id: {address_id}")
-    db = SessionLocal()
-    try:
-        db_address = crud.get_address(db, address_id=address_id)
-        if not db_address:
+    with sink_module.ResultSink() as sink:
+        errors = run_processing_pipeline_batch([address_id], sink)
+    if errors:
+        print(f"[AI PIPELINE v2] Fallo en el parseo para la dirección {address_id}.")
+
+
+def run_processing_pipeline_batch(address_ids: list[uuid.UUID], sink: sink_module.ResultSink) -> dict[uuid.UUID, str]:
+    """
+    Versión por lotes del pipeline: parsea todas las direcciones juntas
+    (reglas + IA por lotes) y luego las geocodifica de forma concurrente.
+
+    Los resultados no se escriben aquí: se combinan por dirección en `sink`,
+    que los escribe en bloque. Devuelve {address_id: error} para las
+    direcciones que deben reintentarse.
+    """
+    print(f"[AI PIPELINE v2] Iniciando lote de {len(address_ids)} direcciones")
+    errors = {}
+    with SessionLocal() as db, metrics.track("db_read", items=len(address_ids)):
+        rows = db.execute(
+            select(models.Address.id, models.Address.original_address).where(models.Address.id.in_(address_ids))
+        ).all()
+    found = {row.id for row in rows}
+    for address_id in address_ids:
+        if address_id not in found:
             print(f"[AI PIPELINE v2] ERROR: No se encontró la dirección {address_id}")
-            return
-
-        # --- 1. Parseo con IA (versión mejorada) ---
-        parsed_data = parse_address_with_ai(db_address.original_address)
-        
-        if parsed_data:
-            # Construir la dirección normalizada para el geocodificador
-            norm_parts = [
-                parsed_data.get('street_info'), 
-                parsed_data.get('neighborhood'), 
-                "Medellin", 
-                "Colombia"
-            ]
-            normalized_str = ", ".join(filter(None, norm_parts))
-
-            update_data = schemas.AddressUpdate(
-                street_info=parsed_data.get('street_info'),
-                neighborhood=parsed_data.get('neighborhood'),
-                apartment_info=parsed_data.get('apartment_info'),
-                notes=parsed_data.get('notes'),
-                normalized_address=normalized_str,
-                status=models.AddressStatus.NORMALIZED
-            )
-            crud.update_address(db, address_id=address_id, address_update=update_data)
-            print(f"[AI PIPELINE v2] Dirección {address_id} parseada con IA.")
-            db.refresh(db_address)
-        else:
-            print(f"[AI PIPELINE v2] Fallo en el parseo con IA para la dirección {address_id}. No se hacen cambios.")
-            return # Si la IA falla, detenemos el proceso para esta dirección
-
-        # --- 2. Geocodificación ---
-        address_to_geocode = db_address.normalized_address
-        geocoded_data = geocode_address(address_to_geocode)
-        
-        if geocoded_data:
-            update_geo = schemas.AddressUpdate(
-                latitude=geocoded_data["latitude"],
-                longitude=geocoded_data["longitude"],
-                suggested_address=geocoded_data["suggested_address"],
-                postal_code=geocoded_data["postal_code"],
-                status=models.AddressStatus.VERIFIED
-            )
-            crud.update_address(db, address_id=address_id, address_update=update_geo)
-            print(f"[AI PIPELINE v2] Dirección {address_id} geocodificada.")
+
+    # --- 1. Parseo: reglas deterministas, con la IA como respaldo ---
+    parsed = parse_addresses([row.original_address for row in rows])
+    normalized = {}
+    for row, parsed_data in zip(rows, parsed):
+        if not parsed_data:
+            errors[row.id] = "parse_failed"
+            continue
+        values = parsed_values(parsed_data)
+        sink.add(row.id, values)
+        normalized[row.id] = values["normalized_address"]
+
+    # --- 2. Geocodificación concurrente del lote, bajo el límite de tasa del proveedor ---
+    geocoded = geocode_addresses(list(normalized.values()))
+    for address_id, geocoded_data in zip(normalized, geocoded):
+        if geocoded_data is GEOCODE_UNAVAILABLE:
+            # Error transitorio: la cola reintenta la tarea con backoff
+            errors[address_id] = "geocode_unavailable"
+            print(f"[AI PIPELINE v2] Geocodificación no disponible para la dirección {address_id}.")
+        elif geocoded_data:
+            sink.add(address_id, geocoded_values(geocoded_data))
         else:
+            # Sin resultados: se registra el intento, la misma versión no se reintenta al reprocesar
+            sink.add(address_id, {"geocoder_version": GEOCODER_VERSION, "geocode_failed": True}, failed=True)
             print(f"[AI PIPELINE v2] Fallo en geocodificación para la dirección {address_id}.")
 
-    finally:
-        db.close()
-        print(f"[AI PIPELINE v2] Finalizado para address_id: {address_id}")
+    print(f"[AI PIPELINE v2] Finalizado lote de {len(address_ids)} direcciones ({len(errors)} fallidas)")
+    return errors
@@ -0,0 +1,114 @@
+"""
+Reprocesamiento incremental tras un cambio del parser o del geocodificador.
+
+Cada dirección guarda la versión del parser (`parser_version`: reglas,
+formato de la dirección normalizada y prompt de la IA) y del geocodificador
+(`geocoder_version`) que produjeron su resultado. Este comando reprocesa
+solo las filas obsoletas, por bloques y con punto de control: si se
+interrumpe, la siguiente ejecución continúa el mismo lote. Las filas cuya
+dirección normalizada no cambia conservan su geocodificación.
+
+    python -m app.reprocess status     # cuántas filas están obsoletas
+    python -m app.reprocess run        # reprocesa (o reanuda) en este proceso
+    python -m app.reprocess run --enqueue   # lo ejecutan los workers
+    python -m app.reprocess stamp      # marca las filas existentes con las versiones actuales
+"""
+import argparse
+
+from sqlalchemy import exists, func, select, update
+from sqlalchemy.orm import Session
+
+from . import batch, crud, models, processing, schemas
+from .database import SessionLocal
+
+
+def count_stale(db: Session) -> dict:
+    """Filas procesadas con un parser o un geocodificador obsoletos."""
+    processed = (
+        models.Address.status != models.AddressStatus.PENDING,
+        models.Address.canonical_id.is_(None),
+    )
+
+    def count(condition) -> int:
+        return db.execute(select(func.count()).select_from(models.Address).where(*processed, condition)).scalar_one()
+
+    return {"parser": count(batch.parser_is_stale()), "geocoder": count(batch.geocoder_is_stale())}
+
+
+def find_resumable_batch(db: Session) -> models.Batch | None:
+    """Último lote de reprocesamiento sin terminar que no está en la cola de los workers."""
+    return db.execute(
+        select(models.Batch)
+        .where(
+            models.Batch.kind == models.BatchKind.REPROCESS,
+            models.Batch.status.in_([models.BatchStatus.PENDING, models.BatchStatus.RUNNING]),
+            ~exists().where(models.Job.batch_id == models.Batch.id),
+        )
+        .order_by(models.Batch.created_at.desc())
+        .limit(1)
+    ).scalar_one_or_none()
+
+
+def stamp_versions(db: Session) -> tuple[int, int]:
+    """
+    Asigna las versiones actuales a las filas procesadas que no tienen versión
+    (anteriores al versionado), sin reprocesarlas. La del geocodificador solo
+    se asigna a las verificadas: una normalizada sin versión puede venir de un
+    error transitorio y debe reintentarse.
+    """
+    processed = models.Address.status != models.AddressStatus.PENDING
+    parser = db.execute(
+        update(models.Address)
+        .where(processed, models.Address.parser_version.is_(None))
+        .values(parser_version=processing.PARSER_VERSION)
+        .execution_options(synchronize_session=False)
+    ).rowcount
+    geocoder = db.execute(
+        update(models.Address)
+        .where(models.Address.status == models.AddressStatus.VERIFIED, models.Address.geocoder_version.is_(None))
+        .values(geocoder_version=processing.GEOCODER_VERSION)
+        .execution_options(synchronize_session=False)
+    ).rowcount
+    db.commit()
+    return parser, geocoder
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Reprocesamiento incremental de direcciones.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    subparsers.add_parser("status", help="Cuenta las filas obsoletas.")
+    run = subparsers.add_parser("run", help="Reprocesa las filas obsoletas (o reanuda el último lote).")
+    run.add_argument("--chunk-size", type=int, default=batch.BATCH_CHUNK_SIZE)
+    run.add_argument("--enqueue", action="store_true", help="Encola el lote para los workers en lugar de ejecutarlo aquí.")
+    run.add_argument("--new", action="store_true", help="Crea un lote nuevo aunque haya uno sin terminar.")
+    subparsers.add_parser("stamp", help="Marca las filas sin versión con las versiones actuales.")
+    args = parser.parse_args()
+
+    print(f"[REPROCESS] Parser {processing.PARSER_VERSION}, geocodificador {processing.GEOCODER_VERSION}")
+    with SessionLocal() as db:
+        if args.command == "status":
+            stale = count_stale(db)
+            print(f"[REPROCESS] Obsoletas: {stale['parser']} por parser, {stale['geocoder']} por geocodificador.")
+
+        elif args.command == "stamp":
+            parser_count, geocoder_count = stamp_versions(db)
+            print(f"[REPROCESS] Versiones asignadas: {parser_count} parser, {geocoder_count} geocodificador.")
+
+        elif args.command == "run":
+            db_batch = None if args.new or args.enqueue else find_resumable_batch(db)
+            if db_batch is not None:
+                print(f"[REPROCESS] Reanudando el lote {db_batch.id} ({db_batch.processed}/{db_batch.total}).")
+            else:
+                db_batch = batch.create_batch(
+                    db, models.BatchKind.REPROCESS, schemas.BatchRequest(), enqueue=args.enqueue
+                )
+            if args.enqueue:
+                print(f"[REPROCESS] Lote {db_batch.id} encolado; progreso en GET /batch/{db_batch.id}.")
+                return
+            batch.run_batch(db, db_batch.id, chunk_size=args.chunk_size)
+            db_batch = crud.get_batch(db, db_batch.id)
+            print(f"[REPROCESS] {db_batch.succeeded} reprocesadas, {db_batch.failed} fallidas.")
+
+
+if __name__ == "__main__":
+    main()
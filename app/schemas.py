@@ -1,8 +1,14 @@
 import uuid
 from datetime import datetime
-from pydantic import BaseModel, ConfigDict
+from pydantic import BaseModel, ConfigDict, Field, field_validator
 
-from .models import AddressStatus
+from .models import MAX_ADDRESS_BYTES, AddressStatus, BatchKind, BatchStatus, UploadStatus, address_too_long
+
+
+def _check_address_size(value: str | None) -> str | None:
+    if value is not None and address_too_long(value):
+        raise ValueError(f"La dirección supera los {MAX_ADDRESS_BYTES} bytes")
+    return value
 
 
 # Schema base con los campos compartidos
@@ -27,6 +33,8 @@ class AddressBase(BaseModel):
 class AddressCreate(BaseModel):
     original_address: str
 
+    _check_size = field_validator("original_address")(_check_address_size)
+
 
 # Schema para actualizar una dirección (todos los campos son opcionales)
 class AddressUpdate(BaseModel):
@@ -45,12 +53,80 @@ class AddressUpdate(BaseModel):
     postal_code: str | None = None
     status: AddressStatus | None = None
 
+    _check_size = field_validator("original_address")(_check_address_size)
+
 
 # Schema para leer/devolver una dirección desde la API (incluye campos de la DB)
 class Address(AddressBase):
     id: uuid.UUID
+    canonical_id: uuid.UUID | None = None
+    upload_id: uuid.UUID | None = None
+    geohash: str | None = None
+    parser_version: str | None = None
+    geocoder_version: str | None = None
+    geocode_failed: bool = False
     created_at: datetime
     updated_at: datetime | None = None
 
     # Configuración para que Pydantic pueda leer el modelo de SQLAlchemy
     model_config = ConfigDict(from_attributes=True)
+
+
+# Dirección con su distancia a un punto (`GET /addresses/near`)
+class AddressNearby(Address):
+    distance_meters: float
+
+
+# Vértice de un polígono de consulta
+class Point(BaseModel):
+    latitude: float = Field(ge=-90, le=90)
+    longitude: float = Field(ge=-180, le=180)
+
+
+# Schema para buscar direcciones dentro de un polígono (zona de entrega)
+class PolygonQuery(BaseModel):
+    points: list[Point] = Field(min_length=3)
+
+
+# Schema para consultar el progreso de una subida de archivo
+class Upload(BaseModel):
+    id: uuid.UUID
+    filename: str
+    status: UploadStatus
+    rows_found: int
+    new_addresses_created: int
+    addresses_skipped: int
+    error: str | None = None
+    created_at: datetime
+    updated_at: datetime | None = None
+    finished_at: datetime | None = None
+
+    model_config = ConfigDict(from_attributes=True)
+
+
+# Schema para lanzar un procesamiento por lotes: lista de IDs o filtros
+class BatchRequest(BaseModel):
+    address_ids: list[uuid.UUID] | None = None
+    status: AddressStatus | None = None
+    neighborhood: str | None = None
+    postal_code: str | None = None
+    created_from: datetime | None = None
+    created_to: datetime | None = None
+
+
+# Schema para consultar el progreso de un lote
+class Batch(BaseModel):
+    id: uuid.UUID
+    kind: BatchKind
+    status: BatchStatus
+    total: int
+    processed: int
+    succeeded: int
+    failed: int
+    error: str | None = None
+    created_at: datetime
+    started_at: datetime | None = None
+    finished_at: datetime | None = None
+    rows_per_second: float | None = None
+
+    model_config = ConfigDict(from_attributes=True)
@@ -0,0 +1,98 @@
+"""
+Escritura coalescida de los resultados del pipeline.
+
+Las etapas (parseo, geocodificación) no escriben en la base de datos: dejan
+sus resultados en un `ResultSink`, que los acumula por dirección y los
+escribe juntos cuando se llena (SINK_MAX_ROWS) o cuando pasa SINK_MAX_DELAY
+desde el primer resultado pendiente. Cada flush es una sola transacción:
+un UPDATE ... FROM (VALUES ...) por combinación de campos, la propagación a
+las variantes, el cierre de las tareas de la cola y los eventos de progreso
+(`events`), sin refrescos del ORM.
+"""
+import os
+import threading
+import time
+import uuid
+
+from . import crud, dedup, events, jobs, metrics
+from .database import SessionLocal
+
+SINK_MAX_ROWS = int(os.getenv("SINK_MAX_ROWS", "500"))
+SINK_MAX_DELAY = float(os.getenv("SINK_MAX_DELAY", "2"))
+
+
+class ResultSink:
+    """Acumula los resultados de las etapas y los escribe en bloque."""
+
+    def __init__(self, max_rows: int = SINK_MAX_ROWS, max_delay: float = SINK_MAX_DELAY, session_factory=SessionLocal):
+        self.max_rows = max_rows
+        self.max_delay = max_delay
+        self.session_factory = session_factory
+        self._rows: dict[uuid.UUID, dict] = {}
+        self._job_ids: list[int] = []
+        self._failed: set[uuid.UUID] = set()
+        self._first_at: float | None = None
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._rows)
+
+    def add(self, address_id: uuid.UUID, values: dict, failed: bool = False):
+        """
+        Agrega campos de una dirección; se combinan con los de etapas anteriores.
+        `failed` marca que el procesamiento terminó sin verificarla (evento `failed`).
+        """
+        with self._lock:
+            self._rows.setdefault(address_id, {}).update(values)
+            if failed:
+                self._failed.add(address_id)
+            if self._first_at is None:
+                self._first_at = time.monotonic()
+        self.flush_if_due()
+
+    def complete_jobs(self, job_ids: list[int]):
+        """Las tareas se marcan como terminadas en el mismo flush que sus resultados."""
+        with self._lock:
+            self._job_ids.extend(job_ids)
+            if job_ids and self._first_at is None:
+                self._first_at = time.monotonic()
+
+    def is_due(self) -> bool:
+        if self._first_at is None:
+            return False
+        return len(self._rows) >= self.max_rows or time.monotonic() - self._first_at >= self.max_delay
+
+    def flush_if_due(self):
+        if self.is_due():
+            self.flush()
+
+    def flush(self):
+        """Escribe todo lo pendiente en una sola transacción."""
+        with self._lock:
+            rows, job_ids, failed = self._rows, self._job_ids, self._failed
+            self._rows, self._job_ids, self._failed, self._first_at = {}, [], set(), None
+        if not rows and not job_ids:
+            return
+
+        with self.session_factory() as db, metrics.track("db_write", items=len(rows)):
+            try:
+                # Un UPDATE masivo por cada combinación de campos (p. ej. parseo sin geocodificación)
+                crud.bulk_update_address_rows(db, [{"id": address_id, **values} for address_id, values in rows.items()])
+                # Las variantes enlazadas a estas direcciones reutilizan el resultado
+                dedup.propagate_results(db, rows.keys(), commit=False)
+                jobs.complete_jobs(db, job_ids, commit=False)
+                events.publish_address_changes(db, rows.keys(), failed_ids=failed)
+                db.commit()
+            except Exception:
+                db.rollback()
+                # Las tareas no cerradas vuelven a la cola al vencer su plazo de visibilidad
+                print(f"[SINK] Falló la escritura de {len(rows)} resultados y {len(job_ids)} tareas.")
+                raise
+        print(f"[SINK] {len(rows)} direcciones y {len(job_ids)} tareas escritas en un flush.")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.flush()
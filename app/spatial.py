@@ -0,0 +1,329 @@
+"""
+Índice espacial por geohash y consultas por proximidad, rectángulo y polígono.
+
+Cada dirección geocodificada guarda el geohash de sus coordenadas
+(GEOHASH_PRECISION caracteres, celdas de ~5 m) en una columna con índice
+B-tree (`geohash`, `id`) y collation "C". Las celdas cercanas comparten
+prefijo, así que un área se cubre con unas pocas celdas de menor precisión y
+cada una es un rango del índice (`geohash >= celda AND geohash < celda || '~'`).
+Los rangos acotan las filas candidatas y el filtro exacto por coordenadas
+descarta las que caen en la celda pero fuera del área.
+
+No requiere PostGIS. Para calcular el geohash de las direcciones
+geocodificadas antes de esta función:
+
+    python -m app.spatial backfill
+"""
+import argparse
+import base64
+import math
+import os
+import uuid
+
+from sqlalchemy import and_, func, or_, select, tuple_, update
+from sqlalchemy.orm import Session
+
+from . import metrics, models
+from .database import SessionLocal
+
+GEOHASH_PRECISION = 9
+# Celdas con las que se cubre el área de una consulta (más celdas = menos filas de más)
+SPATIAL_MAX_CELLS = int(os.getenv("SPATIAL_MAX_CELLS", "32"))
+MAX_RADIUS_METERS = 50_000
+
+_BASE32 = "0123456789bcdefghjkmnpqrstuvwxyz"
+_EARTH_RADIUS_METERS = 6_371_008.8
+_METERS_PER_DEGREE = math.pi * _EARTH_RADIUS_METERS / 180
+
+
+# --- Geohash ---
+
+def encode(latitude: float | None, longitude: float | None, precision: int = GEOHASH_PRECISION) -> str | None:
+    """Geohash de un punto; None si falta alguna coordenada."""
+    if latitude is None or longitude is None:
+        return None
+    lat_range = [-90.0, 90.0]
+    lon_range = [-180.0, 180.0]
+    chars = []
+    bits = 0
+    value = 0
+    even = True  # Los bits pares son de longitud
+    while len(chars) < precision:
+        interval, coordinate = (lon_range, longitude) if even else (lat_range, latitude)
+        middle = (interval[0] + interval[1]) / 2
+        value <<= 1
+        if coordinate >= middle:
+            value |= 1
+            interval[0] = middle
+        else:
+            interval[1] = middle
+        even = not even
+        bits += 1
+        if bits == 5:
+            chars.append(_BASE32[value])
+            bits = 0
+            value = 0
+    return "".join(chars)
+
+
+def cell_size(precision: int) -> tuple[float, float]:
+    """Alto y ancho en grados de una celda de la precisión dada."""
+    lon_bits = (5 * precision + 1) // 2
+    lat_bits = 5 * precision // 2
+    return 180.0 / 2 ** lat_bits, 360.0 / 2 ** lon_bits
+
+
+def _cell_indexes(min_lat: float, min_lon: float, max_lat: float, max_lon: float, precision: int):
+    lat_size, lon_size = cell_size(precision)
+    lat_cells = 2 ** (5 * precision // 2)
+    lon_cells = 2 ** ((5 * precision + 1) // 2)
+
+    def index(value: float, origin: float, size: float, count: int) -> int:
+        return min(max(int((value - origin) // size), 0), count - 1)
+
+    return (
+        range(index(min_lat, -90, lat_size, lat_cells), index(max_lat, -90, lat_size, lat_cells) + 1),
+        range(index(min_lon, -180, lon_size, lon_cells), index(max_lon, -180, lon_size, lon_cells) + 1),
+    )
+
+
+def covering_cells(
+    min_lat: float, min_lon: float, max_lat: float, max_lon: float, max_cells: int = SPATIAL_MAX_CELLS
+) -> list[str]:
+    """Celdas de la mayor precisión posible (hasta max_cells) que cubren el rectángulo."""
+    for precision in range(GEOHASH_PRECISION, 0, -1):
+        rows, columns = _cell_indexes(min_lat, min_lon, max_lat, max_lon, precision)
+        if len(rows) * len(columns) <= max_cells or precision == 1:
+            break
+    lat_size, lon_size = cell_size(precision)
+    return sorted(
+        encode(-90 + (row + 0.5) * lat_size, -180 + (column + 0.5) * lon_size, precision)
+        for row in rows
+        for column in columns
+    )
+
+
+def _next_cell(cell: str) -> str | None:
+    """Celda siguiente en el orden del índice, de la misma precisión (None al final)."""
+    chars = list(cell)
+    for position in range(len(chars) - 1, -1, -1):
+        index = _BASE32.index(chars[position])
+        if index < len(_BASE32) - 1:
+            chars[position] = _BASE32[index + 1]
+            return "".join(chars)
+        chars[position] = _BASE32[0]
+    return None
+
+
+def cell_ranges(cells: list[str]) -> list[tuple[str, str]]:
+    """Une las celdas consecutivas en rangos (primera, última) del índice."""
+    ranges = []
+    for cell in sorted(cells):
+        if ranges and _next_cell(ranges[-1][1]) == cell:
+            ranges[-1] = (ranges[-1][0], cell)
+        else:
+            ranges.append((cell, cell))
+    return ranges
+
+
+# --- Geometría ---
+
+def haversine_meters(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    """Distancia sobre la esfera entre dos puntos, en metros."""
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    dphi = phi2 - phi1
+    dlambda = math.radians(lon2 - lon1)
+    a = math.sin(dphi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(dlambda / 2) ** 2
+    return 2 * _EARTH_RADIUS_METERS * math.asin(math.sqrt(a))
+
+
+def bbox_around(latitude: float, longitude: float, radius_meters: float) -> tuple[float, float, float, float]:
+    """Rectángulo (min_lat, min_lon, max_lat, max_lon) que contiene el círculo."""
+    dlat = radius_meters / _METERS_PER_DEGREE
+    dlon = radius_meters / (_METERS_PER_DEGREE * max(math.cos(math.radians(latitude)), 1e-6))
+    return (
+        max(latitude - dlat, -90.0),
+        max(longitude - dlon, -180.0),
+        min(latitude + dlat, 90.0),
+        min(longitude + dlon, 180.0),
+    )
+
+
+def polygon_bbox(points: list[tuple[float, float]]) -> tuple[float, float, float, float]:
+    latitudes = [lat for lat, _ in points]
+    longitudes = [lon for _, lon in points]
+    return min(latitudes), min(longitudes), max(latitudes), max(longitudes)
+
+
+def point_in_polygon(latitude: float, longitude: float, points: list[tuple[float, float]]) -> bool:
+    """Ray casting sobre un polígono simple de puntos (lat, lon)."""
+    inside = False
+    j = len(points) - 1
+    for i in range(len(points)):
+        lat_i, lon_i = points[i]
+        lat_j, lon_j = points[j]
+        if (lat_i > latitude) != (lat_j > latitude):
+            crossing = lon_i + (latitude - lat_i) * (lon_j - lon_i) / (lat_j - lat_i)
+            if longitude < crossing:
+                inside = not inside
+        j = i
+    return inside
+
+
+# --- Consultas ---
+
+def bbox_filters(min_lat: float, min_lon: float, max_lat: float, max_lon: float) -> list:
+    """Condiciones SQL: rangos de geohash (índice) + filtro exacto por coordenadas."""
+    ranges = cell_ranges(covering_cells(min_lat, min_lon, max_lat, max_lon))
+    column = models.Address.geohash
+    return [
+        # Rango total primero: acota el recorrido del índice aunque el planner no use el OR
+        column >= ranges[0][0],
+        column < ranges[-1][1] + "~",
+        or_(*[and_(column >= first, column < last + "~") for first, last in ranges]),
+        models.Address.latitude.between(min_lat, max_lat),
+        models.Address.longitude.between(min_lon, max_lon),
+    ]
+
+
+def encode_cursor(*parts) -> str:
+    """Cursor opaco con la posición de la última fila devuelta."""
+    return base64.urlsafe_b64encode("|".join(str(part) for part in parts).encode()).decode()
+
+
+def _decode_cursor(cursor: str) -> list[str]:
+    try:
+        return base64.urlsafe_b64decode(cursor.encode()).decode().split("|")
+    except Exception as e:
+        raise ValueError("Cursor inválido") from e
+
+
+def _geohash_position(cursor: str) -> tuple[str, uuid.UUID]:
+    try:
+        geohash, address_id = _decode_cursor(cursor)
+        return geohash, uuid.UUID(address_id)
+    except ValueError as e:
+        raise ValueError("Cursor inválido") from e
+
+
+def _page_in_bbox(db: Session, bbox: tuple, limit: int, position: tuple[str, uuid.UUID] | None):
+    query = select(models.Address).where(*bbox_filters(*bbox))
+    if position is not None:
+        query = query.where(tuple_(models.Address.geohash, models.Address.id) > position)
+    return db.execute(query.order_by(models.Address.geohash, models.Address.id).limit(limit)).scalars().all()
+
+
+def find_in_bbox(
+    db: Session, min_lat: float, min_lon: float, max_lat: float, max_lon: float, limit: int = 100, cursor: str | None = None
+) -> tuple[list[models.Address], str | None]:
+    """
+    Direcciones dentro del rectángulo, paginadas por cursor sobre (geohash, id).
+    Devuelve la página y el cursor de la siguiente (None si no hay más).
+    """
+    position = _geohash_position(cursor) if cursor else None
+    with metrics.track("spatial_query"):
+        rows = _page_in_bbox(db, (min_lat, min_lon, max_lat, max_lon), limit, position)
+    next_cursor = encode_cursor(rows[-1].geohash, rows[-1].id) if len(rows) == limit else None
+    return rows, next_cursor
+
+
+def find_in_polygon(
+    db: Session, points: list[tuple[float, float]], limit: int = 100, cursor: str | None = None
+) -> tuple[list[models.Address], str | None]:
+    """
+    Direcciones dentro del polígono. El índice filtra por el rectángulo que lo
+    contiene y el polígono exacto se evalúa aquí sobre las candidatas.
+    """
+    bbox = polygon_bbox(points)
+    position = _geohash_position(cursor) if cursor else None
+    found = []
+    with metrics.track("spatial_query"):
+        while len(found) < limit:
+            candidates = _page_in_bbox(db, bbox, limit, position)
+            found.extend(row for row in candidates if point_in_polygon(row.latitude, row.longitude, points))
+            if len(candidates) < limit:
+                break
+            position = (candidates[-1].geohash, candidates[-1].id)
+    found = found[:limit]
+    next_cursor = encode_cursor(found[-1].geohash, found[-1].id) if len(found) == limit else None
+    return found, next_cursor
+
+
+def distance_expression(latitude: float, longitude: float):
+    """
+    Distancia en metros (aproximación equirectangular; bajo MAX_RADIUS_METERS
+    el error frente a haversine es despreciable) calculable en SQL para ordenar.
+    """
+    dlat = (models.Address.latitude - latitude) * _METERS_PER_DEGREE
+    dlon = (models.Address.longitude - longitude) * (_METERS_PER_DEGREE * math.cos(math.radians(latitude)))
+    return func.sqrt(dlat * dlat + dlon * dlon)
+
+
+def find_near(
+    db: Session, latitude: float, longitude: float, radius_meters: float, limit: int = 10, cursor: str | None = None
+) -> tuple[list[tuple[models.Address, float]], str | None]:
+    """
+    Las `limit` direcciones más cercanas dentro del radio, de la más cercana a
+    la más lejana, con su distancia. El cursor continúa por (distancia, id).
+    """
+    distance = distance_expression(latitude, longitude).label("distance_meters")
+    query = (
+        select(models.Address, distance)
+        .where(*bbox_filters(*bbox_around(latitude, longitude, radius_meters)), distance <= radius_meters)
+    )
+    if cursor:
+        try:
+            last_distance, address_id = _decode_cursor(cursor)
+            position = (float(last_distance), uuid.UUID(address_id))
+        except ValueError as e:
+            raise ValueError("Cursor inválido") from e
+        query = query.where(tuple_(distance, models.Address.id) > position)
+    with metrics.track("spatial_query"):
+        rows = db.execute(query.order_by(distance, models.Address.id).limit(limit)).all()
+    results = [(address, float(distance_meters)) for address, distance_meters in rows]
+    next_cursor = encode_cursor(repr(results[-1][1]), results[-1][0].id) if len(results) == limit else None
+    return results, next_cursor
+
+
+# --- Mantenimiento ---
+
+def backfill_geohashes(db: Session, chunk_size: int = 5000) -> int:
+    """Calcula el geohash de las direcciones geocodificadas que no lo tienen, por bloques."""
+    total = 0
+    last_id = None
+    while True:
+        query = select(models.Address.id, models.Address.latitude, models.Address.longitude).where(
+            models.Address.geohash.is_(None),
+            models.Address.latitude.is_not(None),
+            models.Address.longitude.is_not(None),
+        )
+        if last_id is not None:
+            query = query.where(models.Address.id > last_id)
+        rows = db.execute(query.order_by(models.Address.id).limit(chunk_size)).all()
+        if not rows:
+            return total
+        db.execute(
+            update(models.Address),
+            [{"id": row.id, "geohash": encode(row.latitude, row.longitude)} for row in rows],
+        )
+        db.commit()
+        total += len(rows)
+        last_id = rows[-1].id
+        print(f"[SPATIAL] {total} geohashes calculados...")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Índice espacial de direcciones.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    backfill = subparsers.add_parser("backfill", help="Calcula el geohash de las direcciones geocodificadas.")
+    backfill.add_argument("--chunk-size", type=int, default=5000)
+    args = parser.parse_args()
+
+    with SessionLocal() as db:
+        if args.command == "backfill":
+            total = backfill_geohashes(db, chunk_size=args.chunk_size)
+            print(f"[SPATIAL] Listo: {total} direcciones actualizadas.")
+
+
+if __name__ == "__main__":
+    main()
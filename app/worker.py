@@ -0,0 +1,199 @@
+"""
+Worker de procesamiento de direcciones.
+
+Consume la cola persistente de tareas (`jobs`) con varios hilos en paralelo.
+Se ejecuta como un proceso separado de la API, y se pueden lanzar tantos
+procesos (en una o varias máquinas) como se necesite:
+
+    python -m app.worker --workers 4 --batch-size 50
+
+Con `--metrics-port` (o WORKER_METRICS_PORT) expone sus métricas Prometheus.
+"""
+import argparse
+import os
+import socket
+import threading
+import time
+
+from . import batch, cache, events, jobs, metrics, processing, sink
+from .database import SessionLocal
+
+# Cada cuánto se devuelven a la cola las tareas con visibility timeout vencido
+MAINTENANCE_INTERVAL = float(os.getenv("WORKER_MAINTENANCE_INTERVAL", "60"))
+# Cada cuánto se borran de la caché persistente las entradas vencidas
+CACHE_PURGE_INTERVAL = float(os.getenv("CACHE_PURGE_INTERVAL", "3600"))
+_last_cache_purge = 0.0
+
+
+def process_claimed_jobs(claimed: list, result_sink: sink.ResultSink) -> tuple[list[int], dict]:
+    """
+    Ejecuta un lote de tareas de direcciones reclamadas. Los resultados quedan
+    en `result_sink`.
+    Devuelve los IDs de las tareas terminadas y {tarea: error} de las fallidas.
+    """
+    address_jobs = {job.address_id: job for job in claimed if job.kind == jobs.JOB_PROCESS_ADDRESS}
+    failed = {job: f"Tipo de tarea desconocido: {job.kind}" for job in claimed if job.kind != jobs.JOB_PROCESS_ADDRESS}
+
+    if address_jobs:
+        errors = processing.run_processing_pipeline_batch(list(address_jobs), result_sink)
+        for address_id, error in errors.items():
+            failed[address_jobs[address_id]] = error
+
+    done = [job.id for job in claimed if job not in failed]
+    return done, failed
+
+
+def run_batch_job(job) -> str | None:
+    """
+    Ejecuta una tarea `run_batch`, renovando su plazo desde un hilo mientras
+    corre (un bloque puede tardar más que JOB_VISIBILITY_TIMEOUT). Devuelve el
+    error, o None si terminó.
+    """
+    try:
+        with jobs.heartbeat(job.id), SessionLocal() as db:
+            batch.run_batch(db, job.batch_id, job_id=job.id)
+    except Exception as e:
+        return f"{type(e).__name__}: {e}"
+    return None
+
+
+def fail_claimed_job(db, job, error: str):
+    """
+    Registra el fallo; si agota sus intentos, el lote queda marcado como
+    fallido o la dirección se anuncia como `failed` y sus variantes se
+    desenlazan para procesarlas por separado.
+    """
+    jobs.fail_job(db, job, error)
+    if job.attempts < job.max_attempts:
+        return
+    if job.kind == jobs.JOB_RUN_BATCH:
+        batch.mark_failed(db, job.batch_id, error)
+    elif job.kind == jobs.JOB_PROCESS_ADDRESS:
+        # Sus variantes dejan de esperarla y se encolan por su cuenta
+        released = jobs.release_variants(db, [job.address_id])
+        events.publish_address_changes(db, [job.address_id], failed_ids=[job.address_id])
+        db.commit()
+        jobs.enqueue_addresses(db, released)
+
+
+def worker_loop(worker_id: str, batch_size: int, poll_interval: float, stop: threading.Event):
+    """
+    Bucle de un worker: reclama tareas, las procesa y registra el resultado.
+
+    Las tareas de direcciones terminadas se cierran junto con sus resultados
+    en los flush del sink (por tamaño o por tiempo), no una por una. Los
+    lotes (`run_batch`) se reclaman aparte, de a uno, y antes de ejecutarlos
+    se escribe todo lo pendiente: un lote largo no retiene tareas ni resultados.
+    """
+    print(f"[WORKER] {worker_id} iniciado")
+    result_sink = sink.ResultSink()
+    while not stop.is_set():
+        db = SessionLocal()
+        try:
+            claimed = jobs.claim_jobs(db, worker_id, batch_size, kind=jobs.JOB_PROCESS_ADDRESS)
+            if claimed:
+                try:
+                    done, failed = process_claimed_jobs(claimed, result_sink)
+                except Exception as e:
+                    done, failed = [], {job: f"{type(e).__name__}: {e}" for job in claimed}
+
+                result_sink.complete_jobs(done)
+                result_sink.flush_if_due()
+                for job, error in failed.items():
+                    fail_claimed_job(db, job, error)
+
+            batch_jobs = jobs.claim_jobs(db, worker_id, 1, kind=jobs.JOB_RUN_BATCH)
+            if not claimed and not batch_jobs:
+                result_sink.flush()
+                stop.wait(poll_interval)
+                continue
+            for job in batch_jobs:
+                result_sink.flush()
+                error = run_batch_job(job)
+                if error is None:
+                    jobs.complete_jobs(db, [job.id])
+                else:
+                    fail_claimed_job(db, job, error)
+        except Exception as e:
+            # Error de la propia cola (p. ej. la DB no está disponible): se espera y se reintenta
+            print(f"[WORKER] {worker_id} error: {e}")
+            stop.wait(poll_interval)
+        finally:
+            db.close()
+    try:
+        result_sink.flush()
+    except Exception as e:
+        print(f"[WORKER] {worker_id} error al escribir los resultados pendientes: {e}")
+    print(f"[WORKER] {worker_id} detenido")
+
+
+def run_maintenance():
+    """
+    Devuelve a la cola las tareas vencidas, encola direcciones pendientes
+    huérfanas y, cada CACHE_PURGE_INTERVAL, purga las entradas vencidas de la caché.
+    """
+    global _last_cache_purge
+    db = SessionLocal()
+    try:
+        jobs.requeue_expired_jobs(db)
+        jobs.enqueue_orphan_addresses(db)
+    except Exception as e:
+        print(f"[WORKER] Error en el mantenimiento de la cola: {e}")
+    finally:
+        db.close()
+
+    if time.monotonic() - _last_cache_purge < CACHE_PURGE_INTERVAL:
+        return
+    _last_cache_purge = time.monotonic()
+    for result_cache in cache.TwoTierCache.instances():
+        try:
+            deleted = result_cache.purge_expired()
+            if deleted:
+                print(f"[WORKER] Caché '{result_cache.namespace}': {deleted} entradas vencidas eliminadas")
+        except Exception as e:
+            print(f"[WORKER] Error al purgar la caché '{result_cache.namespace}': {e}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Worker de procesamiento de direcciones de GeoFull.")
+    parser.add_argument("--workers", type=int, default=int(os.getenv("WORKER_CONCURRENCY", "4")))
+    parser.add_argument("--batch-size", type=int, default=processing.AI_BATCH_MAX_SIZE)
+    parser.add_argument("--poll-interval", type=float, default=float(os.getenv("WORKER_POLL_INTERVAL", "2")))
+    parser.add_argument("--metrics-port", type=int, default=int(os.getenv("WORKER_METRICS_PORT", "0")))
+    args = parser.parse_args()
+
+    if args.metrics_port:
+        metrics.start_server(args.metrics_port)
+
+    # Clientes externos (IA, geocodificadores) una sola vez, antes de reclamar tareas
+    processing.init_clients()
+
+    run_maintenance()
+
+    stop = threading.Event()
+    prefix = f"{socket.gethostname()}:{os.getpid()}"
+    threads = [
+        threading.Thread(
+            target=worker_loop,
+            args=(f"{prefix}:{index}", args.batch_size, args.poll_interval, stop),
+            name=f"worker-{index}",
+            daemon=True,
+        )
+        for index in range(args.workers)
+    ]
+    for thread in threads:
+        thread.start()
+
+    try:
+        while True:
+            time.sleep(MAINTENANCE_INTERVAL)
+            run_maintenance()
+    except KeyboardInterrupt:
+        print("[WORKER] Deteniendo workers...")
+        stop.set()
+        for thread in threads:
+            thread.join()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,9 @@
+"""
+Benchmarks de extremo a extremo (subida -> normalizada -> verificada -> exportación)
+contra servidores simulados de Gemini y Nominatim y un PostgreSQL local.
+
+    python -m bench.run --sizes 1000 10000 --save-baseline
+    python -m bench.startup --runs 5     # arranque en frío de la API
+
+Ver `bench/run.py` y `bench/startup.py` para las opciones.
+"""
@@ -0,0 +1,107 @@
+"""
+Generador de archivos sintéticos de direcciones de Medellín.
+
+Mezcla abreviaturas, letras, "bis", cuadrantes, apartamentos, barrios y
+notas, en proporciones parecidas a los archivos reales. Una fracción de las
+filas son descripciones sin nomenclatura ("frente al parque...") que el
+parser por reglas no resuelve y terminan en la IA, y otra fracción son
+variantes de direcciones anteriores (para ejercitar la deduplicación).
+
+    python -m bench.data --rows 10000 --output bench/data/addresses_10k.csv
+"""
+import argparse
+import csv
+import random
+
+VIAS = ["Calle", "Cl", "Cll", "Carrera", "Cra", "Kr", "Cr", "Avenida", "Av", "Circular", "Cq", "Transversal", "Tv", "Diagonal", "Dg"]
+LETTERS = ["", "", "", "", "A", "B", "C", "AA", "BB"]
+QUADRANTS = ["", "", "", "", "", "Sur", "Este"]
+APARTMENTS = ["apto {n}", "Apto. {n}", "apartamento {n}", "int {n}", "casa {n}", "local {n}", "piso {p}", "torre {t} apto {n}"]
+NEIGHBORHOODS = [
+    "Laureles", "El Poblado", "Belén", "Robledo", "Castilla", "Manrique", "Buenos Aires", "La América",
+    "Estadio", "Envigado", "Aranjuez", "San Javier", "Boston", "Prado", "Calasanz", "Los Colores",
+]
+NOTES = ["portería", "casa azul", "al lado de la tienda", "segundo piso", "edificio Torres del Río", "timbre dañado"]
+LANDMARKS = [
+    "frente al parque de {b}", "diagonal a la iglesia de {b}", "al lado del colegio, barrio {b}",
+    "detrás de la estación del metro {b}", "vereda {b}, finca la esperanza",
+]
+
+
+def _street(rng: random.Random) -> str:
+    via = rng.choice(VIAS)
+    number = rng.randint(1, 120)
+    letter = rng.choice(LETTERS)
+    bis = " bis" if rng.random() < 0.05 else ""
+    cross = rng.randint(1, 120)
+    cross_letter = rng.choice(LETTERS)
+    plate = rng.randint(1, 99)
+    quadrant = rng.choice(QUADRANTS)
+    separator = rng.choice([" # ", " #", "#", " No. ", " N° ", " "])
+    dash = rng.choice(["-", " - ", " "])
+    return f"{via} {number}{letter}{bis}{separator}{cross}{cross_letter}{dash}{plate} {quadrant}".strip()
+
+
+def generate_address(rng: random.Random) -> str:
+    """Una dirección sintética."""
+    if rng.random() < 0.05:
+        return rng.choice(LANDMARKS).format(b=rng.choice(NEIGHBORHOODS))
+
+    parts = [_street(rng)]
+    if rng.random() < 0.4:
+        apartment = rng.choice(APARTMENTS)
+        parts.append(apartment.format(n=rng.randint(101, 2504), p=rng.randint(2, 20), t=rng.randint(1, 6)))
+    if rng.random() < 0.5:
+        parts.append(rng.choice(NEIGHBORHOODS))
+    if rng.random() < 0.1:
+        parts.append(rng.choice(NOTES))
+    if rng.random() < 0.3:
+        parts.append(rng.choice(["Medellín", "Medellin", "Medellín, Antioquia"]))
+    text = rng.choice([", ", " ", " - "]).join(parts)
+    return text.upper() if rng.random() < 0.1 else text
+
+
+def _variant(rng: random.Random, address: str) -> str:
+    """Variante de una dirección: cambia mayúsculas, espacios o agrega un piso."""
+    choice = rng.random()
+    if choice < 0.4:
+        return address.lower()
+    if choice < 0.7:
+        return address.replace(" ", "  ", 1)
+    return f"{address} piso {rng.randint(2, 9)}"
+
+
+def generate_addresses(rows: int, seed: int = 42, variant_rate: float = 0.05):
+    """Genera `rows` direcciones de forma determinista para una semilla."""
+    rng = random.Random(seed)
+    produced = []
+    for _ in range(rows):
+        if produced and rng.random() < variant_rate:
+            address = _variant(rng, rng.choice(produced))
+        else:
+            address = generate_address(rng)
+        produced.append(address)
+        yield address
+
+
+def write_csv(path: str, rows: int, seed: int = 42):
+    """Escribe un CSV con la columna `direccion`."""
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(["direccion"])
+        for address in generate_addresses(rows, seed):
+            writer.writerow([address])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Genera direcciones sintéticas para los benchmarks.")
+    parser.add_argument("--rows", type=int, required=True)
+    parser.add_argument("--output", required=True)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+    write_csv(args.output, args.rows, args.seed)
+    print(f"[BENCH] {args.rows} direcciones escritas en {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,150 @@
+"""
+Servidores locales que imitan a Gemini (API REST `generateContent`),
+Nominatim (`/search`) y Mapbox (`/geocoding/v5/mapbox.places/...`), con
+latencia, tasa de errores y límite de tasa configurables. Permiten medir el
+pipeline sin consumir cuota.
+
+    python -m bench.fake_services --service nominatim --port 8801 --latency 0.05 --rate 50
+    python -m bench.fake_services --service gemini --port 8802 --latency 0.8 --error-rate 0.02
+
+El límite de tasa responde 429 con Retry-After, como los servicios reales.
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import random
+import re
+import time
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+
+# Centro aproximado de Medellín; las coordenadas simuladas se reparten alrededor
+_CENTER = (6.2442, -75.5812)
+
+
+class _RateLimiter:
+    """Token bucket por servidor; sin tokens, la petición recibe un 429."""
+
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.capacity = max(burst, 1)
+        self.tokens = float(self.capacity)
+        self.updated = time.monotonic()
+
+    def allow(self) -> bool:
+        if self.rate <= 0:
+            return True
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return True
+        return False
+
+
+def _fake_point(text: str) -> tuple[float, float, str]:
+    """Coordenadas y código postal deterministas a partir del texto."""
+    digest = hashlib.sha256(text.lower().encode("utf-8")).digest()
+    lat = _CENTER[0] + (digest[0] - 128) / 2000
+    lon = _CENTER[1] + (digest[1] - 128) / 2000
+    return lat, lon, f"0500{digest[2] % 50:02d}"
+
+
+def _fake_parse(address: str) -> dict:
+    """Respuesta plausible del modelo: la calle es el texto hasta la primera coma."""
+    head, _, rest = address.partition(",")
+    return {"street_info": head.strip() or None, "neighborhood": rest.strip() or None, "apartment_info": None, "notes": None}
+
+
+def create_app(service: str, latency: float, jitter: float, error_rate: float, rate: float, burst: int, empty_rate: float):
+    app = FastAPI(title=f"Fake {service}")
+    limiter = _RateLimiter(rate, burst)
+    stats = {"requests": 0, "throttled": 0, "errors": 0}
+
+    async def simulate():
+        """Aplica límite de tasa, latencia y errores. Devuelve una respuesta de error o None."""
+        stats["requests"] += 1
+        if not limiter.allow():
+            stats["throttled"] += 1
+            return JSONResponse({"error": "rate limited"}, status_code=429, headers={"Retry-After": "1"})
+        await asyncio.sleep(max(0.0, random.gauss(latency, jitter)))
+        if random.random() < error_rate:
+            stats["errors"] += 1
+            return JSONResponse({"error": "simulated failure"}, status_code=503)
+        return None
+
+    @app.get("/stats")
+    def read_stats():
+        return stats
+
+    if service == "nominatim":
+        @app.get("/search")
+        async def search(q: str):
+            error = await simulate()
+            if error is not None:
+                return error
+            if random.random() < empty_rate:
+                return []
+            lat, lon, postcode = _fake_point(q)
+            return [{"lat": str(lat), "lon": str(lon), "display_name": f"{q} (simulado)", "address": {"postcode": postcode}}]
+
+    elif service == "mapbox":
+        @app.get("/geocoding/v5/mapbox.places/{query:path}.json")
+        async def places(query: str):
+            error = await simulate()
+            if error is not None:
+                return error
+            if random.random() < empty_rate:
+                return {"features": []}
+            lat, lon, postcode = _fake_point(query)
+            return {"features": [{
+                "center": [lon, lat],
+                "place_name": f"{query} (simulado)",
+                "context": [{"id": "postcode.1", "text": postcode}],
+            }]}
+
+    else:
+        @app.post("/v1beta/models/{model_action}")
+        async def generate_content(model_action: str, request: Request):
+            error = await simulate()
+            if error is not None:
+                return error
+            body = await request.json()
+            prompt = body["contents"][0]["parts"][0]["text"]
+            single = re.search(r'Dirección Bruta: "(.*)"', prompt)
+            if single:
+                text = json.dumps(_fake_parse(single.group(1)), ensure_ascii=False)
+            else:
+                # Prompt por lotes: el arreglo JSON de entrada va después del encabezado
+                payload = prompt.split("**Analiza estas direcciones:**", 1)[1].rsplit("JSON:", 1)[0]
+                items = json.loads(payload.strip())
+                text = json.dumps([{"id": item["id"], **_fake_parse(item["address"])} for item in items], ensure_ascii=False)
+            return {"candidates": [{"content": {"parts": [{"text": text}]}}]}
+
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Servidor simulado de Gemini, Nominatim o Mapbox.")
+    parser.add_argument("--service", choices=["gemini", "nominatim", "mapbox"], required=True)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, required=True)
+    parser.add_argument("--latency", type=float, default=0.05, help="Latencia media en segundos.")
+    parser.add_argument("--jitter", type=float, default=0.01, help="Desviación estándar de la latencia.")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fracción de respuestas 503.")
+    parser.add_argument("--rate", type=float, default=0.0, help="Solicitudes por segundo (0 = sin límite).")
+    parser.add_argument("--burst", type=int, default=10)
+    parser.add_argument("--empty-rate", type=float, default=0.02, help="Fracción de búsquedas sin resultados.")
+    args = parser.parse_args()
+
+    import uvicorn
+
+    app = create_app(args.service, args.latency, args.jitter, args.error_rate, args.rate, args.burst, args.empty_rate)
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
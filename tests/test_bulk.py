@@ -0,0 +1,56 @@
+"""Lectura por streaming del cuerpo de `POST /addresses/bulk` (`bulk`)."""
+import asyncio
+
+from app import bulk
+
+
+async def _chunks(*chunks):
+    for chunk in chunks:
+        yield chunk
+
+
+def collect(iterator, *chunks):
+    async def run():
+        return [row async for row in iterator(_chunks(*chunks))]
+
+    return asyncio.run(run())
+
+
+def test_ndjson_rows_split_across_chunks():
+    rows = collect(
+        bulk.iter_ndjson,
+        b'{"original_address": "Calle 10 # 43-20", "external_id": "a1"}\n{"original_add',
+        b'ress": "Cra 44B # 13-16"}\n\n"Cl 33 # 65-12"',
+    )
+    assert [(row.line, row.original_address, row.external_id, row.error) for row in rows] == [
+        (1, "Calle 10 # 43-20", "a1", None),
+        (2, "Cra 44B # 13-16", None, None),
+        (4, "Cl 33 # 65-12", None, None),  # La línea vacía cuenta
+    ]
+
+
+def test_ndjson_invalid_rows_keep_their_line():
+    rows = collect(bulk.iter_ndjson, b'{"original_address": ""}\n{no json}\n42\n{"address": "Calle 1 # 2-3", "external_id": true}\n')
+    assert [row.line for row in rows] == [1, 2, 3, 4]
+    assert all(row.error for row in rows)
+
+
+def test_ndjson_oversized_row_is_skipped(monkeypatch):
+    monkeypatch.setattr(bulk, "BULK_MAX_ROW_BYTES", 16)
+    rows = collect(bulk.iter_ndjson, b'"' + b"x" * 20, b'x"\n"Calle 1 # 2-3"\n')
+    assert rows[0].line == 1 and "supera" in rows[0].error
+    assert (rows[1].line, rows[1].original_address) == (2, "Calle 1 # 2-3")
+
+
+def test_json_array_streamed_elements():
+    rows = collect(bulk.iter_json_array, b' [ {"original_address": "Calle 1', b' # 2-3"}, "Cra 4 # 5-6" ', b"]")
+    assert [(row.line, row.original_address) for row in rows] == [(1, "Calle 1 # 2-3"), (2, "Cra 4 # 5-6")]
+
+
+def test_json_array_errors():
+    assert collect(bulk.iter_json_array, b'{"original_address": "x"}')[0].error == "El cuerpo debe ser un arreglo JSON"
+    incomplete = collect(bulk.iter_json_array, b'["Calle 1 # 2-3", ')
+    assert incomplete[0].original_address == "Calle 1 # 2-3"
+    assert incomplete[-1].error == "El arreglo JSON está incompleto"
+    trailing = collect(bulk.iter_json_array, b'["Calle 1 # 2-3"] x')
+    assert trailing[-1].error == "Datos después del final del arreglo"
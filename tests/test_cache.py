@@ -0,0 +1,95 @@
+"""Caché de dos niveles: expiración y caché negativa (`cache`)."""
+from app import cache
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class MemoryBackend:
+    """Almacenamiento persistente en un dict, con las llamadas registradas."""
+
+    def __init__(self):
+        self.data = {}
+        self.calls = []
+
+    def get(self, key):
+        self.calls.append(("get", key))
+        return self.data.get(key, cache.MISSING)
+
+    def get_many(self, keys):
+        self.calls.append(("get_many", tuple(keys)))
+        return {key: self.data[key] for key in keys if key in self.data}
+
+    def set(self, key, value, ttl):
+        self.calls.append(("set", key, ttl))
+        self.data[key] = value
+
+
+def test_lru_expires_entries(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(cache.time, "monotonic", clock)
+    lru = cache.LRUCache(maxsize=10)
+    lru.set("a", 1, ttl=5)
+    clock.now += 4
+    assert lru.get("a") == 1
+    clock.now += 2
+    assert lru.get("a") is cache.MISSING
+
+
+def test_lru_evicts_least_recent():
+    lru = cache.LRUCache(maxsize=2)
+    lru.set("a", 1, ttl=60)
+    lru.set("b", 2, ttl=60)
+    lru.get("a")
+    lru.set("c", 3, ttl=60)
+    assert lru.get("b") is cache.MISSING
+    assert lru.get("a") == 1 and lru.get("c") == 3
+
+
+def test_negative_results_use_their_own_ttl(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(cache.time, "monotonic", clock)
+    backend = MemoryBackend()
+    two_tier = cache.TwoTierCache("test", maxsize=10, ttl=100, negative_ttl=10, backend=backend)
+
+    two_tier.set("found", {"lat": 1})
+    two_tier.set("not found", None)
+    assert ("set", "found", 100) in backend.calls
+    assert ("set", "not found", 10) in backend.calls
+
+    # None cacheado es un acierto ("sin resultados"), distinto de MISSING
+    assert two_tier.get("not found") is None
+    assert two_tier.stats()["negative_hits"] == 1
+
+    # Vencida en memoria se vuelve a leer del almacenamiento persistente
+    clock.now += 11
+    backend.calls.clear()
+    assert two_tier.get("not found") is None
+    assert backend.calls == [("get", "not found")]
+    assert two_tier.get("found") == {"lat": 1}
+    assert ("get", "found") not in backend.calls
+
+
+def test_get_many_reads_backend_once():
+    backend = MemoryBackend()
+    backend.data.update({"b": {"lat": 2}, "c": None})
+    two_tier = cache.TwoTierCache("test", maxsize=10, ttl=100, negative_ttl=10, backend=backend)
+    two_tier.set("a", {"lat": 1})
+    backend.calls.clear()
+
+    found = two_tier.get_many(["a", "b", "c", "d", "b"])
+    assert found == {"a": {"lat": 1}, "b": {"lat": 2}, "c": None}
+    assert backend.calls == [("get_many", ("b", "c", "d"))]
+    # Quedaron en memoria: la siguiente lectura no va al almacenamiento
+    backend.calls.clear()
+    assert two_tier.get_many(["b", "c"]) == {"b": {"lat": 2}, "c": None}
+    assert backend.calls == []
+
+
+def test_canonicalize():
+    assert cache.canonicalize("  Cra. 44B  #13 - 16 , MEDELLÍN ") == cache.canonicalize("cra. 44b # 13-16, medellin")
@@ -0,0 +1,29 @@
+"""Geocodificadores contra los servicios simulados de bench/."""
+import asyncio
+
+import pytest
+
+httpx = pytest.importorskip("httpx")
+pytest.importorskip("fastapi")
+
+from app import geocoders, http_client  # noqa: E402
+from bench import fake_services  # noqa: E402
+
+
+def test_mapbox_address_with_hash(monkeypatch):
+    """Las direcciones normalizadas llevan "#": debe viajar en la ruta, no como fragmento."""
+    app = fake_services.create_app("mapbox", latency=0, jitter=0, error_rate=0, rate=0, burst=1, empty_rate=0)
+    address = "Carrera 72A # 113-21, Medellin, Colombia"
+
+    async def geocode():
+        client = httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://fake")
+        monkeypatch.setattr(http_client, "_client", client)
+        try:
+            geocoder = geocoders.MapboxGeocoder("token", url="http://fake/geocoding/v5/mapbox.places")
+            return await geocoder.geocode(address)
+        finally:
+            await client.aclose()
+
+    result = asyncio.run(geocode())
+    assert result is not None
+    assert result["suggested_address"] == f"{address} (simulado)"
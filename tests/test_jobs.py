@@ -0,0 +1,82 @@
+"""Transiciones de estado de la cola de tareas (`jobs`)."""
+from datetime import datetime, timezone
+from types import SimpleNamespace
+
+from sqlalchemy.dialects import postgresql
+
+from app import jobs, models
+
+
+class RecordingSession:
+    """Sesión que registra las sentencias en lugar de ejecutarlas."""
+
+    def __init__(self):
+        self.statements = []
+        self.commits = 0
+
+    def execute(self, statement, *args):
+        self.statements.append(statement)
+        return SimpleNamespace(all=lambda: [], rowcount=0)
+
+    def commit(self):
+        self.commits += 1
+
+
+def compiled(statement):
+    return statement.compile(dialect=postgresql.dialect())
+
+
+def test_failed_job_is_rescheduled_with_backoff():
+    db = RecordingSession()
+    before = datetime.now(timezone.utc)
+    jobs.fail_job(db, SimpleNamespace(id=1, attempts=1, max_attempts=3), "geocode_unavailable")
+
+    params = compiled(db.statements[0]).params
+    assert params["status"] == models.JobStatus.PENDING
+    assert params["last_error"] == "geocode_unavailable"
+    assert params["locked_until"] is None
+    delay = (params["run_after"] - before).total_seconds()
+    assert jobs.JOB_BACKOFF_BASE * 0.5 <= delay <= jobs.JOB_BACKOFF_BASE + 1
+    assert db.commits == 1
+
+
+def test_job_out_of_attempts_goes_dead():
+    db = RecordingSession()
+    jobs.fail_job(db, SimpleNamespace(id=1, attempts=3, max_attempts=3), "x" * 5000)
+
+    params = compiled(db.statements[0]).params
+    assert params["status"] == models.JobStatus.DEAD
+    assert "run_after" not in params
+    assert len(params["last_error"]) == 2000
+
+
+def test_backoff_grows_and_is_capped(monkeypatch):
+    monkeypatch.setattr(jobs.random, "uniform", lambda low, high: high)
+    delays = [jobs.backoff_delay(attempts) for attempts in range(1, 20)]
+    assert delays[:3] == [jobs.JOB_BACKOFF_BASE, jobs.JOB_BACKOFF_BASE * 2, jobs.JOB_BACKOFF_BASE * 4]
+    assert max(delays) == jobs.JOB_BACKOFF_MAX
+    assert delays == sorted(delays)
+
+
+def test_claim_skips_locked_rows_and_filters_kind():
+    db = RecordingSession()
+    jobs.claim_jobs(db, "worker-1", limit=10, kind=jobs.JOB_RUN_BATCH)
+
+    sql = str(compiled(db.statements[0]))
+    params = compiled(db.statements[0]).params
+    assert "FOR UPDATE SKIP LOCKED" in sql
+    assert params["status"] == models.JobStatus.RUNNING
+    assert params["locked_by"] == "worker-1"
+    assert jobs.JOB_RUN_BATCH in params.values()
+    assert models.JobStatus.PENDING in params.values()
+
+
+def test_complete_jobs_marks_done():
+    db = RecordingSession()
+    jobs.complete_jobs(db, [1, 2], commit=False)
+    params = compiled(db.statements[0]).params
+    assert params["status"] == models.JobStatus.DONE
+    assert db.commits == 0
+
+    jobs.complete_jobs(db, [])
+    assert len(db.statements) == 1
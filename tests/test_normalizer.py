@@ -0,0 +1,65 @@
+"""Parser de direcciones por reglas (`normalizer`)."""
+import pytest
+
+from app import normalizer
+
+
+@pytest.mark.parametrize(
+    "address, street_info",
+    [
+        ("Cra 44B # 13-16", "Carrera 44B # 13-16"),
+        ("av. carrera 44B calle 13-16", "Carrera 44B # 13-16"),
+        ("CL 10 sur # 43A-20", "Calle 10 Sur # 43A-20"),
+        ("Carrera 43A # 1-100 sur", "Carrera 43A # 1-100 Sur"),
+        ("Carrera 43A # 1 sur-100", "Carrera 43A # 1-100 Sur"),
+        ("Calle 33 bis # 65-12", "Calle 33 Bis # 65-12"),
+        ("KR 72A N° 113-21", "Carrera 72A # 113-21"),
+    ],
+)
+def test_street_info(address, street_info):
+    parsed = normalizer.parse_address(address)
+    assert parsed["street_info"] == street_info
+    assert normalizer.is_confident(parsed)
+
+
+def test_remainder_is_split():
+    parsed = normalizer.parse_address("Calle 10 # 43-20 apto 301, Barrio El Poblado, Medellín, frente al parque")
+    assert parsed["street_info"] == "Calle 10 # 43-20"
+    assert parsed["apartment_info"] == "apto 301"
+    assert parsed["neighborhood"] == "Barrio El Poblado"
+    assert parsed["notes"] == "frente al parque"
+
+
+def test_unrecognized_street_has_no_confidence():
+    parsed = normalizer.parse_address("Finca La Esperanza, vereda El Salado")
+    assert parsed["street_info"] is None
+    assert not normalizer.is_confident(parsed)
+
+
+@pytest.mark.parametrize(
+    "variant",
+    ["Cra 72A #113-21", "carrera 72 a 113 21", "CR72A#113-21 piso 2", "Carrera 72A # 113-21, Medellín, Colombia"],
+)
+def test_fingerprint_groups_variants(variant):
+    assert normalizer.fingerprint(variant) == "carrera 72a|113|21"
+
+
+def test_fingerprint_quadrant_position():
+    assert normalizer.fingerprint("Carrera 43A # 1 sur-100") == normalizer.fingerprint("Cra 43A #1-100 Sur")
+
+
+def test_fingerprint_separates_neighborhoods():
+    laureles = normalizer.fingerprint("Cra 72A #113-21, Barrio Laureles")
+    assert laureles == "carrera 72a|113|21|laureles"
+    assert laureles == normalizer.fingerprint("Carrera 72A # 113-21, Laureles")
+    assert laureles != normalizer.fingerprint("Cra 72A #113-21, Belén")
+
+
+def test_fingerprint_words_keep_number_order():
+    assert normalizer.fingerprint("Finca 3, Lote 5") == normalizer.fingerprint("lote finca 3 5")
+    assert normalizer.fingerprint("finca 3 lote 5") != normalizer.fingerprint("finca 5 lote 3")
+
+
+@pytest.mark.parametrize("address", ["", "   ", "---"])
+def test_fingerprint_empty(address):
+    assert normalizer.fingerprint(address) is None
@@ -0,0 +1,28 @@
+"""Cursores opacos de la paginación por keyset (`crud`, `spatial`)."""
+import uuid
+from datetime import datetime, timezone
+from types import SimpleNamespace
+
+import pytest
+
+from app import crud, spatial
+
+
+def test_address_cursor_roundtrip():
+    address = SimpleNamespace(created_at=datetime(2025, 3, 1, 12, 30, 5, 123456, tzinfo=timezone.utc), id=uuid.uuid4())
+    cursor = crud.encode_cursor(address)
+    assert crud.decode_cursor(cursor) == (address.created_at, address.id)
+
+
+@pytest.mark.parametrize("cursor", ["", "no-es-base64!", "MjAyNS0wMy0wMQ"])
+def test_address_cursor_invalid(cursor):
+    with pytest.raises(ValueError):
+        crud.decode_cursor(cursor)
+
+
+def test_geohash_cursor_roundtrip():
+    address_id = uuid.uuid4()
+    cursor = spatial.encode_cursor("d3f5kz8vq", address_id)
+    assert spatial._geohash_position(cursor) == ("d3f5kz8vq", address_id)
+    with pytest.raises(ValueError):
+        spatial._geohash_position(spatial.encode_cursor("d3f5kz8vq"))
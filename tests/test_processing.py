@@ -0,0 +1,90 @@
+"""Parseo con IA por micro-lotes: división y reintento (`processing`)."""
+import json
+import re
+from types import SimpleNamespace
+
+import pytest
+
+from app import http_client, processing
+
+
+class FakeModel:
+    """
+    Modelo que responde bien a lotes de hasta `max_batch` direcciones, con
+    JSON inválido a los más grandes y omitiendo las de `drop` una vez.
+    """
+
+    def __init__(self, max_batch: int, drop=()):
+        self.max_batch = max_batch
+        self.drop = set(drop)
+        self.batches = []
+
+    async def generate_content_async(self, prompt, generation_config=None):
+        payload = re.search(r"^\s*(\[\{.*\}\])\s*$", prompt, re.MULTILINE)
+        if payload is None:
+            # Prompt individual: la dirección va después de los ejemplos
+            address = re.findall(r'Dirección Bruta: "(.*)"', prompt)[-1]
+            self.batches.append([address])
+            return SimpleNamespace(text=json.dumps(self._parsed(address)))
+        items = json.loads(payload.group(1))
+        self.batches.append([item["address"] for item in items])
+        if len(items) > self.max_batch:
+            return SimpleNamespace(text="Lo siento, no puedo")
+        results = []
+        for item in items:
+            if item["address"] in self.drop:
+                self.drop.discard(item["address"])
+                continue
+            results.append({"id": item["id"], **self._parsed(item["address"])})
+        return SimpleNamespace(text=f"```json\n{json.dumps(results)}\n```")
+
+    @staticmethod
+    def _parsed(address):
+        return {"street_info": address.upper(), "neighborhood": None, "apartment_info": None, "notes": None}
+
+
+@pytest.fixture
+def model(monkeypatch):
+    model = FakeModel(max_batch=2)
+    monkeypatch.setattr(processing, "get_ai_model", lambda: model)
+    monkeypatch.setattr(http_client, "gemini", http_client.Provider("gemini", rate=0, max_retries=0))
+    monkeypatch.setattr(processing, "_ai_batch_size", 8)
+    return model
+
+
+def test_invalid_batch_is_split_until_it_succeeds(model):
+    items = [(str(index), f"finca {index}") for index in range(8)]
+    results = processing._parse_batch_with_ai(model, items)
+
+    assert {item_id: value["street_info"] for item_id, value in results.items()} == {
+        item_id: address.upper() for item_id, address in items
+    }
+    assert [len(batch) for batch in model.batches] == [8, 4, 2, 2, 4, 2, 2]
+
+
+def test_batch_size_halves_on_failure_and_grows_on_success(monkeypatch):
+    monkeypatch.setattr(processing, "_ai_batch_size", 20)
+    processing._adjust_batch_size(False)
+    assert processing._ai_batch_size == 10
+    processing._adjust_batch_size(True)
+    assert processing._ai_batch_size == 15
+    monkeypatch.setattr(processing, "_ai_batch_size", processing.AI_BATCH_MAX_SIZE)
+    processing._adjust_batch_size(True)
+    assert processing._ai_batch_size == processing.AI_BATCH_MAX_SIZE
+
+
+def test_partial_response_retries_only_missing(model):
+    model.drop = {"finca 1"}
+    items = [("0", "finca 0"), ("1", "finca 1")]
+    results = processing._parse_batch_with_ai(model, items)
+
+    assert set(results) == {"0", "1"}
+    assert model.batches == [["finca 0", "finca 1"], ["finca 1"]]
+
+
+def test_parse_batch_response_formats():
+    assert processing._parse_batch_response('{"results": [{"id": 1, "street_info": "Calle 1"}]}') == {
+        "1": {"street_info": "Calle 1", "neighborhood": None, "apartment_info": None, "notes": None}
+    }
+    with pytest.raises(ValueError):
+        processing._parse_batch_response('{"street_info": "Calle 1"}')
@@ -0,0 +1,86 @@
+"""Escritura coalescida de resultados (`sink`)."""
+import uuid
+
+import pytest
+
+from app import sink
+
+
+class FakeSession:
+    def __init__(self, log):
+        self.log = log
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def commit(self):
+        self.log.append(("commit",))
+
+    def rollback(self):
+        self.log.append(("rollback",))
+
+
+@pytest.fixture
+def log(monkeypatch):
+    log = []
+    monkeypatch.setattr(sink.crud, "bulk_update_address_rows", lambda db, rows: log.append(("update", rows)))
+    monkeypatch.setattr(sink.dedup, "propagate_results", lambda db, ids, commit: log.append(("propagate", set(ids))))
+    monkeypatch.setattr(sink.jobs, "complete_jobs", lambda db, ids, commit: log.append(("complete", list(ids))))
+    monkeypatch.setattr(
+        sink.events, "publish_address_changes", lambda db, ids, failed_ids: log.append(("publish", set(ids), set(failed_ids)))
+    )
+    return log
+
+
+def make_sink(log, **options):
+    return sink.ResultSink(session_factory=lambda: FakeSession(log), **options)
+
+
+def test_stages_are_merged_into_one_row(log):
+    address_id = uuid.uuid4()
+    result_sink = make_sink(log, max_rows=100, max_delay=60)
+    result_sink.add(address_id, {"normalized_address": "Calle 10 # 43-20", "status": "normalized"})
+    result_sink.add(address_id, {"latitude": 6.2, "status": "verified"})
+    result_sink.complete_jobs([7])
+    assert log == []
+
+    result_sink.flush()
+    assert log[0] == ("update", [{"id": address_id, "normalized_address": "Calle 10 # 43-20", "latitude": 6.2, "status": "verified"}])
+    assert ("complete", [7]) in log
+    assert log[-1] == ("commit",)
+    assert len(result_sink) == 0
+
+
+def test_flushes_when_full(log):
+    result_sink = make_sink(log, max_rows=2, max_delay=60)
+    result_sink.add(uuid.uuid4(), {"status": "normalized"})
+    assert log == []
+    result_sink.add(uuid.uuid4(), {"status": "normalized"})
+    assert sum(1 for entry in log if entry[0] == "commit") == 1
+
+
+def test_flushes_when_due(log, monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(sink.time, "monotonic", lambda: now[0])
+    result_sink = make_sink(log, max_rows=100, max_delay=2)
+    result_sink.add(uuid.uuid4(), {"status": "normalized"})
+    assert not result_sink.is_due()
+    now[0] += 2
+    result_sink.flush_if_due()
+    assert ("commit",) in log
+
+
+def test_failed_rows_are_published_as_failed(log):
+    ok, failed = uuid.uuid4(), uuid.uuid4()
+    with make_sink(log) as result_sink:
+        result_sink.add(ok, {"status": "verified"})
+        result_sink.add(failed, {"geocode_failed": True}, failed=True)
+    assert ("publish", {ok, failed}, {failed}) in log
+
+
+def test_empty_flush_does_nothing(log):
+    make_sink(log).flush()
+    assert log == []
@@ -0,0 +1,48 @@
+"""Geohash y cobertura de áreas (`spatial`)."""
+import pytest
+
+from app import spatial
+
+
+def test_encode_known_point():
+    assert spatial.encode(57.64911, 10.40744, precision=11) == "u4pruydqqvj"
+    assert spatial.encode(6.2442, -75.5812).startswith("d3")
+
+
+def test_encode_missing_coordinate():
+    assert spatial.encode(None, -75.5) is None
+    assert spatial.encode(6.2, None) is None
+
+
+def test_nearby_points_share_prefix():
+    assert spatial.encode(6.24420, -75.58120)[:7] == spatial.encode(6.24421, -75.58121)[:7]
+
+
+def test_covering_cells_cover_the_box():
+    bbox = spatial.bbox_around(6.2442, -75.5812, 500)
+    cells = spatial.covering_cells(*bbox, max_cells=16)
+    assert 0 < len(cells) <= 16
+    # Cualquier punto del rectángulo cae en alguna celda
+    min_lat, min_lon, max_lat, max_lon = bbox
+    for latitude in (min_lat, (min_lat + max_lat) / 2, max_lat):
+        for longitude in (min_lon, (min_lon + max_lon) / 2, max_lon):
+            geohash = spatial.encode(latitude, longitude)
+            assert any(geohash.startswith(cell) for cell in cells)
+
+
+def test_cell_ranges_merge_consecutive_cells():
+    assert spatial.cell_ranges(["d3f", "d3g", "d3k", "d3h"]) == [("d3f", "d3h"), ("d3k", "d3k")]
+    assert spatial.cell_ranges(["zz"]) == [("zz", "zz")]
+
+
+def test_haversine_and_bbox_radius():
+    assert spatial.haversine_meters(6.2442, -75.5812, 6.2442, -75.5812) == 0
+    min_lat, min_lon, max_lat, max_lon = spatial.bbox_around(6.2442, -75.5812, 1000)
+    assert spatial.haversine_meters(6.2442, -75.5812, max_lat, -75.5812) == pytest.approx(1000, rel=0.01)
+    assert spatial.haversine_meters(6.2442, -75.5812, 6.2442, max_lon) == pytest.approx(1000, rel=0.01)
+
+
+def test_point_in_polygon():
+    square = [(0, 0), (0, 1), (1, 1), (1, 0)]
+    assert spatial.point_in_polygon(0.5, 0.5, square)
+    assert not spatial.point_in_polygon(1.5, 0.5, square)